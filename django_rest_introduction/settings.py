@@ -35,7 +35,8 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # 'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'newapp.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -49,8 +50,45 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_REFRESH_SERIALIZER': 'newapp.serializers.FilteredTokenRefreshSerializer',
 }
 
+# Фильтр Блума по черному списку refresh-токенов (newapp.tokens.BlacklistFilter)
+TOKEN_BLACKLIST_FILTER = {
+    'ENABLED': True,
+    'CAPACITY': 1000000,
+    'ERROR_RATE': 0.001,
+    'REFRESH_INTERVAL': 5,  # секунд; изменения других процессов видны сразу через поколение в общем кэше
+    'REBUILD_INTERVAL': 3600,
+    # Без общего кэша (CACHES) фильтр выключен. False - разрешить с LocMemCache, только для одного процесса
+    'REQUIRE_SHARED_CACHE': True,
+}
+
+# Очистка истекших OutstandingToken/BlacklistedToken (команда purge_tokens, задача purge_expired_tokens)
+TOKEN_PURGE = {
+    'CHUNK_SIZE': 5000,
+    'INTERVAL': 3600,
+}
+
+# Кэш проверенных JWT и пользователей (newapp.authentication)
+JWT_CACHE = {
+    'MAX_TOKENS': 10000,
+    'TOKEN_TIMEOUT': 300,  # не дольше ACCESS_TOKEN_LIFETIME
+    'MAX_USERS': 1000,
+    'USER_TIMEOUT': 30,
+}
+
+# Наборы прав пользователей (newapp.backends.CachedModelBackend)
+PERMISSION_CACHE = {
+    'MAX_USERS': 1000,
+    'TIMEOUT': 300,
+    # Без общего кэша (CACHES, ниже) изменения прав не видны другим процессам - кэш прав
+    # выключается. False - разрешить кэш в памяти процесса, только для одного процесса
+    'REQUIRE_SHARED_CACHE': True,
+}
+
+AUTHENTICATION_BACKENDS = ['newapp.backends.CachedModelBackend']
+
 
 # Application definition
 
@@ -67,9 +105,13 @@ INSTALLED_APPS = [
     'django_filters',
     'newapp.apps.NewappConfig',
     'rest_framework_simplejwt',
+    # OutstandingToken/BlacklistedToken: без приложения BLACKLIST_AFTER_ROTATION ничего не делает
+    'rest_framework_simplejwt.token_blacklist',
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы total в Server-Timing включал все остальные middleware
+    'newapp.middlewares.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -105,14 +147,114 @@ WSGI_APPLICATION = 'django_rest_introduction.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Профиль SQLite (переменная окружения SQLITE_PROFILE): 'default' - настройки Django
+# по умолчанию, режим журнала файла БД не меняется; 'tuned' - WAL, прагмы SQLITE_PRAGMAS
+# для каждого нового соединения (newapp.db.apply_sqlite_pragmas), постоянные соединения
+# и BEGIN IMMEDIATE в транзакциях, чтобы писатели ждали блокировку (busy_timeout),
+# а не получали "database is locked". WAL сохраняется в самом файле БД и создает рядом
+# файлы -wal/-shm, поэтому 'tuned' включается явно - на сервере с собственной БД
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+
+SQLITE_PROFILES = {
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {},
+        'PRAGMAS': {},
+    },
+    'tuned': {
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        'PRAGMAS': {
+            'journal_mode': 'wal',
+            'synchronous': 'normal',  # в режиме WAL безопасно: теряются только последние транзакции при сбое ОС
+            'busy_timeout': 5000,  # мс
+            'cache_size': -20000,  # отрицательное значение - в КиБ
+            'mmap_size': 134217728,
+            'temp_store': 'memory',
+        },
+    },
+}
+
+SQLITE_PRAGMAS = SQLITE_PROFILES[SQLITE_PROFILE]['PRAGMAS']
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': SQLITE_PROFILES[SQLITE_PROFILE]['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': dict(SQLITE_PROFILES[SQLITE_PROFILE]['OPTIONS']),
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379',
+#     }
+# }
+
+# Кэш статистики жанров: TIMEOUT - сколько секунд значение свежее,
+# STALE_TIMEOUT - сколько еще можно отдавать устаревшее значение во время пересчета
+STATISTIC_CACHE = {
+    'TIMEOUT': 60,
+    'STALE_TIMEOUT': 3600,
+    'BACKGROUND_REFRESH': True,
+}
+
+# Кэш ответов чтения (newapp.mixins.CachedResponseMixin)
+RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true',
+    'TIMEOUT': 300,
+    # Как и кэш прав: с кэшем в памяти процесса выключен. False - только для одного процесса
+    'REQUIRE_SHARED_CACHE': True,
+}
+
+# Метрики запросов по этапам (newapp.middlewares.RequestMetricsMiddleware)
+REQUEST_METRICS = {
+    'ENABLED': os.environ.get('REQUEST_METRICS_ENABLED', 'true').lower() == 'true',
+    'SERVER_TIMING': True,  # заголовок Server-Timing в ответах
+}
+
+# Заранее сгенерированная схема OpenAPI (newapp.schema, команда generate_schema).
+# Файлы в DIRECTORY пишет только generate_schema, представления их только читают.
+# AUTO_REGENERATE - для разработки: если изменились URLConf или сериализаторы,
+# строить схему заново в памяти процесса вместо устаревшего файла
+API_SCHEMA = {
+    'DIRECTORY': BASE_DIR / 'schema',
+    'MAX_AGE': 86400,
+    'AUTO_REGENERATE': False,
+}
+
+# Сколько дней мягко удаленные книги хранятся в таблице книг перед переносом
+# в архив командой purge_deleted_books
+SOFT_DELETE_RETENTION_DAYS = 30
+
+# Фоновая очередь newapp.tasks. Задачи хранятся в таблице OutboxMessage;
+# то, что не успел выполнить процесс, дорабатывает команда process_outbox.
+# EAGER - выполнять задачи сразу после коммита в том же потоке (для тестов)
+TASK_QUEUE = {
+    'WORKERS': 2,
+    'MAX_QUEUE_SIZE': 1000,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+    'DIGEST_WINDOW': 10,
+    'PROCESSING_TIMEOUT': 300,
+    'EAGER': False,
+    'RETENTION_DAYS': 7,  # выполненные задачи удаляет process_outbox; None - хранить все
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -154,9 +296,26 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Логи пишутся через очередь (QueueListenerHandler) в отдельном потоке, SQL-запросы
+# (только при DEBUG) сэмплируются: SQL_LOG_SAMPLE_RATE - доля сохраняемых запросов,
+# медленные запросы сохраняются всегда. В db.log записи в формате JSON
+SQL_LOG_SAMPLE_RATE = float(os.environ.get('SQL_LOG_SAMPLE_RATE', '0.05'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'sample_sql': {
+            '()': 'newapp.log.SamplingFilter',
+            'rate': SQL_LOG_SAMPLE_RATE,
+            'slow_query_seconds': 0.1,
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'newapp.log.JSONFormatter',
+        },
+    },
     'handlers': {
         'console': {
             'level': 'DEBUG',
@@ -166,12 +325,28 @@ LOGGING = {
             'level': 'DEBUG',
             'class': 'logging.FileHandler',
             'filename': os.path.join(BASE_DIR, 'db.log'),  # Путь к файлу логов
+            'formatter': 'json',
+            'delay': True,
+        },
+        'queue': {
+            '()': 'newapp.log.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
         },
     },
     'loggers': {
         'django.db.backends': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
+            'filters': ['sample_sql'],
+            'propagate': False,
+        },
+        # DDL миграций (DEBUG) не пишем
+        'django.db.backends.schema': {
+            'level': 'INFO',
+        },
+        'newapp': {
+            'handlers': ['queue'],
+            'level': 'INFO',
         },
     },
 }
@@ -17,10 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
-schema_view = get_schema_view(
+from newapp.schema import get_precomputed_schema_view
+
+# Спецификация генерируется заранее (manage.py generate_schema) и отдается с диска
+schema_view = get_precomputed_schema_view(
     openapi.Info(
         title="First API",
         default_version='v1',
@@ -29,7 +31,6 @@ schema_view = get_schema_view(
         contact=openapi.Contact(email="contact@local.com"),
         license=openapi.License(name="BSD License"),
     ),
-    public=True,
     permission_classes=[permissions.AllowAny],
 )
 
@@ -37,6 +38,6 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('newapp.urls')),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger/', schema_view.with_ui('swagger'), name='schema-swagger-ui'),
+    path('redoc/', schema_view.with_ui('redoc'), name='schema-redoc'),
 ]
@@ -0,0 +1,175 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .authentication import aauthenticate
+from .fast_serializers import get_row_builder
+from .instrumentation import timed
+from .models import Book, Genre
+from .pagination import AsyncPageNumberPagination, BookDateRangePagination, BookKeysetPagination
+from .permissions import CanGetStatisticPermission, IsWorkHour
+from .renderers import FastJSONRenderer
+from .serializers import BookSerializer, GenreSerializer
+from .views import DateRangeMixin
+
+# Права, которые не обращаются к БД: проверяются прямо в цикле событий
+NON_BLOCKING_PERMISSIONS = (AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly, IsWorkHour)
+
+
+class AsyncAPIView(View):
+    """
+    Async-представление только для чтения для ASGI: JWT-аутентификация (aauthenticate),
+    проверка прав без блокирующих вызовов и запросы через async ORM, поэтому
+    ожидание БД не занимает поток. Ответ совпадает с синхронным аналогом.
+
+    Права с методом ahas_permission / ahas_object_permission вызываются асинхронно,
+    из NON_BLOCKING_PERMISSIONS - напрямую, остальные - через sync_to_async.
+    """
+    http_method_names = ['get', 'head']
+    permission_classes = [IsAuthenticated]
+    renderer = FastJSONRenderer()
+    www_authenticate = 'Bearer realm="api"'
+
+    async def dispatch(self, request, *args, **kwargs):
+        # DRF Request нужен для query_params (пагинация, DateRangeMixin)
+        self.request = request = Request(request)
+        try:
+            await self.initial(request)
+            handler = getattr(self, request.method.lower(), None) \
+                if request.method.lower() in self.http_method_names else None
+            if handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            return self.render(await handler(request, *args, **kwargs))
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def initial(self, request):
+        with timed('auth'):
+            result = await aauthenticate(request._request)
+        request.user, request.auth = result if result is not None else (AnonymousUser(), None)
+        with timed('perm'):
+            for permission in self.get_permissions():
+                if not await self.call_permission(permission, 'has_permission', request):
+                    self.permission_denied(request, permission)
+
+    async def check_object_permissions(self, request, obj):
+        with timed('perm'):
+            for permission in self.get_permissions():
+                if not await self.call_permission(permission, 'has_object_permission', request, obj):
+                    self.permission_denied(request, permission)
+
+    async def call_permission(self, permission, name, request, *args):
+        async_check = getattr(permission, f'a{name}', None)
+        if async_check is not None:
+            return await async_check(request, self, *args)
+        check = getattr(permission, name)
+        if isinstance(permission, NON_BLOCKING_PERMISSIONS):
+            return check(request, self, *args)
+        return await sync_to_async(check)(request, self, *args)
+
+    def get_permissions(self):
+        return [permission() for permission in self.permission_classes]
+
+    def permission_denied(self, request, permission):
+        if not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        raise exceptions.PermissionDenied(getattr(permission, 'message', None), getattr(permission, 'code', None))
+
+    def handle_exception(self, exc):
+        response = exception_handler(exc, {'view': self, 'request': self.request})
+        headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            headers['WWW-Authenticate'] = self.www_authenticate
+        return self.render(response.data, response.status_code, headers)
+
+    def render(self, data, status=200, headers=None):
+        with timed('render'):
+            content = self.renderer.render(data)
+        return HttpResponse(content, status=status, headers=headers, content_type='application/json')
+
+
+class AsyncBookListView(AsyncAPIView):
+    """
+    Async-вариант списка BookViewSet (?fast=true): keyset-пагинация по published_date.
+    """
+    pagination_class = BookKeysetPagination
+
+    def get_queryset(self):
+        return Book.objects.all()
+
+    async def get(self, request, *args, **kwargs):
+        builder = get_row_builder(BookSerializer, ('genres',))
+        paginator = self.pagination_class()
+        rows = await paginator.apaginate_queryset(builder.values(self.get_queryset()), request)
+        return paginator.get_paginated_response(builder.build(rows)).data
+
+
+class AsyncBooksByDateView(DateRangeMixin, AsyncBookListView):
+    """
+    Async-вариант BooksByDateView (books/by-date/...): период с пагинацией.
+    """
+    pagination_class = BookDateRangePagination
+
+    def get_queryset(self):
+        return self.filter_date_range(super().get_queryset())
+
+    async def get(self, request, *args, **kwargs):
+        data = await super().get(request, *args, **kwargs)
+        start, end = self.get_date_range()
+        return {'from': start and start.isoformat(), 'to': end and end.isoformat(), **data}
+
+
+class AsyncBookDetailView(AsyncAPIView):
+    """
+    Async-вариант GET BookDetailUpdateDeleteView.
+    """
+    permission_classes = [IsWorkHour]
+
+    async def get(self, request, pk):
+        # Как EagerLoadingViewMixin: genres нужны сериализатору, загружаем их заранее
+        book = await BookSerializer.setup_eager_loading(Book.objects.filter(pk=pk)).afirst()
+        if book is None:
+            raise exceptions.NotFound('No Book matches the given query.')
+        await self.check_object_permissions(request, book)
+
+        data = BookSerializer(book).data
+        if data.get('discounted_price') is not None and data.get('price') is not None:
+            data['is_discounted'] = data['discounted_price'] < data['price']
+        else:
+            data['is_discounted'] = False
+        return data
+
+
+class AsyncGenreListView(AsyncAPIView):
+    """
+    Async-вариант списка GenreViewSet: та же постраничная пагинация, страница выбирается в БД.
+    """
+    permission_classes = [IsAuthenticated, CanGetStatisticPermission]
+    pagination_class = AsyncPageNumberPagination
+
+    async def get(self, request, *args, **kwargs):
+        builder = get_row_builder(GenreSerializer)
+        paginator = self.pagination_class()
+        rows = await paginator.apaginate_queryset(builder.values(Genre.objects.order_by('pk')), request)
+        return paginator.get_paginated_response(builder.build(rows)).data
+
+
+class AsyncGenreDetailView(AsyncAPIView):
+    permission_classes = [IsAuthenticated, CanGetStatisticPermission]
+
+    async def get(self, request, pk):
+        builder = get_row_builder(GenreSerializer)
+        row = await builder.values(Genre.objects.filter(pk=pk)).afirst()
+        if row is None:
+            raise exceptions.NotFound('No Genre matches the given query.')
+        return builder.build_row(row)
+
+
+class AsyncProtectedDataView(AsyncAPIView):
+    async def get(self, request):
+        return {"message": "Hello, authenticated user!", "user": request.user.username}
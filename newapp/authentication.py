@@ -0,0 +1,212 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_generations, is_shared_cache
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш ограниченного размера со сроком жизни записей.
+    """
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self.data[key]
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expires_at=None):
+        expires_at = time.time() + self.timeout if expires_at is None else min(expires_at, time.time() + self.timeout)
+        with self.lock:
+            self.data[key] = (value, expires_at)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        return {'size': len(self.data), 'hits': self.hits, 'misses': self.misses}
+
+
+_options = getattr(settings, 'JWT_CACHE', {})
+# Проверенные access-токены: ключ - sha256 строки токена, запись живет не дольше exp токена
+token_cache = TTLCache(_options.get('MAX_TOKENS', 10000), _options.get('TOKEN_TIMEOUT', 300))
+# Пользователи по id, чтобы не ходить в БД на каждый запрос: запись - (поколение, пользователь)
+user_cache = TTLCache(_options.get('MAX_USERS', 1000), _options.get('USER_TIMEOUT', 30))
+# Поколения пользователей видны другим процессам только через общий кэш: без него
+# деактивация или смена пароля в одном процессе не сбросили бы user_cache в других
+SHARED_USER_CACHE = is_shared_cache()
+
+decode_stats = {'decodes': 0, 'requests': 0}
+
+
+def _token_key(raw_token):
+    if isinstance(raw_token, str):
+        raw_token = raw_token.encode()
+    return hashlib.sha256(raw_token).hexdigest()
+
+
+def count_decode(request):
+    decode_stats['decodes'] += 1
+    if request is not None:
+        request._jwt_decodes = getattr(request, '_jwt_decodes', 0) + 1
+
+
+def get_validated_access_token(raw_token, request=None):
+    """
+    Возвращает проверенный AccessToken, декодируя строку только при промахе кэша.
+    Бросает TokenError, если токен недействителен или истек.
+    """
+    key = _token_key(raw_token)
+    token = token_cache.get(key)
+    if token is None:
+        token = AccessToken(raw_token)
+        count_decode(request)
+        remember_access_token(token, key)
+    return token
+
+
+def remember_access_token(token, key=None):
+    """
+    Кладет в кэш только что выпущенный или проверенный токен.
+    """
+    token_cache.set(key or _token_key(str(token)), token, expires_at=token['exp'])
+
+
+def user_generation(user_id):
+    # Поколение пользователя: увеличивается сигналами после коммита изменения пользователя,
+    # его прав и групп (см. signals.py); им помечены user_cache и backends.PermissionCache
+    return f'permissions:user:{user_id}'
+
+
+def forget_user(user):
+    # В токене id пользователя хранится строкой
+    user_cache.delete(str(getattr(user, jwt_settings.USER_ID_FIELD)))
+
+
+def get_cached_user(user_id):
+    """
+    (поколение, пользователь из user_cache или None). Запись другого поколения -
+    пользователь изменился (в любом процессе), его нужно загрузить заново.
+    """
+    if not SHARED_USER_CACHE:
+        return None, None
+    generation, = get_generations([user_generation(user_id)])
+    entry = user_cache.get(str(user_id))
+    if entry is not None and entry[0] == generation:
+        return generation, entry[1]
+    return generation, None
+
+
+def remember_user(user_id, generation, user):
+    if SHARED_USER_CACHE:
+        user_cache.set(str(user_id), (generation, user))
+
+
+def check_user(user, validated_token):
+    # Те же проверки, что JWTAuthentication.get_user делает при загрузке, - и для пользователя из кэша
+    if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if jwt_settings.CHECK_REVOKE_TOKEN and \
+            validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+        raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, который использует общий с JWTAuthenticationMiddleware
+    кэш проверенных токенов и кэш пользователей.
+    """
+    def authenticate(self, request):
+        self.request = request._request
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        try:
+            return get_validated_access_token(raw_token, getattr(self, 'request', None))
+        except TokenError as e:
+            raise InvalidToken({
+                'detail': 'Given token not valid for any token type',
+                'messages': [{
+                    'token_class': AccessToken.__name__,
+                    'token_type': AccessToken.token_type,
+                    'message': e.args[0],
+                }],
+            })
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+        generation, user = get_cached_user(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            remember_user(user_id, generation, user)
+        else:
+            check_user(user, validated_token)
+        # Копия, чтобы изменения в одном запросе не попадали в другие
+        return copy.copy(user)
+
+
+async def aauthenticate(request):
+    """
+    Асинхронный аналог CachedJWTAuthentication.authenticate для async-представлений:
+    (user, token) или None без заголовка Authorization. Проверка токена не обращается
+    к БД, пользователь при промахе кэша загружается через async ORM.
+    """
+    authentication = CachedJWTAuthentication()
+    authentication.request = request
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+
+    user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+    if user_id is None:
+        raise InvalidToken('Token contained no recognizable user identification')
+    generation, user = get_cached_user(user_id)
+    if user is None:
+        user_model = get_user_model()
+        try:
+            user = await user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+        except user_model.DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        check_user(user, validated_token)
+        remember_user(user_id, generation, user)
+    else:
+        check_user(user, validated_token)
+    return copy.copy(user), validated_token
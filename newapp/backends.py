@@ -0,0 +1,98 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core import checks
+from django.core.cache import cache
+
+from .authentication import TTLCache, user_generation
+from .cache import get_generations, is_shared_cache, registry
+
+# Поколение прав всех пользователей: меняется при изменении групп и Permission
+GLOBAL_GENERATION = 'permissions'
+
+
+class PermissionCache:
+    """
+    Наборы прав пользователей ('app_label.codename'). Запись помечена поколениями
+    GLOBAL_GENERATION и user_generation(id) из кэша Django (их увеличивают сигналы
+    после коммита, см. signals.py), поэтому устаревший набор не используется.
+
+    Два уровня: набор в памяти процесса и он же в кэше Django, общем для процессов;
+    при промахе обоих права загружаются из БД один раз.
+
+    Поколения должны быть видны всем процессам, поэтому нужен общий кэш (Redis, Memcached).
+    С кэшем в памяти процесса (LocMemCache) изменение прав в одном процессе не сбросило бы
+    наборы в других - тогда права загружаются из БД на каждый запрос, если только
+    require_shared=False (один процесс: runserver, тесты).
+    """
+    def __init__(self, max_size, timeout, require_shared=True):
+        self.timeout = timeout
+        self.local = TTLCache(max_size, timeout)
+        self.loads = 0
+        self.enabled = is_shared_cache() or not require_shared
+        registry['permissions'] = self
+
+    def get(self, user_id, load):
+        if not self.enabled:
+            self.loads += 1
+            return frozenset(load())
+
+        generations = tuple(get_generations([GLOBAL_GENERATION, user_generation(user_id)]))
+        entry = self.local.get(user_id)
+        if entry is not None and entry[0] == generations:
+            return entry[1]
+
+        key = f'newapp:permissions:{user_id}:{generations[0]}:{generations[1]}'
+        perms = cache.get(key)
+        if perms is None:
+            self.loads += 1
+            perms = frozenset(load())
+            cache.set(key, perms, timeout=self.timeout)
+        self.local.set(user_id, (generations, perms))
+        return perms
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        return {**self.local.stats(), 'loads': self.loads, 'enabled': self.enabled}
+
+
+_options = getattr(settings, 'PERMISSION_CACHE', {})
+permission_cache = PermissionCache(
+    _options.get('MAX_USERS', 1000), _options.get('TIMEOUT', 300), _options.get('REQUIRE_SHARED_CACHE', True),
+)
+
+
+# Только в check --deploy: без общего кэша кэш прав выключен, а не ошибочен, и предупреждение
+# при каждом manage.py (runserver, тесты с LocMemCache) было бы шумом
+@checks.register(checks.Tags.caches, deploy=True)
+def check_permission_cache(app_configs, **kwargs):
+    if permission_cache.enabled:
+        return []
+    return [checks.Warning(
+        'Permission cache is disabled: the default cache is local to the process.',
+        hint="Configure a shared cache backend in CACHES or set PERMISSION_CACHE['REQUIRE_SHARED_CACHE'] "
+             "to False for a single-process deployment.",
+        id='newapp.W001',
+    )]
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend, у которого набор прав пользователя берется из permission_cache:
+    has_perm - проверка в множестве без запросов к user_permissions, groups и Permission.
+    """
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = permission_cache.get(
+                user_obj.pk, lambda: super(CachedModelBackend, self).get_all_permissions(user_obj)
+            )
+        return user_obj._perm_cache
+
+    async def aget_all_permissions(self, user_obj, obj=None):
+        if hasattr(user_obj, '_perm_cache') and obj is None:
+            return self.get_all_permissions(user_obj)
+        return await sync_to_async(self.get_all_permissions)(user_obj, obj)
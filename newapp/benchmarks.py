@@ -0,0 +1,109 @@
+import datetime
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .models import Book, Genre, Publisher
+
+
+@contextmanager
+def benchmark_database(verbosity=0, name=None):
+    """
+    Создает отдельную тестовую БД на время замера, рабочая БД не затрагивается.
+    name - файл БД (для SQLite по умолчанию БД в памяти).
+    """
+    setup_test_environment(debug=False)
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings.get('NAME')
+    if name is not None:
+        test_settings['NAME'] = name
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        test_settings['NAME'] = old_test_name
+        teardown_test_environment()
+
+
+def seed_books(count, genres=10, publishers=10, users=10, batch_size=5000, seed=0, words=None):
+    """
+    Быстро наполняет БД книгами через bulk_create (сигналы не вызываются).
+    words - словарь для названий из трех случайных слов (по умолчанию 'Book N').
+    """
+    rnd = random.Random(seed)
+    genre_objs = Genre.objects.bulk_create(
+        [Genre(name=f'Genre {i}') for i in range(genres)]
+    )
+    publisher_objs = Publisher.objects.bulk_create([
+        Publisher(name=f'Publisher {i}', slug=f'publisher-{i}', established_date=datetime.date(1990, 1, 1))
+        for i in range(publishers)
+    ])
+    user_objs = User.objects.bulk_create([User(username=f'bench-user-{i}') for i in range(users)])
+
+    start_date = datetime.date(1970, 1, 1)
+    through = Book.genres.through
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        books = Book.objects.bulk_create([
+            Book(
+                title=' '.join(rnd.sample(words, 3)) if words else f'Book {created + i}',
+                author=f'Author {rnd.randrange(1000)}',
+                published_date=start_date + datetime.timedelta(days=rnd.randrange(20000)),
+                publisher=rnd.choice(publisher_objs),
+                price=Decimal(rnd.randrange(100, 10000)) / 100,
+                discounted_price=None if rnd.random() < 0.5 else Decimal(rnd.randrange(50, 100)),
+                is_bestseller=rnd.random() < 0.1,
+                owner=rnd.choice(user_objs),
+            )
+            for i in range(size)
+        ])
+        through.objects.bulk_create([
+            through(book_id=book.pk, genre_id=genre.pk)
+            for book in books
+            for genre in rnd.sample(genre_objs, min(2, len(genre_objs)))
+        ])
+        created += size
+    return user_objs
+
+
+def measure(func, repeat=3):
+    """
+    Возвращает лучшее время выполнения func() в секундах.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def summarize(samples, elapsed=None):
+    """
+    Перцентили задержки (мс) по списку длительностей запросов в секундах
+    и пропускная способность (запросов в секунду) за общее время elapsed.
+    """
+    samples = sorted(samples)
+    if len(samples) > 1:
+        cuts = statistics.quantiles(samples, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = samples[0]
+    elapsed = sum(samples) if elapsed is None else elapsed
+    return {
+        'requests': len(samples),
+        'p50_ms': round(p50 * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3),
+        'rps': round(len(samples) / elapsed, 1) if elapsed else None,
+    }
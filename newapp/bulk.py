@@ -0,0 +1,225 @@
+import logging
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+from .models import Book
+from .serializers import BookBulkSerializer
+from .signals import books_bulk_created, books_bulk_deleted, books_bulk_updated
+
+logger = logging.getLogger(__name__)
+
+
+def preload_related(serializer, items):
+    """
+    Загружает одним запросом на связь все объекты, на которые ссылаются items.
+    Результат - {модель: {pk: объект}} для context['preloaded'].
+    """
+    preloaded = {}
+    for name, field in serializer.fields.items():
+        many = isinstance(field, ManyRelatedField)
+        relation = field.child_relation if many else field
+        if field.read_only or not isinstance(relation, PrimaryKeyRelatedField):
+            continue
+        queryset = relation.get_queryset()
+        pks = set()
+        for item in items:
+            value = item.get(name) if isinstance(item, dict) else None
+            for pk in (value if many and isinstance(value, list) else [value]):
+                if isinstance(pk, bool) or not isinstance(pk, (str, int)):
+                    continue
+                try:
+                    pks.add(queryset.model._meta.pk.to_python(pk))
+                except DjangoValidationError:
+                    pass
+        preloaded.setdefault(queryset.model, {}).update(queryset.in_bulk(pks))
+    return preloaded
+
+
+def validate_items(items, context, instances=None):
+    """
+    Проверяет каждый элемент отдельно. Возвращает ([(индекс, сериализатор), ...], [ошибка, ...]).
+    """
+    context = dict(context, preloaded=preload_related(BookBulkSerializer(context=context), items))
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        instance = None
+        if instances is not None:
+            instance = instances.get(index)
+            if instance is None:
+                continue
+        serializer = BookBulkSerializer(instance, data=item, partial=instance is not None, context=context)
+        if serializer.is_valid():
+            valid.append((index, serializer))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+    return valid, errors
+
+
+def match_books(queryset, items, get_id):
+    """
+    Находит книги для элементов запроса одним запросом.
+    Возвращает ({индекс: книга}, [ошибка, ...]).
+    """
+    pks, errors, seen = {}, [], set()
+    for index, item in enumerate(items):
+        value = get_id(item)
+        if value is None:
+            errors.append({'index': index, 'errors': {'id': ['This field is required.']}})
+            continue
+        try:
+            pk = Book._meta.pk.to_python(value)
+        except DjangoValidationError:
+            errors.append({'index': index, 'errors': {'id': ['A valid integer is required.']}})
+            continue
+        if pk in seen:
+            errors.append({'index': index, 'errors': {'id': ['Duplicate id.']}})
+            continue
+        seen.add(pk)
+        pks[index] = pk
+
+    found = queryset.prefetch_related(None).in_bulk(pks.values())
+    books = {}
+    for index, pk in pks.items():
+        if pk in found:
+            books[index] = found[pk]
+        else:
+            errors.append({'index': index, 'errors': {'id': ['Not found.']}})
+    return books, errors
+
+
+def load_genre_ids(book_ids):
+    genre_ids = defaultdict(list)
+    rows = Book.genres.through.objects.filter(book_id__in=book_ids).values_list('book_id', 'genre_id')
+    for book_id, genre_id in rows:
+        genre_ids[book_id].append(genre_id)
+    return genre_ids
+
+
+def set_genres(book_genres, batch_size):
+    """
+    Заменяет жанры книг двумя запросами: {book_id: [genre_id, ...]}.
+    """
+    through = Book.genres.through
+    through.objects.filter(book_id__in=list(book_genres)).delete()
+    through.objects.bulk_create([
+        through(book_id=book_id, genre_id=genre_id)
+        for book_id, genre_ids in book_genres.items()
+        for genre_id in genre_ids
+    ], batch_size=batch_size)
+
+
+def lock_books(queryset):
+    # of=('self',): select_related по nullable-связям не дает заблокировать строки в PostgreSQL;
+    # SQLite FOR UPDATE не поддерживает и сериализует запись сам
+    return queryset.select_for_update(of=('self',))
+
+
+def sorted_errors(errors):
+    return sorted(errors, key=lambda error: error['index'])
+
+
+def bulk_create_books(items, context, owner=None, batch_size=500, atomic=False):
+    """
+    Создает книги пачками в одной транзакции. Возвращает (созданные книги, ошибки по элементам).
+    При atomic=True и хотя бы одной ошибке ничего не сохраняется.
+    """
+    valid, errors = validate_items(items, context)
+    if not valid or (errors and atomic):
+        return [], sorted_errors(errors)
+
+    # То же, что делает update_timestamp в pre_save, но один раз для всей пачки
+    now = timezone.now()
+    books, genres = [], []
+    for index, serializer in valid:
+        data = dict(serializer.validated_data)
+        genres.append(list(dict.fromkeys(genre.pk for genre in data.pop('genres', []))))
+        books.append(Book(owner=owner, updated_at=now, **data))
+
+    with transaction.atomic():
+        Book.objects.bulk_create(books, batch_size=batch_size)
+        genre_ids = {book.pk: book_genre_ids for book, book_genre_ids in zip(books, genres)}
+        set_genres(genre_ids, batch_size)
+        books_bulk_created.send(sender=Book, books=books, genre_ids=genre_ids)
+    for book in books:
+        book.refresh_loaded_values()
+
+    logger.info('Bulk created %d books', len(books), extra={'errors': len(errors)})
+    return books, sorted_errors(errors)
+
+
+def bulk_update_books(queryset, items, context, batch_size=500, atomic=False):
+    """
+    Частично обновляет книги (у каждого элемента есть id) через bulk_update в одной транзакции.
+    Возвращает (обновленные книги, ошибки по элементам).
+    """
+    with transaction.atomic():
+        # Книги читаются и проверяются под блокировкой: иначе параллельная запись между чтением
+        # и bulk_update потеряется, а счетчики посчитаются от устаревших _loaded_values
+        instances, errors = match_books(
+            lock_books(queryset), items, lambda item: item.get('id') if isinstance(item, dict) else None,
+        )
+        valid, validation_errors = validate_items(items, context, instances)
+        errors += validation_errors
+        if not valid or (errors and atomic):
+            return [], sorted_errors(errors)
+
+        now = timezone.now()
+        books = [serializer.instance for index, serializer in valid]
+        old_genre_ids = load_genre_ids([book.pk for book in books])
+        genre_ids = dict(old_genre_ids)
+        changed_genres = {}
+        # Каждая книга пишется только теми полями, которые пришли в ее элементе:
+        # bulk_update по объединению полей перезаписал бы остальные поля значениями из памяти
+        groups = defaultdict(list)
+        for index, serializer in valid:
+            book, data = serializer.instance, dict(serializer.validated_data)
+            if 'genres' in data:
+                changed_genres[book.pk] = list(dict.fromkeys(genre.pk for genre in data.pop('genres')))
+            for attr, value in data.items():
+                setattr(book, attr, value)
+            book.updated_at = now
+            groups[frozenset(data) | {'updated_at'}].append(book)
+        genre_ids.update(changed_genres)
+
+        for group_fields, group_books in groups.items():
+            Book.objects.bulk_update(group_books, sorted(group_fields), batch_size=batch_size)
+        if changed_genres:
+            set_genres(changed_genres, batch_size)
+        books_bulk_updated.send(
+            sender=Book, books=books, fields=set().union(*groups), old_genre_ids=old_genre_ids, genre_ids=genre_ids,
+        )
+    for book in books:
+        book.refresh_loaded_values()
+
+    logger.info('Bulk updated %d books', len(books), extra={'errors': len(errors)})
+    return books, sorted_errors(errors)
+
+
+def bulk_delete_books(queryset, ids, batch_size=500, atomic=False):
+    """
+    Мягко удаляет книги по списку id. Возвращает (удаленные книги, ошибки по элементам).
+    """
+    with transaction.atomic():
+        instances, errors = match_books(lock_books(queryset), ids, lambda value: value)
+        if not instances or (errors and atomic):
+            return [], sorted_errors(errors)
+
+        now = timezone.now()
+        books = list(instances.values())
+        for book in books:
+            book.is_deleted = True
+            book.deleted_at = now
+            book.updated_at = now
+        genre_ids = load_genre_ids([book.pk for book in books])
+
+        Book.objects.bulk_update(books, ['is_deleted', 'deleted_at', 'updated_at'], batch_size=batch_size)
+        books_bulk_deleted.send(sender=Book, books=books, old_genre_ids=genre_ids, genre_ids=genre_ids)
+    for book in books:
+        book.refresh_loaded_values()
+
+    logger.info('Bulk deleted %d books', len(books), extra={'errors': len(errors)})
+    return books, sorted_errors(errors)
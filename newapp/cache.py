@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def increment(key, delta=1):
+    """
+    Атомарный счетчик в кэше (cache.incr падает, если ключа еще нет).
+    """
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+def bump_generation(*names):
+    """
+    Новое поколение данных (например, 'book'): ключи ответов со старым поколением
+    больше не используются, сами записи истекают по таймауту. Возвращает новые поколения.
+    """
+    return [increment(f'newapp:generation:{name}') for name in names]
+
+
+def is_shared_cache(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Общий ли кэш для процессов. LocMemCache живет в памяти процесса, DummyCache ничего
+    не хранит: поколения, увеличенные в одном процессе, другие процессы в них не увидят.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def get_generations(names):
+    keys = [f'newapp:generation:{name}' for name in names]
+    values = cache.get_many(keys)
+    return [values.get(key, 0) for key in keys]
+
+
+class ResponseCache:
+    """
+    Отрендеренные ответы одного представления в кэше Django (см. mixins.CachedResponseMixin).
+    В ключ входят поколения dependencies, поэтому инвалидация - это bump_generation.
+    """
+    def __init__(self, name, dependencies, timeout=None):
+        options = getattr(settings, 'RESPONSE_CACHE', {})
+        self.name = name
+        self.dependencies = tuple(dependencies)
+        # Поколения в кэше процесса другие процессы не видят: они отдавали бы ответы до изменения
+        self.enabled = options.get('ENABLED', True) and (is_shared_cache() or not options.get('REQUIRE_SHARED_CACHE', True))
+        self.timeout = options.get('TIMEOUT', 300) if timeout is None else timeout
+        self.key = f'newapp:response:{name}'
+        registry[f'response:{name}'] = self
+
+    def make_key(self, *parts):
+        version = ':'.join(str(part) for part in (*parts, *get_generations(self.dependencies)))
+        return f'{self.key}:{hashlib.md5(version.encode()).hexdigest()}'
+
+    def get(self, key):
+        entry = cache.get(key)
+        increment(f'{self.key}:{"misses" if entry is None else "hits"}')
+        return entry
+
+    def set(self, key, entry):
+        cache.set(key, entry, timeout=self.timeout)
+
+    def stats(self):
+        counters = cache.get_many([f'{self.key}:hits', f'{self.key}:misses'])
+        hits, misses = counters.get(f'{self.key}:hits', 0), counters.get(f'{self.key}:misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+
+class StaleWhileRevalidateCache:
+    """
+    Значение в кэше Django с мягким сроком жизни.
+
+    Пока значение свежее - отдается из кэша. Устаревшее (по времени или после
+    invalidate()) значение отдается сразу, а пересчет выполняет один процесс
+    в фоновом потоке. Пересчет в запросе происходит только при пустом кэше.
+    """
+    def __init__(self, name, compute, timeout=None, stale_timeout=None, background=None):
+        options = getattr(settings, 'STATISTIC_CACHE', {})
+        self.name = name
+        self.compute = compute
+        self.timeout = options.get('TIMEOUT', 60) if timeout is None else timeout
+        self.stale_timeout = options.get('STALE_TIMEOUT', 3600) if stale_timeout is None else stale_timeout
+        self.background = options.get('BACKGROUND_REFRESH', True) if background is None else background
+        self.key = f'newapp:{name}'
+        registry[name] = self
+
+    def get(self):
+        entry = cache.get(self.key)
+        version = cache.get(f'{self.key}:version', 0)
+
+        if entry is None:
+            increment(f'{self.key}:misses')
+            return self.refresh()
+
+        if entry['version'] == version and entry['fresh_until'] > time.time():
+            increment(f'{self.key}:hits')
+            return entry['value']
+
+        increment(f'{self.key}:stale')
+        # Пересчитывает только тот, кто первым взял блокировку
+        if cache.add(f'{self.key}:lock', 1, timeout=30):
+            if self.background:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            else:
+                return self.refresh()
+        return entry['value']
+
+    def refresh(self):
+        version = cache.get(f'{self.key}:version', 0)
+        value = self.compute()
+        cache.set(self.key, {
+            'value': value,
+            'version': version,
+            'fresh_until': time.time() + self.timeout,
+        }, timeout=self.timeout + self.stale_timeout)
+        cache.delete(f'{self.key}:lock')
+        return value
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception('Failed to refresh cached %s', self.name)
+            cache.delete(f'{self.key}:lock')
+        finally:
+            connection.close()
+
+    def invalidate(self):
+        # Значение не удаляется: до пересчета отдается устаревшая версия
+        increment(f'{self.key}:version')
+
+    def stats(self):
+        counters = cache.get_many([f'{self.key}:{name}' for name in ('hits', 'misses', 'stale')])
+        hits, misses, stale = (counters.get(f'{self.key}:{name}', 0) for name in ('hits', 'misses', 'stale'))
+        total = hits + misses + stale
+        return {
+            'hits': hits,
+            'misses': misses,
+            'stale': stale,
+            'hit_ratio': round((hits + stale) / total, 4) if total else None,
+        }
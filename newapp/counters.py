@@ -0,0 +1,210 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, QuerySet, Sum
+from django.utils import timezone
+
+from .models import Book, CatalogPriceStats, Genre
+
+
+def book_contribution(is_deleted, is_bestseller):
+    """
+    Вклад одной книги в счетчики каждого ее жанра: (book_count, bestseller_count).
+    """
+    if is_deleted:
+        return 0, 0
+    return 1, int(bool(is_bestseller))
+
+
+def adjust_genres(genres, book_delta, bestseller_delta):
+    """
+    Сдвигает счетчики жанров одним UPDATE с F-выражениями (без гонок между запросами).
+    genres - queryset жанров или список id.
+    """
+    if not book_delta and not bestseller_delta:
+        return
+    if not isinstance(genres, QuerySet):
+        genres = Genre.objects.filter(pk__in=list(genres))
+    genres.update(
+        book_count=F('book_count') + book_delta,
+        bestseller_count=F('bestseller_count') + bestseller_delta,
+    )
+
+
+def apply_book_change(book, created):
+    """
+    Пересчитывает счетчики жанров книги по разнице между состоянием из БД и новым.
+    При создании у книги еще нет жанров - они добавляются через m2m_changed.
+    """
+    if created:
+        return
+    old = getattr(book, '_loaded_values', None)
+    if old is None or 'is_deleted' not in old or 'is_bestseller' not in old:
+        # Состояние неизвестно (объект создан вручную) - безопаснее пересчитать жанры книги
+        rebuild_genre_counters(Genre.objects.filter(books=book.pk))
+        return
+
+    old_books, old_bestsellers = book_contribution(old['is_deleted'], old['is_bestseller'])
+    new_books, new_bestsellers = book_contribution(book.is_deleted, book.is_bestseller)
+    adjust_genres(Genre.objects.filter(books=book.pk), new_books - old_books, new_bestsellers - old_bestsellers)
+
+
+def apply_genres_change(book_states, genre_ids, sign):
+    """
+    Книги с состояниями book_states [(is_deleted, is_bestseller), ...] добавлены (sign=1)
+    в жанры genre_ids или удалены из них (sign=-1).
+    """
+    book_delta = bestseller_delta = 0
+    for is_deleted, is_bestseller in book_states:
+        books_count, bestsellers_count = book_contribution(is_deleted, is_bestseller)
+        book_delta += books_count
+        bestseller_delta += bestsellers_count
+    adjust_genres(genre_ids, sign * book_delta, sign * bestseller_delta)
+
+
+def book_state(values):
+    """
+    Состояние книги для счетчиков по словарю значений полей (None, если книги не было).
+    """
+    if values is None:
+        return None
+    return values['is_deleted'], values['is_bestseller'], values['price']
+
+
+def apply_bulk_genre_changes(changes):
+    """
+    Счетчики жанров для массовой операции.
+    changes - [(старое состояние, старые жанры, новое состояние, новые жанры), ...],
+    состояние - результат book_state. Один UPDATE на каждую различную пару приращений.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for old_state, old_genre_ids, new_state, new_genre_ids in changes:
+        for state, genre_ids, sign in ((old_state, old_genre_ids, -1), (new_state, new_genre_ids, 1)):
+            if state is None:
+                continue
+            books_count, bestsellers_count = book_contribution(state[0], state[1])
+            for genre_id in genre_ids:
+                deltas[genre_id][0] += sign * books_count
+                deltas[genre_id][1] += sign * bestsellers_count
+
+    adjust_genres_by_delta(deltas)
+
+
+def adjust_genres_by_delta(deltas):
+    """
+    deltas - {genre_id: (book_delta, bestseller_delta)}; жанры с одинаковыми приращениями
+    обновляются одним UPDATE.
+    """
+    grouped = defaultdict(list)
+    for genre_id, (book_delta, bestseller_delta) in deltas.items():
+        grouped[book_delta, bestseller_delta].append(genre_id)
+    for (book_delta, bestseller_delta), genre_ids in grouped.items():
+        adjust_genres(genre_ids, book_delta, bestseller_delta)
+
+
+def apply_soft_delete(books):
+    """
+    Убирает из счетчиков жанров и статистики цен неудаленные книги queryset books
+    перед тем, как SoftDeleteQuerySet.delete() пометит их удаленными. Объекты не загружаются.
+    """
+    live = books.filter(is_deleted=False)
+    rows = Book.genres.through.objects.filter(book__in=live).values('genre_id').annotate(
+        books=Count('id'),
+        bestsellers=Count('id', filter=Q(book__is_bestseller=True)),
+    ).order_by()
+    adjust_genres_by_delta({row['genre_id']: (-row['books'], -row['bestsellers']) for row in rows})
+    totals = live.aggregate(price_sum=Sum('price'), priced_count=Count('price'))
+    adjust_price_stats(-(totals['price_sum'] or 0), -totals['priced_count'])
+
+
+def count_genre_books(genres):
+    return genres.annotate(
+        live_books=Count('books', filter=Q(books__is_deleted=False)),
+        live_bestsellers=Count('books', filter=Q(books__is_deleted=False, books__is_bestseller=True)),
+    )
+
+
+@transaction.atomic
+def rebuild_genre_counters(genres=None, check_only=False, batch_size=1000):
+    """
+    Пересчитывает счетчики заново одним агрегирующим запросом.
+    Возвращает список расхождений (genre_id, сохранено, фактически).
+    """
+    # Фильтр по книгам нельзя совмещать с Count('books') в одном запросе - ограничиваем через pk
+    genres = Genre.objects.all() if genres is None else Genre.objects.filter(pk__in=genres.values('pk'))
+    drift = []
+    changed = []
+    for genre in count_genre_books(genres).order_by('id'):
+        stored = (genre.book_count, genre.bestseller_count)
+        actual = (genre.live_books, genre.live_bestsellers)
+        if stored != actual:
+            drift.append((genre.pk, stored, actual))
+            genre.book_count, genre.bestseller_count = actual
+            changed.append(genre)
+    if changed and not check_only:
+        Genre.objects.bulk_update(changed, ['book_count', 'bestseller_count'], batch_size=batch_size)
+    return drift
+
+
+def price_contribution(is_deleted, price):
+    """
+    Вклад книги в статистику цен каталога: (сумма, количество).
+    """
+    if is_deleted or price is None:
+        return 0, 0
+    return price, 1
+
+
+def adjust_price_stats(sum_delta, count_delta):
+    if not sum_delta and not count_delta:
+        return
+    updated = CatalogPriceStats.objects.filter(pk=1).update(
+        price_sum=F('price_sum') + sum_delta,
+        priced_count=F('priced_count') + count_delta,
+    )
+    if not updated:
+        # Строки еще нет - сразу считаем точные значения
+        reconcile_price_stats()
+
+
+def apply_price_change(book, created):
+    old = getattr(book, '_loaded_values', None)
+    if created:
+        old_sum, old_count = 0, 0
+    elif old is None or 'is_deleted' not in old or 'price' not in old:
+        reconcile_price_stats()
+        return
+    else:
+        old_sum, old_count = price_contribution(old['is_deleted'], old['price'])
+    new_sum, new_count = price_contribution(book.is_deleted, book.price)
+    adjust_price_stats(new_sum - old_sum, new_count - old_count)
+
+
+def apply_bulk_price_changes(changes):
+    """
+    Статистика цен для массовой операции: changes - [(старое состояние, новое состояние), ...].
+    """
+    sum_delta = count_delta = 0
+    for old_state, new_state in changes:
+        for state, sign in ((old_state, -1), (new_state, 1)):
+            if state is not None:
+                price_sum, priced_count = price_contribution(state[0], state[2])
+                sum_delta += sign * price_sum
+                count_delta += sign * priced_count
+    adjust_price_stats(sum_delta, count_delta)
+
+
+@transaction.atomic
+def reconcile_price_stats():
+    """
+    Пересчитывает сумму и количество цен по таблице книг.
+    Возвращает (сохраненные, фактические) значения (price_sum, priced_count).
+    """
+    stats = CatalogPriceStats.objects.select_for_update().get_or_create(pk=1)[0]
+    totals = Book.objects.aggregate(price_sum=Sum('price'), priced_count=Count('price'))
+    stored = (stats.price_sum, stats.priced_count)
+    actual = (totals['price_sum'] or 0, totals['priced_count'])
+    stats.price_sum, stats.priced_count = actual
+    stats.reconciled_at = timezone.now()
+    stats.save()
+    return stored, actual
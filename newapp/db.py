@@ -0,0 +1,42 @@
+import logging
+
+from django.conf import settings
+from django.db import connections, router
+
+logger = logging.getLogger(__name__)
+
+
+def apply_sqlite_pragmas(connection, pragmas=None):
+    """
+    Выполняет PRAGMA из settings.SQLITE_PRAGMAS для нового соединения с SQLite.
+    journal_mode=wal сохраняется в файле БД, остальные прагмы действуют только
+    на соединение, поэтому выполняются каждый раз (с CONN_MAX_AGE - редко).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {}) if pragmas is None else pragmas
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if 'journal_mode' in pragmas:
+            # Для БД в памяти режим WAL недоступен - SQLite молча оставляет 'memory'
+            cursor.execute('PRAGMA journal_mode')
+            mode = cursor.fetchone()[0]
+            if mode != str(pragmas['journal_mode']).lower() and not connection.is_in_memory_db():
+                logger.warning('SQLite journal_mode is %s instead of %s', mode, pragmas['journal_mode'])
+
+
+def delete_rows(model, pks, column='id', using=None):
+    """
+    Удаляет строки таблицы модели одним DELETE ... WHERE column IN (...) без загрузки
+    объектов и без сигналов pre/post_delete. Возвращает число удаленных строк.
+    """
+    if not pks:
+        return 0
+    connection = connections[using or router.db_for_write(model)]
+    table, column = connection.ops.quote_name(model._meta.db_table), connection.ops.quote_name(column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(pks))})', list(pks))
+        return cursor.rowcount
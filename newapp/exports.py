@@ -0,0 +1,25 @@
+from .renderers import FastJSONRenderer
+
+
+def iter_rows(builder, queryset, chunk_size):
+    """
+    Читает queryset порциями через .iterator(), не держа в памяти весь каталог.
+    """
+    for row in builder.values(queryset).iterator(chunk_size=chunk_size):
+        yield builder.build_row(row)
+
+
+def stream_ndjson(rows):
+    render = FastJSONRenderer().render
+    for row in rows:
+        yield render(row) + b'\n'
+
+
+def stream_json_array(rows):
+    render = FastJSONRenderer().render
+    yield b'['
+    separator = b''
+    for row in rows:
+        yield separator + render(row)
+        separator = b','
+    yield b']'
@@ -0,0 +1,97 @@
+import decimal
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import fields, relations
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+from .instrumentation import timed
+
+
+def _decimal_converter(field):
+    if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) \
+            or field.localize or getattr(field, 'normalize_output', False) or field.decimal_places is None:
+        return field.to_representation
+
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return f'{value.quantize(exponent, rounding=rounding, context=context):f}'
+    return convert
+
+
+def _date_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != fields.ISO_8601:
+        return field.to_representation
+    return lambda value: value.isoformat()
+
+
+def _compile_converter(field):
+    """
+    Возвращает функцию преобразования значения из .values() в то же
+    представление, что дает field.to_representation, или None, если значение
+    можно отдавать как есть.
+    """
+    if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None
+    if isinstance(field, (fields.CharField, fields.IntegerField)) and type(field).to_representation in (
+            fields.CharField.to_representation, fields.IntegerField.to_representation):
+        return None
+    if type(field) is fields.BooleanField:
+        return None
+    if type(field) is fields.DecimalField:
+        return _decimal_converter(field)
+    if type(field) is fields.DateField:
+        return _date_converter(field)
+    # DateTimeField и прочие поля: часовой пояс и форматы оставляем полю
+    return field.to_representation
+
+
+class ValuesRowBuilder:
+    """
+    Строит строки ответа из QuerySet.values() без создания экземпляров модели
+    и полей сериализатора на каждую строку. Вывод совпадает с serializer.data.
+    """
+    def __init__(self, serializer_class, exclude=()):
+        serializer = serializer_class()
+        self.fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only or name in exclude:
+                continue
+            if isinstance(field, (BaseSerializer, relations.ManyRelatedField, fields.SerializerMethodField,
+                                  fields.ListField, fields.DictField)) \
+                    or field.source == '*' or '.' in field.source:
+                raise ImproperlyConfigured(
+                    f'Field {serializer_class.__name__}.{name} cannot be built from QuerySet.values(); '
+                    f'add it to exclude.'
+                )
+            self.fields.append((name, field.source, _compile_converter(field)))
+        self.sources = [source for _, source, _ in self.fields]
+
+    def values(self, queryset):
+        return queryset.select_related(None).prefetch_related(None).values(*self.sources)
+
+    def build_row(self, row):
+        data = {}
+        for name, source, convert in self.fields:
+            value = row[source]
+            if value is not None and convert is not None:
+                value = convert(value)
+            data[name] = value
+        return data
+
+    def build(self, rows):
+        build_row = self.build_row
+        with timed('serialize'):
+            return [build_row(row) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def get_row_builder(serializer_class, exclude=()):
+    return ValuesRowBuilder(serializer_class, exclude=tuple(exclude))
@@ -0,0 +1,229 @@
+import bz2
+import codecs
+import gzip
+import io
+import json
+import lzma
+from collections import Counter, defaultdict
+
+from django.contrib.auth.models import Group, Permission, User
+from django.core.management.color import no_style
+from django.core.serializers import base, python
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .backends import GLOBAL_GENERATION, user_generation
+from .cache import bump_generation
+from .counters import rebuild_genre_counters, reconcile_price_stats
+from .models import Book
+from .statistics import genre_statistic
+
+OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+# Модели, от которых зависят кэши пользователей и прав (см. backends.PermissionCache)
+AUTH_LABELS = {
+    model._meta.label
+    for model in (User, Group, Permission, User.groups.through, User.user_permissions.through,
+                  Group.permissions.through)
+}
+
+_decoder = json.JSONDecoder()
+
+
+def open_fixture(path):
+    """
+    Открывает фикстуру (в т.ч. .gz/.bz2/.xz) как текст. Кодировка - по BOM:
+    дампы из PowerShell (newapp_dumpdata.json) сохранены в UTF-16.
+    """
+    opener = next((opener for suffix, opener in OPENERS.items() if path.endswith(suffix)), open)
+    raw = opener(path, 'rb')
+    head = raw.peek(4)[:4] if hasattr(raw, 'peek') else b''
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    else:
+        encoding = 'utf-8-sig'
+    return io.TextIOWrapper(raw, encoding=encoding)
+
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """
+    Элементы JSON-массива верхнего уровня по одному. В памяти - только текущий
+    элемент и один прочитанный блок, поэтому размер файла не ограничен.
+    """
+    buffer = ''
+    position = 0
+    eof = False
+    started = False
+
+    def skip(chars):
+        nonlocal position
+        while position < len(buffer) and buffer[position] in chars:
+            position += 1
+
+    while True:
+        skip(' \t\r\n,' if started else ' \t\r\n')
+        if position >= len(buffer) and not eof:
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        if position >= len(buffer):
+            raise base.DeserializationError('Unexpected end of fixture: expected "]"')
+
+        if not started:
+            if buffer[position] != '[':
+                raise base.DeserializationError('Fixture must be a JSON array')
+            position += 1
+            started = True
+            continue
+        if buffer[position] == ']':
+            return
+
+        try:
+            item, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise base.DeserializationError(f'Invalid JSON at fixture offset {e.pos}: {e.msg}')
+            # Элемент не поместился в буфер - дочитываем
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        position = end
+        yield item
+
+
+class FastLoader:
+    """
+    Загрузка фикстур dumpdata без сохранения каждого объекта по отдельности.
+
+    Подряд идущие объекты одной модели собираются в пачки и вставляются одним
+    bulk_create (существующие строки с тем же pk перезаписываются, как в loaddata),
+    m2m - пачками в промежуточную таблицу. Сигналы post_save не отправляются, если
+    не указано send_signals (тогда raw=True, как в loaddata). Как и loaddata, проверка
+    внешних ключей откладывается до конца загрузки и все выполняется в одной транзакции.
+    """
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch_size=1000, send_signals=False, ignorenonexistent=False):
+        self.using = using
+        self.batch_size = batch_size
+        self.send_signals = send_signals
+        self.ignorenonexistent = ignorenonexistent
+        self.counts = Counter()
+        self.models = set()
+
+    def load(self, paths):
+        connection = connections[self.using]
+        with transaction.atomic(using=self.using):
+            with connection.constraint_checks_disabled():
+                for path in paths:
+                    self.load_file(path)
+            connection.check_constraints(table_names=[model._meta.db_table for model in self.models])
+            self.reset_sequences(connection)
+        return self.counts
+
+    def load_file(self, path):
+        deferred = []
+        self.batch = []
+        self.m2m_rows = defaultdict(list)
+        with open_fixture(path) as stream:
+            objects = python.Deserializer(
+                iter_json_array(stream), using=self.using,
+                ignorenonexistent=self.ignorenonexistent, handle_forward_references=True,
+            )
+            for obj in objects:
+                if self.batch and type(obj.object) is not type(self.batch[0].object):
+                    self.flush()
+                self.batch.append(obj)
+                if obj.deferred_fields:
+                    # Ссылки по natural key на объекты дальше в файле разрешаются в конце
+                    deferred.append(obj)
+                if len(self.batch) >= self.batch_size:
+                    self.flush()
+            self.flush()
+            self.flush_m2m()
+        for obj in deferred:
+            obj.save_deferred_fields(using=self.using)
+
+    def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        model = type(batch[0].object)
+        self.models.add(model)
+
+        if model._meta.parents:
+            # Наследование таблиц bulk_create не поддерживает
+            for obj in batch:
+                obj.save(using=self.using)
+        else:
+            self.bulk_save(model, [obj.object for obj in batch])
+
+        for obj in batch:
+            for field_name, values in (obj.m2m_data or {}).items():
+                self.add_m2m_rows(model._meta.get_field(field_name), obj.object.pk, values)
+            if self.send_signals:
+                post_save.send(sender=model, instance=obj.object, created=True, raw=True, using=self.using,
+                               update_fields=None)
+        self.counts[model._meta.label] += len(batch)
+
+    def bulk_save(self, model, instances):
+        manager = model._base_manager.db_manager(self.using)
+        update_fields = [field.name for field in model._meta.local_concrete_fields if not field.primary_key]
+        with_pk = [instance for instance in instances if instance.pk is not None]
+        without_pk = [instance for instance in instances if instance.pk is None]
+        if with_pk:
+            if update_fields:
+                manager.bulk_create(with_pk, update_conflicts=True, unique_fields=['pk'],
+                                    update_fields=update_fields)
+            else:
+                manager.bulk_create(with_pk, ignore_conflicts=True)
+            # Как loaddata (related.set()), заменяем m2m перезаписанных объектов
+            for field in model._meta.local_many_to_many:
+                if field.remote_field.through._meta.auto_created:
+                    through = field.remote_field.through
+                    through._base_manager.using(self.using).filter(
+                        **{f'{field.m2m_field_name()}__in': [instance.pk for instance in with_pk]}
+                    ).delete()
+        if without_pk:
+            manager.bulk_create(without_pk)
+
+    def add_m2m_rows(self, field, pk, values):
+        through = field.remote_field.through
+        if not through._meta.auto_created:
+            return
+        source, target = field.m2m_column_name(), field.m2m_reverse_name()
+        rows = self.m2m_rows[through]
+        rows.extend(through(**{source: pk, target: value}) for value in values)
+        if len(rows) >= self.batch_size:
+            self.flush_m2m(through)
+
+    def flush_m2m(self, through=None):
+        for model in [through] if through else list(self.m2m_rows):
+            rows = self.m2m_rows.pop(model, [])
+            if rows:
+                model._base_manager.using(self.using).bulk_create(rows, ignore_conflicts=True)
+                self.models.add(model)
+
+    def reset_sequences(self, connection):
+        # Как loaddata: следующий автоинкремент - после загруженных pk
+        statements = connection.ops.sequence_reset_sql(no_style(), list(self.models))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def refresh_after_load(labels, using=DEFAULT_DB_ALIAS):
+    """
+    Пересчитывает данные, которые обычно поддерживают сигналы: счетчики жанров,
+    статистику цен, deleted_at удаленных книг, кэши ответов, пользователей и прав.
+    """
+    labels = set(labels)
+    if labels & AUTH_LABELS:
+        # Пользователи, группы и права (и их m2m) могли измениться у любого пользователя
+        user_ids = User.objects.using(using).values_list('pk', flat=True)
+        bump_generation(GLOBAL_GENERATION, *[user_generation(user_id) for user_id in user_ids.iterator()])
+    if not {Book._meta.label, Book.genres.field.related_model._meta.label} & labels:
+        return
+    Book.all_objects.using(using).filter(is_deleted=True, deleted_at__isnull=True).update(deleted_at=timezone.now())
+    rebuild_genre_counters()
+    reconcile_price_stats()
+    genre_statistic.invalidate()
+    bump_generation('book', 'genre')
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Границы корзин гистограммы времени ответа, мс
+LATENCY_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Порядок метрик в заголовке Server-Timing
+PHASES = ('db', 'auth', 'perm', 'serialize', 'render')
+
+current_timings = ContextVar('newapp_request_timings', default=None)
+
+
+def get_options():
+    options = getattr(settings, 'REQUEST_METRICS', {})
+    return {'ENABLED': options.get('ENABLED', True), 'SERVER_TIMING': options.get('SERVER_TIMING', True)}
+
+
+class RequestTimings:
+    """
+    Время этапов одного запроса (мс) и число SQL-запросов. Заполняется
+    RequestMetricsMiddleware, блоками timed() в представлениях и сериализаторах
+    и record_query - возможно, из других потоков (sync_to_async), поэтому под блокировкой.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.phases = defaultdict(float)
+        self.active = set()
+        self.queries = 0
+        self.total = None
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] += seconds * 1000
+
+    def add_query(self, seconds):
+        with self.lock:
+            self.queries += 1
+            self.phases['db'] += seconds * 1000
+
+    def finish(self):
+        self.total = (time.perf_counter() - self.started) * 1000
+        return self.total
+
+    def server_timing(self):
+        metrics = []
+        for phase in PHASES:
+            if phase == 'db':
+                metrics.append(f'db;dur={self.phases["db"]:.2f};desc="{self.queries} queries"')
+            elif phase in self.phases:
+                metrics.append(f'{phase};dur={self.phases[phase]:.2f}')
+        metrics.append(f'total;dur={self.total:.2f}')
+        return ', '.join(metrics)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обертка execute_wrapper: число запросов и время в БД для текущего запроса.
+    Стоит на всех соединениях (install_query_timer), поэтому учитывает любые
+    псевдонимы БД и потоки, в которые передан контекст запроса (sync_to_async).
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(time.perf_counter() - started)
+
+
+def install_query_timer(connection):
+    # Вызывается при каждом подключении (signals.instrument_connection), обертка ставится один раз
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Добавляет время блока к этапу текущего запроса. Вложенные блоки того же
+    этапа (вложенные сериализаторы) не считаются повторно; вне запроса - ничего не делает.
+    """
+    timings = current_timings.get()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - started)
+        timings.active.discard(phase)
+
+
+class RequestMetrics:
+    """
+    Агрегаты по имени маршрута в памяти процесса: число ответов по классам статусов,
+    гистограмма времени ответа, сумма и максимум каждого этапа и SQL-запросов.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, status_code, timings):
+        with self.lock:
+            entry = self.routes.get(route)
+            if entry is None:
+                entry = self.routes[route] = {
+                    'count': 0,
+                    'statuses': Counter(),
+                    'histogram': [0] * (len(self.buckets) + 1),
+                    'phases': defaultdict(lambda: [0.0, 0.0]),
+                    'queries': [0, 0],
+                }
+            entry['count'] += 1
+            entry['statuses'][f'{status_code // 100}xx'] += 1
+            entry['histogram'][self.bucket_index(timings.total)] += 1
+            for phase, value in (('total', timings.total), *timings.phases.items()):
+                stats = entry['phases'][phase]
+                stats[0] += value
+                stats[1] = max(stats[1], value)
+            entry['queries'][0] += timings.queries
+            entry['queries'][1] = max(entry['queries'][1], timings.queries)
+
+    def bucket_index(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                return index
+        return len(self.buckets)
+
+    def percentile(self, histogram, count, fraction):
+        # Верхняя граница корзины, в которую попадает перцентиль
+        seen = 0
+        for index, value in enumerate(histogram):
+            seen += value
+            if seen >= count * fraction:
+                return self.buckets[index] if index < len(self.buckets) else None
+        return None
+
+    def export(self):
+        with self.lock:
+            result = {}
+            for route, entry in sorted(self.routes.items()):
+                count = entry['count']
+                labels = [f'le_{bound}' for bound in self.buckets] + ['le_inf']
+                result[route] = {
+                    'count': count,
+                    'statuses': dict(entry['statuses']),
+                    'latency_ms': {
+                        'p50': self.percentile(entry['histogram'], count, 0.5),
+                        'p95': self.percentile(entry['histogram'], count, 0.95),
+                        'p99': self.percentile(entry['histogram'], count, 0.99),
+                        'histogram': dict(zip(labels, entry['histogram'])),
+                    },
+                    'phases_ms': {
+                        phase: {'mean': round(total / count, 3), 'max': round(maximum, 3)}
+                        for phase, (total, maximum) in entry['phases'].items()
+                    },
+                    'queries': {'mean': round(entry['queries'][0] / count, 2), 'max': entry['queries'][1]},
+                }
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+def get_route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.route or match.view_name
@@ -0,0 +1,109 @@
+import atexit
+import datetime
+import json
+import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+try:
+    import orjson
+except ImportError:  # orjson - необязательная зависимость
+    orjson = None
+
+# Стандартные атрибуты LogRecord; все остальное пришло через extra и попадает в JSON
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Неблокирующий обработчик: запись кладется в ограниченную очередь, а настоящие
+    обработчики (файл, консоль) пишут ее в отдельном потоке QueueListener.
+    Если очередь переполнена, запись отбрасывается и учитывается в dropped.
+
+    В LOGGING целевые обработчики передаются ссылками 'cfg://handlers.<имя>'.
+    Ссылки разрешаются при первой записи, когда dictConfig уже настроил все
+    обработчики, поэтому порядок их имен не важен.
+    """
+    def __init__(self, handlers, maxsize=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = handlers
+        self.respect_handler_level = respect_handler_level
+        self.dropped = 0
+        self.listener = None
+        self.listener_lock = threading.Lock()
+
+    def start(self):
+        with self.listener_lock:
+            if self.listener is not None:
+                return
+            # Элементы ConvertingList из dictConfig преобразуются только при обращении по индексу
+            targets = [self.targets[i] for i in range(len(self.targets))]
+            for target in targets:
+                if not isinstance(target, logging.Handler):
+                    raise ValueError(f'{target!r} is not a configured handler')
+            self.listener = QueueListener(self.queue, *targets, respect_handler_level=self.respect_handler_level)
+            self.listener.start()
+            atexit.register(self.stop)
+
+    def enqueue(self, record):
+        if self.listener is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю rate записей ниже always_level.
+    Запросы к БД дольше slow_query_seconds (атрибут duration у django.db.backends) пропускаются всегда.
+    """
+    def __init__(self, rate=1.0, always_level=logging.WARNING, slow_query_seconds=None, name=''):
+        super().__init__(name)
+        self.rate = rate
+        self.always_level = logging._checkLevel(always_level)
+        self.slow_query_seconds = slow_query_seconds
+
+    def filter(self, record):
+        if record.levelno >= self.always_level or self.rate >= 1:
+            return True
+        if self.slow_query_seconds is not None and getattr(record, 'duration', 0) >= self.slow_query_seconds:
+            return True
+        return random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Одна JSON-строка на запись: время, уровень, логгер, сообщение и поля из extra.
+    """
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        if orjson is not None:
+            try:
+                return orjson.dumps(data, default=str).decode()
+            except TypeError:
+                pass
+        return json.dumps(data, default=str, ensure_ascii=False)
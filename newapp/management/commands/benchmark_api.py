@@ -0,0 +1,281 @@
+import asyncio
+import datetime
+import http.client
+import json
+import logging
+import platform
+import sqlite3
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from newapp.benchmarks import benchmark_database, seed_books, summarize
+from newapp.cache import ResponseCache, registry
+from newapp.models import Genre
+import newapp.views  # noqa: F401  регистрирует кэши ответов
+
+
+class ClientTransport:
+    """
+    Django test Client: весь стек (middleware, URLConf, представления) без сети.
+    """
+    name = 'client'
+
+    def __init__(self, headers):
+        self.client = Client(headers=headers)
+
+    def request(self, method, path, body=None):
+        return self.client.generic(method, path, body or '', content_type='application/json').status_code
+
+    def close(self):
+        pass
+
+
+class AsgiTransport:
+    """
+    AsyncClient: запрос проходит через ASGIHandler, как под ASGI-сервером.
+    """
+    name = 'asgi'
+
+    def __init__(self, headers):
+        # Заголовки из конструктора AsyncClient попадают в scope с WSGI-именами - передаем в каждом запросе
+        self.client = AsyncClient()
+        self.headers = headers
+        self.loop = asyncio.new_event_loop()
+
+    def request(self, method, path, body=None):
+        response = self.loop.run_until_complete(
+            self.client.generic(method, path, body or '', content_type='application/json', headers=self.headers)
+        )
+        return response.status_code
+
+    def close(self):
+        self.loop.close()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WsgiServerTransport:
+    """
+    wsgiref-сервер в отдельном потоке этого же процесса: запросы идут через сокет по HTTP.
+    """
+    name = 'wsgi'
+
+    def __init__(self, headers):
+        # Host из тестового окружения: setup_test_environment() разрешает только testserver
+        self.headers = {'Host': 'testserver', 'Content-Type': 'application/json', **headers}
+        self.server = make_server('127.0.0.1', 0, WSGIHandler(), WSGIServer, QuietRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            conn.request(method, path, body=body, headers=self.headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TRANSPORTS = {transport.name: transport for transport in (ClientTransport, AsgiTransport, WsgiServerTransport)}
+
+
+def get_endpoints(genre_id):
+    """
+    Замеряемые запросы: (имя, метод, путь, тело, ожидаемый статус).
+    """
+    new_book = json.dumps({
+        'title': 'Benchmark book',
+        'author': 'Benchmark author',
+        'published_date': '2001-01-01',
+        'price': '10.00',
+        'genres': [genre_id],
+    })
+    return [
+        ('books-list', 'GET', '/books/', None, 200),
+        ('books-list-fast', 'GET', '/books/?fast=true', None, 200),
+        ('books-search', 'GET', '/books/?search=Book%204242', None, 200),
+        ('books-by-date', 'GET', '/books/2000/06/15/', None, 200),
+        ('books-by-month', 'GET', '/books/by-date/2000/06/', None, 200),
+        ('user-books', 'GET', '/user-book/', None, 200),
+        ('genres-list', 'GET', '/genres/', None, 200),
+        ('genres-detail', 'GET', f'/genres/{genre_id}/', None, 200),
+        ('genres-statistic', 'GET', '/genres/statistic/', None, 200),
+        ('books-create', 'POST', '/books/', new_book, 201),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a benchmark database and measures p50/p95/p99 latency, throughput and query count '
+        'of the API endpoints through the test client, ASGI handler and an in-process WSGI server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--genres', type=int, default=10)
+        parser.add_argument('--publishers', type=int, default=10)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--transport', action='append', choices=sorted(TRANSPORTS),
+                            help='Can be repeated; all transports by default.')
+        parser.add_argument('--endpoint', action='append', help='Can be repeated; all endpoints by default.')
+        parser.add_argument('--no-response-cache', action='store_true',
+                            help='Measure the views without CachedResponseMixin.')
+        parser.add_argument('--save', help='Write results to this JSON file (baseline).')
+        parser.add_argument('--compare', help='Baseline JSON file to compare with.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p95 growth against the baseline (0.2 = 20%%).')
+        parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                            help='Smaller p95 growth is treated as noise.')
+
+    def handle(self, *args, **options):
+        loggers = [logging.getLogger(name) for name in ('django.db.backends', 'newapp')]
+        levels = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.WARNING)
+        try:
+            with benchmark_database():
+                report = self.run(options)
+        finally:
+            for logger, level in zip(loggers, levels):
+                logger.setLevel(level)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Saved results to {options["save"]}')
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline, report, options['threshold'], options['min_delta_ms'])
+            if regressions:
+                raise CommandError(f'{regressions} regression(s) against {options["compare"]}')
+
+    def run(self, options):
+        self.stdout.write(f'Seeding {options["books"]} books...')
+        users = seed_books(options['books'], genres=options['genres'], publishers=options['publishers'],
+                           users=options['users'])
+        user = users[0]
+        user.is_staff = user.is_superuser = True
+        user.save()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}', 'Accept': 'application/json'}
+
+        cache.clear()
+        if options['no_response_cache']:
+            for entry in registry.values():
+                if isinstance(entry, ResponseCache):
+                    entry.enabled = False
+
+        endpoints = get_endpoints(Genre.objects.order_by('pk').values_list('pk', flat=True).first())
+        if options['endpoint']:
+            unknown = set(options['endpoint']) - {endpoint[0] for endpoint in endpoints}
+            if unknown:
+                raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in options['endpoint']]
+
+        queries = self.count_queries(endpoints, headers)
+        results = {}
+        for name in options['transport'] or TRANSPORTS:
+            transport = TRANSPORTS[name](headers)
+            try:
+                results[name] = self.run_transport(transport, endpoints, queries, options)
+            finally:
+                transport.close()
+
+        return {
+            'meta': {
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'books': options['books'],
+                'requests': options['requests'],
+                'response_cache': any(entry.enabled for entry in registry.values() if isinstance(entry, ResponseCache)),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+            },
+            'results': results,
+        }
+
+    def count_queries(self, endpoints, headers):
+        # Число запросов к БД не зависит от транспорта - считаем его один раз через test Client,
+        # первым (холодным) запросом, чтобы кэш ответов его не скрывал
+        client = ClientTransport(headers)
+        queries = {}
+        for name, method, path, body, _ in endpoints:
+            with CaptureQueriesContext(connection) as captured:
+                client.request(method, path, body)
+            queries[name] = len(captured)
+        return queries
+
+    def run_transport(self, transport, endpoints, queries, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(transport.name))
+        self.stdout.write(f'{"endpoint":<20} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"req/s":>9} '
+                          f'{"queries":>7} {"errors":>6}')
+        results = {}
+        for name, method, path, body, expected_status in endpoints:
+            for _ in range(options['warmup']):
+                transport.request(method, path, body)
+
+            samples, errors = [], 0
+            started = time.perf_counter()
+            for _ in range(options['requests']):
+                request_started = time.perf_counter()
+                status_code = transport.request(method, path, body)
+                samples.append(time.perf_counter() - request_started)
+                errors += status_code != expected_status
+            result = summarize(samples, time.perf_counter() - started)
+            result.update(queries=queries[name], errors=errors)
+            results[name] = result
+
+            self.stdout.write(f'{name:<20} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+                              f'{result["p99_ms"]:>9.2f} {result["rps"]:>9.1f} {result["queries"]:>7} '
+                              f'{errors:>6}')
+        return results
+
+    def compare(self, baseline, report, threshold, min_delta_ms):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Compared with baseline from {baseline["meta"]["created_at"]}'))
+        for key in ('books', 'response_cache', 'python', 'django', 'sqlite'):
+            if baseline['meta'].get(key) != report['meta'][key]:
+                self.stdout.write(self.style.WARNING(
+                    f'{key} differs: {baseline["meta"].get(key)} in baseline, {report["meta"][key]} now'
+                ))
+        regressions = 0
+        for transport, results in report['results'].items():
+            for name, result in results.items():
+                old = baseline['results'].get(transport, {}).get(name)
+                if old is None:
+                    continue
+                change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0
+                problems = []
+                if change > threshold and result['p95_ms'] - old['p95_ms'] > min_delta_ms:
+                    problems.append(f'p95 {old["p95_ms"]:.2f} -> {result["p95_ms"]:.2f} ms')
+                if result['queries'] > old['queries']:
+                    problems.append(f'queries {old["queries"]} -> {result["queries"]}')
+                if result['errors'] > old['errors']:
+                    problems.append(f'errors {old["errors"]} -> {result["errors"]}')
+                line = f'{transport}/{name}: p95 {change:+.1%}'
+                if problems:
+                    regressions += 1
+                    self.stdout.write(self.style.ERROR(f'{line} REGRESSION ({"; ".join(problems)})'))
+                else:
+                    self.stdout.write(line)
+        return regressions
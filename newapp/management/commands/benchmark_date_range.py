@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from newapp.benchmarks import benchmark_database, measure, seed_books
+from newapp.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Compares __year/__month/__day extraction with published_date__range lookups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        with benchmark_database():
+            self.stdout.write(f'Seeding {options["rows"]} books...')
+            seed_books(options['rows'])
+
+            day = datetime.date(2000, 6, 15)
+            month_end = datetime.date(2000, 6, 30)
+            cases = [
+                ('day, extraction', Book.objects.filter(
+                    published_date__year=day.year, published_date__month=day.month, published_date__day=day.day)),
+                ('day, range', Book.objects.filter(published_date__range=(day, day))),
+                ('month, extraction', Book.objects.filter(
+                    published_date__year=day.year, published_date__month=day.month)),
+                ('month, range', Book.objects.filter(published_date__range=(day.replace(day=1), month_end))),
+            ]
+
+            for name, queryset in cases:
+                page = queryset.order_by('published_date', 'id')[:page_size]
+                elapsed = measure(lambda: list(page.all()), options['repeat']) * 1000
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {elapsed:.2f} ms'))
+                self.stdout.write(str(page.query))
+                self.stdout.write(page.explain())
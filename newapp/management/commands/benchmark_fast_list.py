@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from newapp.benchmarks import benchmark_database, measure, seed_books
+from newapp.fast_serializers import get_row_builder
+from newapp.models import Book
+from newapp.renderers import FastJSONRenderer
+from newapp.serializers import BookSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares rows/second of BookSerializer and the fast values() list path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        with benchmark_database():
+            seed_books(sizes[-1])
+            builder = get_row_builder(BookSerializer, ('genres',))
+
+            self.stdout.write(f'{"rows":>8} {"serializer rows/s":>18} {"fast rows/s":>12} {"speedup":>8}')
+            for size in sizes:
+                queryset = BookSerializer.setup_eager_loading(Book.objects.order_by('id'))[:size]
+
+                def slow():
+                    return JSONRenderer().render(BookSerializer(queryset.all(), many=True).data)
+
+                def fast():
+                    return FastJSONRenderer().render(builder.build(builder.values(queryset.all())))
+
+                if slow() != fast():
+                    raise CommandError(f'Fast list output differs from BookSerializer at {size} rows')
+
+                slow_time = measure(slow, options['repeat'])
+                fast_time = measure(fast, options['repeat'])
+                self.stdout.write(
+                    f'{size:>8} {size / slow_time:>18.0f} {size / fast_time:>12.0f} {slow_time / fast_time:>7.1f}x'
+                )
@@ -0,0 +1,104 @@
+import logging.config
+import os
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+
+from newapp.benchmarks import benchmark_database, measure, seed_books
+from newapp.models import Book
+
+
+def logging_config(directory, stream, mode, sample_rate):
+    """
+    LOGGING для одного сценария замера. Консольный обработчик пишет в stream
+    (по умолчанию os.devnull, чтобы скорость терминала не влияла на результат).
+    """
+    if mode == 'off':
+        return {'version': 1, 'disable_existing_loggers': False, 'loggers': {
+            'django.db.backends': {'level': 'WARNING', 'propagate': False},
+            'newapp': {'level': 'WARNING'},
+        }}
+
+    handlers = {
+        'console': {'level': 'DEBUG', 'class': 'logging.StreamHandler', 'stream': stream},
+        'file': {'level': 'DEBUG', 'class': 'logging.FileHandler', 'filename': os.path.join(directory, f'{mode}.log')},
+    }
+    filters = {}
+    targets, logger_filters = ['console', 'file'], []
+    if mode != 'sync':
+        handlers['file']['formatter'] = 'json'
+        handlers['queue'] = {
+            '()': 'newapp.log.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
+        }
+        targets = ['queue']
+    if mode == 'sampled':
+        filters['sample_sql'] = {'()': 'newapp.log.SamplingFilter', 'rate': sample_rate}
+        logger_filters = ['sample_sql']
+
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'filters': filters,
+        'formatters': {'json': {'()': 'newapp.log.JSONFormatter'}},
+        'handlers': handlers,
+        'loggers': {
+            'django.db.backends': {'handlers': targets, 'level': 'DEBUG', 'filters': logger_filters, 'propagate': False},
+            'newapp': {'handlers': targets, 'level': 'INFO'},
+        },
+    }
+
+
+def configure(config):
+    # dictConfig только добавляет фильтры к уже существующим логгерам - старые убираем сами
+    for name in ('django.db.backends', 'newapp'):
+        logging.getLogger(name).filters.clear()
+    logging.config.dictConfig(config)
+
+
+class Command(BaseCommand):
+    help = 'Measures API throughput with logging off, synchronous SQL logging, queued JSON logging and sampling.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--console', action='store_true', help='Write console logs to stderr instead of os.devnull.')
+        parser.add_argument('--sample-rate', type=float, default=settings.SQL_LOG_SAMPLE_RATE)
+
+    def handle(self, *args, **options):
+        with benchmark_database(), tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+            stream = sys.stderr if options['console'] else devnull
+            users = seed_books(options['rows'])
+            client = APIClient()
+            client.force_authenticate(users[0])
+            book_ids = list(Book.objects.values_list('pk', flat=True)[:options['requests']])
+
+            def run():
+                for number in range(options['requests']):
+                    if number % 2:
+                        client.get(f'/books/{book_ids[number % len(book_ids)]}/')
+                    else:
+                        client.get('/books/')
+
+            run()  # прогрев
+
+            self.stdout.write(f'{"logging":>10} {"req/s":>8} {"records":>8}')
+            try:
+                for mode in ('off', 'sync', 'queued', 'sampled'):
+                    configure(logging_config(directory, stream, mode, options['sample_rate']))
+                    # SQL пишется в лог только через отладочный курсор (как при DEBUG = True)
+                    connection.force_debug_cursor = mode != 'off'
+                    elapsed = measure(run, options['repeat'])
+                    # Закрытие обработчиков дожидается записи очереди на диск
+                    configure({'version': 1, 'disable_existing_loggers': False})
+                    connection.force_debug_cursor = False
+                    path = os.path.join(directory, f'{mode}.log')
+                    records = sum(1 for _ in open(path)) if os.path.exists(path) else 0
+                    self.stdout.write(f'{mode:>10} {options["requests"] / elapsed:>8.0f} {records:>8}')
+            finally:
+                configure(settings.LOGGING)
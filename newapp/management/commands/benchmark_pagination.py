@@ -0,0 +1,58 @@
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from newapp.benchmarks import benchmark_database, measure, seed_books
+from newapp.models import Book
+from newapp.pagination import BookKeysetPagination
+
+
+class Command(BaseCommand):
+    help = 'Compares latency of the first and a deep page for OFFSET and keyset pagination.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--deep-page', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        deep_page = options['deep_page']
+        factory = APIRequestFactory()
+
+        with benchmark_database():
+            seed_books(page_size * deep_page)
+            queryset = Book.objects.all()
+
+            def paginator(pagination_class):
+                instance = pagination_class()
+                instance.page_size = page_size
+                return instance
+
+            def offset_page(number):
+                request = Request(factory.get('/books/', {'page': number}))
+                return lambda: paginator(PageNumberPagination).paginate_queryset(
+                    queryset.order_by('-published_date', '-id'), request)
+
+            def keyset_page(query):
+                request = Request(factory.get('/books/', query))
+                return lambda: paginator(BookKeysetPagination).paginate_queryset(queryset, request)
+
+            # Курсор на начало глубокой страницы: последняя строка предыдущей страницы
+            last = queryset.order_by('-published_date', '-id')[(deep_page - 1) * page_size - 1]
+            keyset = paginator(BookKeysetPagination)
+            keyset.paginate_queryset(queryset, Request(factory.get('/books/')))
+            deep_cursor = parse_qs(urlparse(keyset.encode_cursor(last, reverse=False)).query)['cursor'][0]
+
+            rows = [
+                ('OFFSET + COUNT', offset_page(1), offset_page(deep_page)),
+                ('keyset', keyset_page({}), keyset_page({'cursor': deep_cursor})),
+            ]
+            self.stdout.write(f'{"paginator":<16} {"page 1, ms":>12} {f"page {deep_page}, ms":>16}')
+            for name, first, deep in rows:
+                first_time = measure(first, options['repeat']) * 1000
+                deep_time = measure(deep, options['repeat']) * 1000
+                self.stdout.write(f'{name:<16} {first_time:>12.2f} {deep_time:>16.2f}')
@@ -0,0 +1,63 @@
+import random
+
+from django.core.management.base import BaseCommand
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from newapp.benchmarks import benchmark_database, measure, seed_books
+from newapp.models import Book
+from newapp.search import FullTextSearchFilter
+
+
+class SearchView:
+    search_fields = ['title', 'author']
+
+
+def make_words(count, seed=0):
+    rnd = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rnd.choice(letters) for _ in range(rnd.randint(4, 9))) for _ in range(count)]
+
+
+class Command(BaseCommand):
+    help = "Compares SearchFilter (LIKE '%term%') with the FTS5 FullTextSearchFilter."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Number of distinct title words.')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        words = make_words(options['vocabulary'])
+        page_size = options['page_size']
+        factory = APIRequestFactory()
+
+        with benchmark_database():
+            self.stdout.write(f'Seeding {options["rows"]} books...')
+            seed_books(options['rows'], words=words)
+
+            # Одно слово, два слова из одного названия, начало слова
+            title_words = Book.objects.order_by('id').values_list('title', flat=True)[0].split()
+            searches = [title_words[0], ' '.join(title_words[:2]), title_words[0][:3]]
+            for search in searches:
+                request = Request(factory.get('/', {'search': search}))
+                like = filters.SearchFilter().filter_queryset(request, Book.objects.all(), SearchView())
+                fts = FullTextSearchFilter().filter_queryset(request, Book.objects.all(), SearchView())
+                cases = [
+                    ('LIKE, by id', like.order_by('id')[:page_size]),
+                    ('FTS5, by rank', fts[:page_size]),
+                    ('FTS5, by -published_date', fts.order_by('-published_date', '-id')[:page_size]),
+                    ('LIKE, count', None),
+                    ('FTS5, count', None),
+                ]
+                self.stdout.write(self.style.MIGRATE_HEADING(f'search={search!r}'))
+                for name, page in cases:
+                    if page is None:
+                        queryset = like if name.startswith('LIKE') else fts
+                        func = queryset.count
+                    else:
+                        func = (lambda page=page: list(page.all()))
+                    elapsed = measure(func, options['repeat']) * 1000
+                    self.stdout.write(f'  {name:<26} {elapsed:>9.2f} ms   result={func() if page is None else len(func())}')
@@ -0,0 +1,208 @@
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from newapp.benchmarks import benchmark_database, seed_books, summarize
+
+# Пары (синхронный эндпоинт, его async-вариант из newapp.async_views)
+ENDPOINTS = [
+    ('books-list', '/books/?fast=true', '/async/books/'),
+    ('books-by-date', '/books/by-date/2000/06/15/?fast=true', '/async/books/2000/06/15/'),
+    ('genres-list', '/genres/', '/async/genres/'),
+    ('protected', '/protected/', '/async/protected/'),
+]
+
+
+def server_command(name, port, options):
+    if name == 'uvicorn':
+        return [
+            sys.executable, '-m', 'uvicorn', 'django_rest_introduction.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(options['workers']),
+            '--no-access-log', '--log-level', 'warning',
+        ]
+    return [
+        sys.executable, '-m', 'gunicorn', 'django_rest_introduction.wsgi:application',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+        '--worker-class', 'gthread', '--threads', str(options['threads']), '--log-level', 'warning',
+    ]
+
+
+SERVERS = {'uvicorn': 'uvicorn', 'gunicorn': 'gunicorn'}  # имя -> модуль
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'Server exited with code {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'Server did not start listening on port {port} in {timeout} s')
+
+
+async def read_response(reader):
+    """
+    Читает один ответ HTTP/1.1 (Content-Length или chunked), возвращает (статус, keep-alive).
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    version, status = status_line.split()[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return int(status), False
+    # HTTP/1.0 (например, wsgiref) держит соединение, только если явно ответил keep-alive
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection == 'keep-alive' if version == b'HTTP/1.0' else connection != 'close'
+    return int(status), keep_alive
+
+
+async def run_load(port, path, headers, concurrency, duration):
+    """
+    concurrency клиентов с keep-alive соединениями шлют GET path в течение duration секунд.
+    """
+    request = (
+        f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+        + ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        + '\r\n'
+    ).encode()
+    samples, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                started = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive = await read_response(reader)
+                samples.append(time.perf_counter() - started)
+                errors += status != 200
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors += 1
+                keep_alive = False
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts uvicorn (ASGI) and gunicorn (WSGI, gthread) on a seeded SQLite database and compares '
+        'synchronous read endpoints with their async variants at high concurrency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per endpoint.')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker.')
+        parser.add_argument('--server', action='append', choices=sorted(SERVERS),
+                            help='Can be repeated; all servers by default.')
+        parser.add_argument('--save', help='Write results to this JSON file.')
+
+    def handle(self, *args, **options):
+        servers = options['server'] or sorted(SERVERS)
+        missing = [name for name in servers if importlib.util.find_spec(SERVERS[name]) is None]
+        if missing:
+            raise CommandError(f'Not installed: {", ".join(missing)} (pip install {" ".join(missing)})')
+
+        report = {}
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'benchmark.sqlite3')
+            with benchmark_database(name=database):
+                self.stdout.write(f'Seeding {options["books"]} books...')
+                user = seed_books(options['books'])[0]
+                user.is_staff = user.is_superuser = True
+                user.save()
+                headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}', 'Accept': 'application/json'}
+                for name in servers:
+                    report[name] = self.run_server(name, database, headers, options)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def run_server(self, name, database, headers, options):
+        port = free_port()
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'django_rest_introduction.settings'),
+            'DATABASE_NAME': database,
+            # Кэш ответов есть только у синхронных представлений - отключаем, чтобы сравнивать работу с БД
+            'RESPONSE_CACHE_ENABLED': 'false',
+        }
+        process = subprocess.Popen(server_command(name, port, options), cwd=settings.BASE_DIR, env=env)
+        results = {}
+        try:
+            wait_for_port(port, process)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: {options["workers"]} worker(s), concurrency {options["concurrency"]}'
+            ))
+            self.stdout.write(f'{"endpoint":<24} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"req/s":>9} {"errors":>6}')
+            for endpoint, sync_path, async_path in ENDPOINTS:
+                for variant, path in (('sync', sync_path), ('async', async_path)):
+                    samples, errors, elapsed = asyncio.run(
+                        run_load(port, path, headers, options['concurrency'], options['duration'])
+                    )
+                    if not samples:
+                        raise CommandError(f'{name} {path}: no successful responses')
+                    result = {**summarize(samples, elapsed), 'errors': errors}
+                    results[f'{endpoint} {variant}'] = result
+                    self.stdout.write(
+                        f'{endpoint + " " + variant:<24} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+                        f'{result["p99_ms"]:>9.2f} {result["rps"]:>9.1f} {errors:>6}'
+                    )
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        return results
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from newapp.benchmarks import benchmark_database, seed_books, summarize
+from newapp.cache import ResponseCache, registry
+from newapp.models import Book, Genre
+import newapp.views  # noqa: F401  регистрирует кэши ответов
+
+
+@contextmanager
+def sqlite_profile(name):
+    """
+    Временно включает профиль из settings.SQLITE_PROFILES для соединений default.
+    """
+    profile = settings.SQLITE_PROFILES[name]
+    database = connections.settings['default']
+    old = database['CONN_MAX_AGE'], database['OPTIONS']
+    connections.close_all()
+    database['CONN_MAX_AGE'], database['OPTIONS'] = profile['CONN_MAX_AGE'], dict(profile['OPTIONS'])
+    try:
+        with override_settings(SQLITE_PRAGMAS=profile['PRAGMAS']):
+            yield profile
+    finally:
+        connections.close_all()
+        database['CONN_MAX_AGE'], database['OPTIONS'] = old
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs concurrent mixed reads/writes against BookViewSet in worker threads (like a threaded '
+        'WSGI server) on a file SQLite database and compares the default and tuned SQLite profiles.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=20000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per profile.')
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--profile', action='append', choices=sorted(settings.SQLITE_PROFILES),
+                            help='Can be repeated; all profiles by default.')
+        parser.add_argument('--save', help='Write results to this JSON file.')
+
+    def handle(self, *args, **options):
+        # Кэш ответов скрыл бы чтения из БД; ошибки "database is locked" считаем, а не логируем
+        for entry in registry.values():
+            if isinstance(entry, ResponseCache):
+                entry.enabled = False
+        loggers = [logging.getLogger(name) for name in ('django.db.backends', 'django.request', 'newapp')]
+        levels = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.CRITICAL)
+
+        report = {}
+        try:
+            for name in options['profile'] or settings.SQLITE_PROFILES:
+                with tempfile.TemporaryDirectory() as directory, sqlite_profile(name), \
+                        benchmark_database(name=os.path.join(directory, 'benchmark.sqlite3')):
+                    report[name] = self.run_profile(name, options)
+        finally:
+            for logger, level in zip(loggers, levels):
+                logger.setLevel(level)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def get_operations(self, book_ids, genre_ids):
+        def create(rnd):
+            return json.dumps({
+                'title': f'Concurrent book {rnd.randrange(10 ** 9)}',
+                'author': 'Benchmark author',
+                'published_date': '2001-01-01',
+                'price': '10.00',
+                'genres': rnd.sample(genre_ids, 2),
+            })
+
+        def update(rnd):
+            return json.dumps([
+                {'id': book_id, 'price': f'{rnd.randrange(100, 10000) / 100:.2f}'}
+                for book_id in rnd.sample(book_ids, 10)
+            ])
+
+        reads = [
+            ('list', 'GET', lambda rnd: '/books/', None),
+            ('list-fast', 'GET', lambda rnd: '/books/?fast=true', None),
+            ('by-date', 'GET', lambda rnd: f'/books/{rnd.randrange(1970, 2024)}/06/15/', None),
+        ]
+        writes = [
+            ('create', 'POST', lambda rnd: '/books/', create),
+            ('bulk-update', 'PATCH', lambda rnd: '/books/bulk/', update),
+        ]
+        return reads, writes
+
+    def run_profile(self, name, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Profile {name}: seeding {options["books"]} books...'))
+        user = seed_books(options['books'])[0]
+        user.is_staff = user.is_superuser = True
+        user.save()
+        with connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        reads, writes = self.get_operations(
+            list(Book.objects.values_list('pk', flat=True)[:5000]), list(Genre.objects.values_list('pk', flat=True))
+        )
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}', 'Accept': 'application/json'}
+        connections.close_all()
+
+        handler = WSGIHandler()
+        samples = defaultdict(list)
+        statuses = defaultdict(int)
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['duration']
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            factory = RequestFactory()
+            try:
+                while time.perf_counter() < deadline:
+                    kind, operations = ('write', writes) if rnd.random() < options['write_ratio'] else ('read', reads)
+                    operation, method, path, body = rnd.choice(operations)
+                    environ = factory.generic(
+                        method, path(rnd), body(rnd) if body else '', content_type='application/json', headers=headers
+                    ).environ
+                    status = []
+                    started = time.perf_counter()
+                    # Как поток WSGI-сервера: request_started/request_finished закрывают соединение по CONN_MAX_AGE
+                    response = handler(environ, lambda status_line, response_headers, exc_info=None: status.append(status_line))
+                    for _ in response:
+                        pass
+                    response.close()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        samples[kind].append(elapsed)
+                        statuses[f'{operation} {status[0][:3]}'] += 1
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        errors = sum(count for key, count in statuses.items() if not key.endswith((' 200', ' 201')))
+        result = {
+            'journal_mode': journal_mode,
+            'threads': options['threads'],
+            'requests': sum(len(values) for values in samples.values()),
+            'rps': round(sum(len(values) for values in samples.values()) / elapsed, 1),
+            'errors': errors,
+            'statuses': dict(sorted(statuses.items())),
+        }
+        for kind, values in samples.items():
+            result[kind] = summarize(values, elapsed)
+
+        self.stdout.write(f'journal_mode={journal_mode}, {result["requests"]} requests, {result["rps"]} req/s, '
+                          f'{errors} errors')
+        for kind in ('read', 'write'):
+            if kind in result:
+                stats = result[kind]
+                self.stdout.write(f'  {kind:<6} p50 {stats["p50_ms"]:>8.2f} ms  p95 {stats["p95_ms"]:>8.2f} ms  '
+                                  f'p99 {stats["p99_ms"]:>8.2f} ms  {stats["rps"]:>7.1f} req/s')
+        for key, count in result['statuses'].items():
+            self.stdout.write(f'  {key}: {count}')
+        return result
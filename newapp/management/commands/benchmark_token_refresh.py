@@ -0,0 +1,130 @@
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from newapp.benchmarks import benchmark_database, summarize
+from newapp.tokens import FilteredRefreshToken, blacklist_filter, purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a file SQLite database with historic outstanding/blacklisted refresh tokens and measures '
+        'blacklist checks and /api/token/refresh/ throughput with and without the Bloom filter.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=10000000, help='Historic outstanding tokens.')
+        parser.add_argument('--blacklisted-ratio', type=float, default=0.9,
+                            help='Share of historic tokens in the blacklist (rotation blacklists almost all).')
+        parser.add_argument('--expired-ratio', type=float, default=0.8)
+        parser.add_argument('--checks', type=int, default=5000, help='Blacklist checks per mode.')
+        parser.add_argument('--refreshes', type=int, default=500, help='Token refresh requests per mode.')
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument('--purge', action='store_true', help='Also time purge_expired_tokens afterwards.')
+        parser.add_argument('--save', help='Write results to this JSON file.')
+
+    def handle(self, *args, **options):
+        report = {}
+        enabled = blacklist_filter.enabled
+        with tempfile.TemporaryDirectory() as directory, \
+                benchmark_database(name=os.path.join(directory, 'benchmark.sqlite3')):
+            user = User.objects.create_user('token-bench', password='bench')
+            started = time.perf_counter()
+            self.seed_tokens(user, options)
+            report['seed_s'] = round(time.perf_counter() - started, 1)
+            self.stdout.write(f'Seeded {options["tokens"]} tokens in {report["seed_s"]} s')
+
+            blacklist_filter.clear()
+            started = time.perf_counter()
+            blacklist_filter.rebuild()
+            report['filter_build_s'] = round(time.perf_counter() - started, 2)
+            report['filter_mb'] = round(len(blacklist_filter.bloom.bits) / 2 ** 20, 1)
+            self.stdout.write(f'Bloom filter: {blacklist_filter.bloom.count} jti, {report["filter_mb"]} MB, '
+                              f'built in {report["filter_build_s"]} s')
+
+            try:
+                for mode, use_filter in (('db', False), ('filter', True)):
+                    blacklist_filter.enabled = use_filter
+                    report[mode] = {
+                        'check': self.run_checks(user, options['checks']),
+                        'refresh': self.run_refreshes(user, options['refreshes']),
+                    }
+                    for name, result in report[mode].items():
+                        self.stdout.write(
+                            f'{mode:<7}{name:<8} p50 {result["p50_ms"]:>7.3f} ms  p95 {result["p95_ms"]:>7.3f} ms  '
+                            f'{result["rps"]:>9.1f} /s'
+                        )
+            finally:
+                blacklist_filter.enabled = enabled
+                blacklist_filter.clear()
+            report['filter_stats'] = blacklist_filter.stats()
+
+            if options['purge']:
+                started = time.perf_counter()
+                deleted = purge_expired_tokens()
+                report['purge'] = {'deleted': deleted, 'seconds': round(time.perf_counter() - started, 1)}
+                self.stdout.write(f'Purged {deleted} expired tokens in {report["purge"]["seconds"]} s')
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def seed_tokens(self, user, options):
+        # Сырой executemany: через bulk_create 10M объектов модели заняли бы в разы больше времени и памяти
+        rnd = random.Random(0)
+        now = aware_utcnow()
+        adapt = connection.ops.adapt_datetimefield_value
+        expired, valid = adapt(now - timedelta(days=1)), adapt(now + timedelta(days=1))
+        outstanding = connection.ops.quote_name(OutstandingToken._meta.db_table)
+        blacklisted = connection.ops.quote_name(BlacklistedToken._meta.db_table)
+        count, batch_size = options['tokens'], options['batch_size']
+        with connection.cursor() as cursor:
+            for start in range(1, count + 1, batch_size):
+                ids = range(start, min(start + batch_size, count + 1))
+                with transaction.atomic():
+                    cursor.executemany(
+                        f'INSERT INTO {outstanding} (id, user_id, jti, token, created_at, expires_at) '
+                        f'VALUES (%s, %s, %s, %s, %s, %s)',
+                        [(pk, user.pk, f'{rnd.getrandbits(128):032x}', '', expired,
+                          expired if rnd.random() < options['expired_ratio'] else valid) for pk in ids],
+                    )
+                    cursor.executemany(
+                        f'INSERT INTO {blacklisted} (token_id, blacklisted_at) VALUES (%s, %s)',
+                        [(pk, expired) for pk in ids if rnd.random() < options['blacklisted_ratio']],
+                    )
+
+    def run_checks(self, user, count):
+        # Как JWTAuthenticationMiddleware.refresh_access_token: разбор и проверка refresh-токена
+        tokens = [str(FilteredRefreshToken.for_user(user)) for _ in range(count)]
+        samples = []
+        started = time.perf_counter()
+        for token in tokens:
+            check_started = time.perf_counter()
+            FilteredRefreshToken(token)
+            samples.append(time.perf_counter() - check_started)
+        return summarize(samples, time.perf_counter() - started)
+
+    def run_refreshes(self, user, count):
+        # Цепочка ротаций: каждый ответ дает новый refresh, старый попадает в черный список
+        client = Client()
+        token = str(FilteredRefreshToken.for_user(user))
+        samples = []
+        started = time.perf_counter()
+        for _ in range(count):
+            request_started = time.perf_counter()
+            response = client.post('/api/token/refresh/', {'refresh': token}, content_type='application/json')
+            samples.append(time.perf_counter() - request_started)
+            if response.status_code != 200:
+                raise RuntimeError(f'Token refresh failed: {response.status_code} {response.content[:200]}')
+            token = response.json()['refresh']
+        return summarize(samples, time.perf_counter() - started)
@@ -0,0 +1,14 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from newapp.cache import registry
+import newapp.statistics  # noqa: F401  регистрирует кэши
+import newapp.views  # noqa: F401  кэши ответов представлений
+
+
+class Command(BaseCommand):
+    help = 'Prints hit/miss counters of the cached statistics and view responses.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps({name: entry.stats() for name, entry in registry.items()}, indent=2))
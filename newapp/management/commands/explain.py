@@ -0,0 +1,67 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.generics import GenericAPIView
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIRequestFactory
+
+
+def iter_list_endpoints(patterns, prefix=''):
+    """
+    Обходит URLConf и возвращает списочные DRF-эндпоинты без аргументов в URL.
+    """
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from iter_list_endpoints(pattern.url_patterns, route)
+            continue
+        if not isinstance(pattern, URLPattern) or pattern.pattern.regex.groups:
+            continue
+        view_class = getattr(pattern.callback, 'cls', None)
+        if view_class is None or not issubclass(view_class, GenericAPIView):
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        if actions is not None and actions.get('get') != 'list':
+            continue
+        if actions is None and not issubclass(view_class, ListModelMixin):
+            continue
+        yield pattern, route.replace('^', '').replace('$', ''), view_class
+
+
+class Command(BaseCommand):
+    help = 'Prints database query plans for every list endpoint registered in the URLConf.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username used as request.user (defaults to the first superuser).')
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'User "{username}" does not exist')
+        return User.objects.filter(is_superuser=True).order_by('id').first() or AnonymousUser()
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        factory = APIRequestFactory()
+
+        for pattern, route, view_class in iter_list_endpoints(get_resolver().url_patterns):
+            view = view_class(**pattern.callback.initkwargs)
+            view.action_map = getattr(pattern.callback, 'actions', None)
+            view.action = 'list'
+            view.args, view.kwargs, view.format_kwarg = (), {}, None
+            view.request = view.initialize_request(factory.get(f'/{route}'))
+            view.request.user = user
+
+            queryset = view.filter_queryset(view.get_queryset())
+            paginator = view.paginator
+            if paginator is not None:
+                if hasattr(paginator, 'order_queryset'):
+                    queryset = paginator.order_queryset(queryset, view.request)
+                queryset = queryset[:paginator.get_page_size(view.request) or None]
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{pattern.name or view_class.__name__}: /{route}'))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError
+
+from newapp.fixtures import FastLoader, refresh_after_load
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads dumpdata JSON fixtures (optionally .gz/.bz2/.xz) with a streaming parser and bulk inserts. '
+        'Unlike loaddata, post_save is not sent per object unless --send-signals is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='+', help='Paths to fixture files.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--send-signals', action='store_true',
+                            help='Send post_save(raw=True) for every loaded object, like loaddata.')
+        parser.add_argument('--ignorenonexistent', '-i', action='store_true',
+                            help='Ignore fields and models that no longer exist.')
+        parser.add_argument('--skip-refresh', action='store_true',
+                            help='Do not rebuild genre counters, price statistics and caches after loading.')
+
+    def handle(self, *args, **options):
+        loader = FastLoader(
+            using=options['database'],
+            batch_size=options['batch_size'],
+            send_signals=options['send_signals'],
+            ignorenonexistent=options['ignorenonexistent'],
+        )
+        started = time.perf_counter()
+        try:
+            counts = loader.load(options['fixtures'])
+        except (DeserializationError, IntegrityError, OSError) as e:
+            raise CommandError(f'Could not load fixtures: {e}') from e
+        elapsed = time.perf_counter() - started
+
+        for label, count in sorted(counts.items()):
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Installed {sum(counts.values())} object(s) from {len(options["fixtures"])} fixture(s) in {elapsed:.2f} s'
+        ))
+        if not options['skip_refresh']:
+            refresh_after_load(counts, using=options['database'])
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import get_resolver
+
+from newapp.schema import get_fingerprint, schemas
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates the OpenAPI schema served by the swagger/redoc views and writes it to '
+        'API_SCHEMA["DIRECTORY"]. Without --force does nothing if the URLConf and serializers did not change.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate even if the fingerprint matches.')
+        parser.add_argument('--check', action='store_true',
+                            help='Exit with an error if the schema on disk is missing or out of date.')
+
+    def handle(self, *args, **options):
+        get_resolver().url_patterns  # импортирует URLConf, где создаются представления схемы
+        if not schemas:
+            raise CommandError('No precomputed schema views in the URLConf (see newapp.schema).')
+
+        for name, schema in schemas.items():
+            fingerprint = get_fingerprint(schema.view_class.urlconf)
+            stored, _ = schema.read()
+            if options['check']:
+                if stored != fingerprint:
+                    raise CommandError(f'Schema {name} is missing or out of date, run generate_schema')
+                self.stdout.write(f'Schema {name} is up to date')
+                continue
+            if stored == fingerprint and not options['force']:
+                self.stdout.write(f'Schema {name} is up to date ({fingerprint[:12]})')
+                continue
+
+            started = time.perf_counter()
+            documents = schema.write(fingerprint)
+            sizes = ', '.join(f'{fmt} {len(content)} bytes' for fmt, content in documents.items())
+            self.stdout.write(self.style.SUCCESS(
+                f'Schema {name} written to {schema.directory} in {time.perf_counter() - started:.2f} s ({sizes})'
+            ))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from newapp.models import OutboxMessage
+from newapp.tasks import RETENTION_DAYS, process_outbox, purge_finished_messages
+
+# Как часто --loop удаляет старые выполненные задачи, секунд
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Runs pending background tasks from the outbox (run periodically, e.g. from cron, or with --loop).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--task', help='Only run tasks with this name.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop.')
+        parser.add_argument('--purge-days', type=int, default=RETENTION_DAYS,
+                            help='Delete finished tasks older than this many days (TASK_QUEUE RETENTION_DAYS).')
+        parser.add_argument('--no-purge', action='store_true', help='Keep finished tasks.')
+
+    def handle(self, *args, **options):
+        purged_at = None
+        while True:
+            processed = process_outbox(options['batch_size'], options['task'])
+            if processed:
+                self.stdout.write(f'Processed {processed} tasks')
+            if not options['no_purge'] and (purged_at is None or time.monotonic() - purged_at > PURGE_INTERVAL):
+                deleted = purge_finished_messages(options['purge_days'])
+                purged_at = time.monotonic()
+                if deleted:
+                    self.stdout.write(f'Deleted {deleted} finished tasks')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        failed = OutboxMessage.objects.filter(status=OutboxMessage.FAILED).count()
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} tasks failed permanently'))
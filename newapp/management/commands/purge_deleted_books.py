@@ -0,0 +1,63 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from newapp.db import delete_rows
+from newapp.models import ArchivedBook, Book
+
+ARCHIVED_FIELDS = [field.attname for field in ArchivedBook._meta.concrete_fields if field.attname not in ('genre_ids', 'archived_at')]
+# При повторной архивации того же id (книгу восстановили и снова удалили) архив перезаписывается
+UPDATED_FIELDS = [name for name in ARCHIVED_FIELDS if name != 'id'] + ['genre_ids', 'archived_at']
+
+
+class Command(BaseCommand):
+    help = 'Moves soft-deleted books older than the retention window to the archive table in small transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'SOFT_DELETE_RETENTION_DAYS', 30))
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between chunks.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the books that would be moved.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = Book.all_objects.filter(is_deleted=True, deleted_at__lt=cutoff)
+        if options['dry_run']:
+            self.stdout.write(f'{expired.count()} books deleted before {cutoff:%Y-%m-%d %H:%M} would be archived')
+            return
+
+        moved = 0
+        while True:
+            # Каждая пачка - отдельная короткая транзакция, чтобы не держать блокировку таблицы
+            with transaction.atomic():
+                pks = list(expired.order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+                if not pks:
+                    break
+                self.archive(pks)
+            moved += len(pks)
+            self.stdout.write(f'Archived {moved} books')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {moved} books archived'))
+
+    def archive(self, pks):
+        through = Book.genres.through
+        genre_ids = defaultdict(list)
+        for book_id, genre_id in through.objects.filter(book_id__in=pks).values_list('book_id', 'genre_id'):
+            genre_ids[book_id].append(genre_id)
+
+        books = Book.all_objects.filter(pk__in=pks).values(*ARCHIVED_FIELDS)
+        ArchivedBook.objects.bulk_create(
+            [ArchivedBook(genre_ids=genre_ids[book['id']], **book) for book in books],
+            update_conflicts=True, unique_fields=['id'], update_fields=UPDATED_FIELDS,
+        )
+        through.objects.filter(book_id__in=pks).delete()
+        # Удаленные книги не входят ни в счетчики, ни в статистику, поэтому сигналы pre/post_delete
+        # для каждой строки не нужны - удаляем одним DELETE
+        delete_rows(Book, pks)
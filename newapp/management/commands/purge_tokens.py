@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from newapp.tokens import purge_expired_tokens, schedule_token_purge
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes expired outstanding and blacklisted JWT refresh tokens in small transactions. '
+        'With --schedule, queues the self-rescheduling purge_expired_tokens task instead.'
+    )
+
+    def add_arguments(self, parser):
+        options = getattr(settings, 'TOKEN_PURGE', {})
+        parser.add_argument('--chunk-size', type=int, default=options.get('CHUNK_SIZE', 5000))
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between chunks.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the tokens that would be deleted.')
+        parser.add_argument('--schedule', action='store_true',
+                            help='Queue the periodic purge task (every TOKEN_PURGE["INTERVAL"] seconds).')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            message = schedule_token_purge(delay=0)
+            self.stdout.write('Purge task is already scheduled' if message is None else
+                              f'Scheduled purge task {message.pk}')
+            return
+
+        now = aware_utcnow()
+        if options['dry_run']:
+            count = OutstandingToken.objects.filter(expires_at__lte=now).count()
+            self.stdout.write(f'{count} tokens expired before {now:%Y-%m-%d %H:%M} would be deleted')
+            return
+
+        started = time.perf_counter()
+        deleted = purge_expired_tokens(
+            options['chunk_size'], options['sleep'], now,
+            progress=lambda deleted: self.stdout.write(f'Deleted {deleted} tokens') if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Done, {deleted} expired tokens deleted in {time.perf_counter() - started:.1f} s'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from newapp.counters import rebuild_genre_counters
+from newapp.statistics import genre_statistic
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Genre.book_count/bestseller_count from the books table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift and exit with an error if counters are inconsistent.')
+
+    def handle(self, *args, **options):
+        drift = rebuild_genre_counters(check_only=options['check'])
+        for genre_id, stored, actual in drift:
+            self.stdout.write(f'Genre {genre_id}: stored (books, bestsellers)={stored}, actual={actual}')
+
+        if options['check']:
+            if drift:
+                raise CommandError(f'{len(drift)} genre counter(s) are inconsistent')
+            self.stdout.write(self.style.SUCCESS('Genre counters are consistent'))
+        else:
+            if drift:
+                genre_statistic.invalidate()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt counters, fixed {len(drift)} genre(s)'))
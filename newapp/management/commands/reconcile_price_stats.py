@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from newapp.counters import reconcile_price_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the catalog price sum/count used by ExpensiveBooksView (run periodically, e.g. from cron).'
+
+    def handle(self, *args, **options):
+        stored, actual = reconcile_price_stats()
+        if stored != actual:
+            self.stdout.write(self.style.WARNING(f'Fixed drift: stored (sum, count)={stored}, actual={actual}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Price stats are consistent: (sum, count)={actual}'))
@@ -1,6 +1,49 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 
+# Отправляются SoftDeleteQuerySet.delete() для каждой пачки строк:
+# pre_soft_delete - до пометки (queryset еще содержит неудаленные строки), post_soft_delete - после
+pre_soft_delete = Signal()
+post_soft_delete = Signal()
 
-class SoftDeleteManager(models.Manager):
+
+class SoftDeleteQuerySet(models.QuerySet):
+    """
+    delete() не удаляет строки, а помечает их is_deleted=True одним UPDATE на пачку
+    без загрузки объектов. Физическое удаление - hard_delete().
+    """
+    soft_delete_batch_size = 1000
+
+    def delete(self):
+        now = timezone.now()
+        values = {'is_deleted': True, 'deleted_at': now}
+        # Как update_timestamp для save(): отметка изменения, если она есть у модели
+        if 'updated_at' in {field.name for field in self.model._meta.concrete_fields}:
+            values['updated_at'] = now
+
+        pks = list(self.filter(is_deleted=False).order_by().values_list('pk', flat=True))
+        base = self.model._base_manager.using(self.db)
+        deleted = 0
+        for start in range(0, len(pks), self.soft_delete_batch_size):
+            batch = base.filter(pk__in=pks[start:start + self.soft_delete_batch_size])
+            with transaction.atomic(using=self.db):
+                pre_soft_delete.send(sender=self.model, queryset=batch)
+                deleted += batch.filter(is_deleted=False).update(**values)
+                post_soft_delete.send(sender=self.model, queryset=batch)
+        self._result_cache = None
+        return deleted, {self.model._meta.label: deleted} if deleted else {}
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def hard_delete(self):
+        return super().delete()
+
+    hard_delete.alters_data = True
+    hard_delete.queryset_only = True
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(is_deleted=False)
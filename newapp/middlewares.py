@@ -1,17 +1,28 @@
+import logging
+import time
 from datetime import datetime
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.utils.deprecation import MiddlewareMixin
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
 
+from .authentication import decode_stats, get_validated_access_token, remember_access_token
+from .instrumentation import RequestTimings, current_timings, get_options, get_route_name, request_metrics
+from .tokens import FilteredRefreshToken
+
+logger = logging.getLogger(__name__)
+
 
 class JWTAuthenticationMiddleware(MiddlewareMixin):
     def process_request(self, request):
+        decode_stats['requests'] += 1
+        request._jwt_decodes = 0
         access_token = request.COOKIES.get('access_token')
         refresh_token = request.COOKIES.get('refresh_token')
 
         if access_token:
             try:
-                token = AccessToken(access_token)
+                # Токен проверяется один раз, JWTAuthentication в представлении возьмет его из кэша
+                token = get_validated_access_token(access_token, request)
                 if datetime.utcfromtimestamp(token['exp']) < datetime.utcnow():
                     raise TokenError('Token expired')
                 request.META['HTTP_AUTHORIZATION'] = f'Bearer {access_token}'
@@ -34,8 +45,11 @@ class JWTAuthenticationMiddleware(MiddlewareMixin):
 
     def refresh_access_token(self, refresh_token):
         try:
-            refresh = RefreshToken(refresh_token)
-            new_access_token = str(refresh.access_token)
+            refresh = FilteredRefreshToken(refresh_token)
+            access_token = refresh.access_token
+            new_access_token = str(access_token)
+            # Новый токен уже проверен - не декодируем его повторно ни здесь, ни в представлении
+            remember_access_token(access_token)
             return new_access_token
         except TokenError:
             return None
@@ -43,7 +57,7 @@ class JWTAuthenticationMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         new_access_token = getattr(request, '_new_access_token', None)
         if new_access_token:
-            access_expiry = AccessToken(new_access_token)['exp']
+            access_expiry = get_validated_access_token(new_access_token, request)['exp']
             response.set_cookie(
                 key='access_token',
                 value=new_access_token,
@@ -52,9 +66,70 @@ class JWTAuthenticationMiddleware(MiddlewareMixin):
                 samesite='Lax',
                 expires=datetime.utcfromtimestamp(access_expiry)
             )
+        logger.debug('JWT decodes for %s: %s', request.path, getattr(request, '_jwt_decodes', 0))
         return response
 
     def clear_cookies(self, request):
         # Метод для удаления истекших куки
         request.COOKIES.pop('access_token', None)
         request.COOKIES.pop('refresh_token', None)
+
+
+class RequestMetricsMiddleware:
+    """
+    Время запроса по этапам: SQL (число и время, instrumentation.record_query на всех
+    соединениях), аутентификация, права и сериализация (instrumentation.timed в представлениях)
+    и рендеринг. Отдается в заголовке Server-Timing и копится в request_metrics
+    по имени маршрута. Стоит первым в MIDDLEWARE, чтобы total покрывал все middleware.
+    Работает и в WSGI, и в ASGI без лишнего переключения sync/async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = get_options()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.options['ENABLED']:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, timings)
+
+    async def __acall__(self, request):
+        if not self.options['ENABLED']:
+            return await self.get_response(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, timings)
+
+    def record(self, request, response, timings):
+        timings.finish()
+        if self.options['SERVER_TIMING']:
+            response['Server-Timing'] = timings.server_timing()
+        request_metrics.record(get_route_name(request), response.status_code, timings)
+        return response
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после представления: время до последнего post-render callback
+        timings = current_timings.get()
+        if timings is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: timings.add('render', time.perf_counter() - started))
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:08
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_genre_counters(apps, schema_editor):
+    Genre = apps.get_model('newapp', 'Genre')
+    genres = list(Genre.objects.annotate(
+        live_books=Count('books', filter=Q(books__is_deleted=False)),
+        live_bestsellers=Count('books', filter=Q(books__is_deleted=False, books__is_bestseller=True)),
+    ))
+    for genre in genres:
+        genre.book_count, genre.bestseller_count = genre.live_books, genre.live_bestsellers
+    Genre.objects.bulk_update(genres, ['book_count', 'bestseller_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0012_book_soft_delete_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='genre',
+            name='bestseller_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_genre_counters, migrations.RunPython.noop),
+    ]
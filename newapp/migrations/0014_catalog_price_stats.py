@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:09
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+
+def fill_price_stats(apps, schema_editor):
+    Book = apps.get_model('newapp', 'Book')
+    CatalogPriceStats = apps.get_model('newapp', 'CatalogPriceStats')
+    totals = Book.objects.filter(is_deleted=False).aggregate(price_sum=Sum('price'), priced_count=Count('price'))
+    CatalogPriceStats.objects.update_or_create(pk=1, defaults={
+        'price_sum': totals['price_sum'] or 0,
+        'priced_count': totals['priced_count'],
+        'reconciled_at': timezone.now(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0013_genre_book_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogPriceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('priced_count', models.PositiveIntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_price_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce, Now
+
+
+def fill_deleted_at(apps, schema_editor):
+    # Для уже удаленных книг точное время неизвестно - берем время последнего изменения
+    Book = apps.get_model('newapp', 'Book')
+    Book.objects.filter(is_deleted=True, deleted_at__isnull=True).update(deleted_at=Coalesce(F('updated_at'), Now()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0015_outbox_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBook',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('author', models.CharField(max_length=100)),
+                ('published_date', models.DateField()),
+                ('publisher_id', models.BigIntegerField(blank=True, null=True)),
+                ('owner_id', models.IntegerField(blank=True, null=True)),
+                ('genre_ids', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('discounted_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('is_bestseller', models.BooleanField(default=False)),
+                ('is_banned', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_deleted', False), _negated=True), fields=['deleted_at'], name='book_deleted_at_idx'),
+        ),
+        migrations.RunPython(fill_deleted_at, migrations.RunPython.noop),
+    ]
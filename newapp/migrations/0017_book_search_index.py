@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+from django.db import migrations
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    # FTS5 есть только в SQLite: на других СУБД FullTextSearchFilter работает как обычный SearchFilter
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+# Внешний FTS5-индекс (content=newapp_book) с триггерами синхронизации. SQL намеренно
+# скопирован сюда, а не импортирован из newapp.search: миграция не зависит от кода приложения
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS newapp_book_fts USING fts5(
+        title, author,
+        content='newapp_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    """
+    CREATE TRIGGER IF NOT EXISTS newapp_book_fts_insert AFTER INSERT ON newapp_book BEGIN
+        INSERT INTO newapp_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS newapp_book_fts_delete AFTER DELETE ON newapp_book BEGIN
+        INSERT INTO newapp_book_fts(newapp_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS newapp_book_fts_update AFTER UPDATE OF title, author ON newapp_book BEGIN
+        INSERT INTO newapp_book_fts(newapp_book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO newapp_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+    "INSERT INTO newapp_book_fts(newapp_book_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS newapp_book_fts_insert',
+    'DROP TRIGGER IF EXISTS newapp_book_fts_delete',
+    'DROP TRIGGER IF EXISTS newapp_book_fts_update',
+    'DROP TABLE IF EXISTS newapp_book_fts',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newapp', '0016_book_soft_delete_archive'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(CREATE_SQL, DROP_SQL),
+    ]
@@ -0,0 +1,323 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+
+from .cache import ResponseCache
+from .fast_serializers import get_row_builder
+from .instrumentation import timed
+
+
+class InstrumentedViewMixin:
+    """
+    Время аутентификации и проверки прав для Server-Timing (см. RequestMetricsMiddleware).
+    Должен стоять первым среди базовых классов представления.
+    """
+    def perform_authentication(self, request):
+        with timed('auth'):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timed('perm'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed('perm'):
+            super().check_object_permissions(request, obj)
+
+
+class EagerLoadingViewMixin:
+    """
+    Применяет к queryset связи, объявленные в сериализаторе представления
+    (см. serializers.EagerLoadingMixin), чтобы избежать N+1 запросов.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+
+class FastListMixin:
+    """
+    Быстрый режим списка (?fast=true): строки строятся из QuerySet.values()
+    без ModelSerializer. Ответ совпадает с обычным list().
+    """
+    fast_list_param = 'fast'
+    fast_list_exclude = ()
+
+    def is_fast_list(self):
+        return self.request.query_params.get(self.fast_list_param, 'false').lower() == 'true'
+
+    def get_row_builder(self):
+        return get_row_builder(self.get_serializer_class(), tuple(self.fast_list_exclude))
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_fast_list():
+            return super().list(request, *args, **kwargs)
+
+        builder = self.get_row_builder()
+        queryset = builder.values(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(builder.build(page))
+
+        return Response(builder.build(queryset))
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = 'Not modified.'
+    default_code = 'not_modified'
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been modified since the precondition was evaluated.'
+    default_code = 'precondition_failed'
+
+
+class PreconditionRequired(APIException):
+    status_code = status.HTTP_428_PRECONDITION_REQUIRED
+    default_detail = 'This request requires an If-Match header.'
+    default_code = 'precondition_required'
+
+
+def etag_matches(header, etag, weak=True):
+    """
+    Есть ли etag в заголовке If-None-Match (weak=True) или If-Match (weak=False).
+    """
+    if not header:
+        return False
+    etags = parse_etags(header)
+    if etags == ['*']:
+        return True
+    if weak:
+        return etag.removeprefix('W/') in [value.removeprefix('W/') for value in etags]
+    return etag in etags
+
+
+class ConditionalRequestMixin:
+    """
+    Условные HTTP-запросы по полю updated_at (его выставляет update_timestamp).
+
+    GET объекта: ETag и Last-Modified по (pk, updated_at). GET списка: ETag по строкам
+    страницы (pk и updated_at), ссылкам на соседние страницы, URL, пользователю и формату
+    ответа - без дополнительных запросов; список без пагинации ETag не получает.
+    Если клиент уже имеет эти данные (If-None-Match / If-Modified-Since) - 304 без сериализации.
+    PUT/PATCH/DELETE с If-Match / If-Unmodified-Since, не совпадающими с текущей версией, - 412.
+    Проверка выполняется после аутентификации и проверки прав.
+    """
+    last_modified_field = 'updated_at'
+    require_if_match = False  # True - изменения без If-Match отклоняются с 428
+    list_actions = ('list',)
+    object_actions = ('retrieve', 'update', 'partial_update', 'destroy')
+
+    def get_object(self):
+        # Объект загружается один раз: для проверки условий и в самом обработчике
+        if getattr(self, '_conditional_object', None) is None:
+            self._conditional_object = super().get_object()
+        return self._conditional_object
+
+    def get_conditional_target(self, request):
+        action = getattr(self, 'action', None)
+        if action is not None:
+            if action in self.list_actions:
+                return 'list'
+            return 'object' if action in self.object_actions else None
+        # Обычные generic-представления: объект, если в URL есть его ключ
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            return 'object'
+        return 'list' if request.method in ('GET', 'HEAD') else None
+
+    def get_object_etag(self, instance):
+        updated_at = getattr(instance, self.last_modified_field)
+        version = f'{instance._meta.label}:{instance.pk}:{updated_at.isoformat() if updated_at else ""}'
+        return f'"{hashlib.md5(version.encode()).hexdigest()}"'
+
+    def get_list_etag(self, request, page):
+        # Строки могут быть экземплярами модели или словарями из .values() (FastListMixin)
+        rows = ','.join(
+            f'{row["id"]}@{row.get(self.last_modified_field)}' if isinstance(row, dict)
+            else f'{row.pk}@{getattr(row, self.last_modified_field)}'
+            for row in page
+        )
+        links = f'{self.paginator.get_next_link()}:{self.paginator.get_previous_link()}'
+        user = request.user.pk if request.user.is_authenticated else None
+        media_type = getattr(request, 'accepted_media_type', '')
+        version = f'{request.get_full_path()}:{user}:{media_type}:{links}:{rows}'
+        return f'W/"{hashlib.md5(version.encode()).hexdigest()}"'
+
+    def paginate_queryset(self, queryset):
+        # ETag списка считается по уже выбранной странице, 304 - до сериализации
+        page = super().paginate_queryset(queryset)
+        request = self.request
+        if page is not None and request.method in ('GET', 'HEAD') and self.get_conditional_target(request) == 'list':
+            self.etag = self.get_list_etag(request, page)
+            if etag_matches(request.headers.get('If-None-Match'), self.etag):
+                raise NotModified()
+        return page
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.last_modified = None
+        target = self.get_conditional_target(request)
+        safe = request.method in ('GET', 'HEAD')
+
+        if target == 'object':
+            instance = self.get_object()
+            self.etag = self.get_object_etag(instance)
+            self.last_modified = getattr(instance, self.last_modified_field)
+            if safe:
+                self.check_not_modified(request)
+            else:
+                self.check_preconditions(request)
+
+    def check_not_modified(self, request):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            # If-None-Match важнее If-Modified-Since
+            if etag_matches(if_none_match, self.etag):
+                raise NotModified()
+            return
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+        if since is not None and self.last_modified is not None and int(self.last_modified.timestamp()) <= since:
+            raise NotModified()
+
+    def check_preconditions(self, request):
+        if_match = request.headers.get('If-Match')
+        if if_match:
+            if not etag_matches(if_match, self.etag, weak=False):
+                raise PreconditionFailed()
+            return
+        since = parse_http_date_safe(request.headers.get('If-Unmodified-Since') or '')
+        if since is not None:
+            if self.last_modified is None or int(self.last_modified.timestamp()) > since:
+                raise PreconditionFailed()
+        elif self.require_if_match:
+            raise PreconditionRequired()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            self.set_validators(response)
+            return response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (status.HTTP_200_OK, status.HTTP_201_CREATED):
+            if request.method not in ('GET', 'HEAD'):
+                # После изменения отдаем новую версию объекта
+                instance = self._conditional_object
+                self.etag = self.get_object_etag(instance)
+                self.last_modified = getattr(instance, self.last_modified_field)
+            self.set_validators(response)
+        return response
+
+    def set_validators(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified.timestamp())
+
+
+class ResponseCacheHit(Exception):
+    def __init__(self, entry):
+        self.entry = entry
+
+
+class CachedResponseMixin:
+    """
+    Кэш готовых JSON-ответов на GET списка и объекта.
+
+    Ключ - URL с параметрами, формат ответа и поколения данных из cache_dependencies
+    (их увеличивают сигналы после коммита, см. signals.py), поэтому после изменения
+    данных старые ответы больше не отдаются. Если queryset зависит от пользователя,
+    cache_vary_on_user = True. Кэш проверяется после аутентификации и проверки прав;
+    объекты кэшируются, только если у представления нет прав на уровне объекта.
+    Без общего кэша (см. RESPONSE_CACHE['REQUIRE_SHARED_CACHE']) кэш ответов выключен.
+    Ответ в браузерном API не кэшируется: в нем есть данные пользователя и CSRF-токен.
+    """
+    cache_dependencies = ('book', 'genre')
+    cache_vary_on_user = False
+    cache_actions = ('list', 'retrieve')
+    cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.response_cache = ResponseCache(cls.__name__, cls.cache_dependencies, cls.cache_timeout)
+
+    def get_cache_action(self):
+        action = getattr(self, 'action', None)
+        if action is None:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            action = 'retrieve' if lookup_url_kwarg in self.kwargs else 'list'
+        return action
+
+    def has_object_permissions(self):
+        return any(
+            type(permission).has_object_permission is not BasePermission.has_object_permission
+            for permission in self.get_permissions()
+        )
+
+    def is_response_cacheable(self, request):
+        if not self.response_cache.enabled or request.method not in ('GET', 'HEAD'):
+            return False
+        if request.accepted_renderer.format != 'json':
+            return False
+        action = self.get_cache_action()
+        if action not in self.cache_actions:
+            return False
+        return action != 'retrieve' or not self.has_object_permissions()
+
+    def get_response_cache_key(self, request):
+        user = request.user.pk if self.cache_vary_on_user and request.user.is_authenticated else None
+        return self.response_cache.make_key(request.get_full_path(), request.accepted_media_type, user)
+
+    def initial(self, request, *args, **kwargs):
+        self.response_cache_key = None
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        # Последний шаг APIView.initial: кэш проверяется после аутентификации, прав и троттлинга,
+        # но до загрузки объекта в ConditionalRequestMixin.initial - попадание обходится без запросов
+        super().check_throttles(request)
+        if self.is_response_cacheable(request):
+            self.response_cache_key = self.get_response_cache_key(request)
+            entry = self.response_cache.get(self.response_cache_key)
+            if entry is not None:
+                raise ResponseCacheHit(entry)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ResponseCacheHit):
+            content, content_type, etag = exc.entry
+            if etag and etag_matches(self.request.headers.get('If-None-Match'), etag):
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = HttpResponse(content, content_type=content_type)
+            if etag:
+                response['ETag'] = etag
+            response['X-Cache'] = 'HIT'
+            return response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+        if key and isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+            response['X-Cache'] = 'MISS'
+            # Сохраняем уже отрендеренное тело (и ETag, см. ConditionalRequestMixin),
+            # чтобы при попадании не сериализовать заново
+            response.add_post_render_callback(
+                lambda rendered: self.response_cache.set(
+                    key, (rendered.content, rendered['Content-Type'], rendered.get('ETag')),
+                )
+            )
+        return response
@@ -1,11 +1,17 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
 from rest_framework.authtoken.admin import User
 
-from newapp.managers import SoftDeleteManager
+from newapp.managers import SoftDeleteManager, SoftDeleteQuerySet
+
+LIVE_BOOKS = models.Q(is_deleted=False)
 
 
 class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    # Денормализованные счетчики неудаленных книг, обновляются сигналами (см. counters.py)
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    bestseller_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -36,9 +42,133 @@ class Book(models.Model):
     is_deleted = models.BooleanField(default=False)  # Поле для мягкого удаления
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='books', null=True, blank=True)
     updated_at = models.DateTimeField(null=True, blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()  # Вместе с удаленными книгами
+
+    class Meta:
+        # SoftDeleteManager всегда добавляет is_deleted=False, поэтому индексы частичные:
+        # удаленные книги в них не попадают (на БД без частичных индексов условие игнорируется)
+        indexes = [
+            # Составные индексы для keyset-пагинации (pagination.BookKeysetPagination)
+            models.Index(fields=['published_date', 'id'], name='book_live_published_id_idx', condition=LIVE_BOOKS),
+            models.Index(fields=['price', 'id'], name='book_live_price_id_idx', condition=LIVE_BOOKS),
+            # UserBookListView: owner=... с сортировкой по дате
+            models.Index(fields=['owner', 'published_date', 'id'], name='book_live_owner_idx', condition=LIVE_BOOKS),
+            # BookListCreateView: фильтры author / is_bestseller
+            models.Index(fields=['author', 'is_bestseller'], name='book_live_author_idx', condition=LIVE_BOOKS),
+            # purge_deleted_books: удаленные книги старше срока хранения
+            models.Index(fields=['deleted_at'], name='book_deleted_at_idx', condition=~LIVE_BOOKS),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения из БД: по ним сигналы вычисляют, что изменилось при сохранении
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Счетчики жанров и статистика цен обновляются в post_save - в той же транзакции, что и книга
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+        self.refresh_loaded_values()
+
+    def refresh_loaded_values(self):
+        # После сохранения текущие значения становятся значениями из БД
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
 
     def delete(self, *args, **kwargs):
         self.is_deleted = True
+        self.deleted_at = timezone.now()
         self.save()
+
+    def hard_delete(self, *args, **kwargs):
+        return super().delete(*args, **kwargs)
+
+
+class CatalogPriceStats(models.Model):
+    """
+    Единственная строка с суммой и количеством цен неудаленных книг.
+    Обновляется сигналами Book, сверяется командой reconcile_price_stats.
+    """
+    price_sum = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    priced_count = models.PositiveIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def load(cls):
+        # Строку создает миграция 0014 (или reconcile_price_stats) - чтение ничего не пишет.
+        # Без строки статистика пустая: средней цены нет
+        return cls.objects.filter(pk=1).first() or cls(pk=1)
+
+    @property
+    def average_price(self):
+        if not self.priced_count:
+            return None
+        return self.price_sum / self.priced_count
+
+
+class ArchivedBook(models.Model):
+    """
+    Удаленная книга, перенесенная командой purge_deleted_books из таблицы книг.
+    Связи хранятся как id без внешних ключей: архив не зависит от удаления издательств и пользователей.
+    """
+    id = models.BigIntegerField(primary_key=True)  # id книги
+    title = models.CharField(max_length=200)
+    author = models.CharField(max_length=100)
+    published_date = models.DateField()
+    publisher_id = models.BigIntegerField(null=True, blank=True)
+    owner_id = models.IntegerField(null=True, blank=True)
+    genre_ids = models.JSONField(default=list)
+    created_at = models.DateTimeField(null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    discounted_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    is_bestseller = models.BooleanField(default=False)
+    is_banned = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+
+class OutboxMessage(models.Model):
+    """
+    Задача фоновой очереди newapp.tasks. Строка создается в той же транзакции,
+    что и изменение данных (Book.save, BookSerializer.create/update и массовые
+    операции выполняются в transaction.atomic), поэтому задача не теряется при
+    падении процесса. Выполненные задачи старше TASK_QUEUE['RETENTION_DAYS']
+    удаляет команда process_outbox.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'task', 'available_at'], name='outbox_status_task_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk} ({self.status})'
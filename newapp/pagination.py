@@ -1,5 +1,13 @@
-from rest_framework.pagination import CursorPagination, PageNumberPagination
+import base64
+import json
+from collections import namedtuple
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q, prefetch_related_objects
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomCursorPagination(CursorPagination):
@@ -18,3 +26,243 @@ class CustomPagination(PageNumberPagination):
             'next_link': self.get_next_link(),
             'results': data
         })
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """
+    PageNumberPagination с apaginate_queryset для async ORM: COUNT и страница через LIMIT/OFFSET,
+    ответ и ошибки те же. Номер страницы проверяет обычный Paginator, но по range(count).
+    """
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(range(await queryset.acount()), page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        bounds = self.page.object_list  # срез range: границы страницы
+        self.page.object_list = [row async for row in queryset[bounds.start:bounds.stop]]
+        return list(self.page)
+
+
+Position = namedtuple('Position', ['ordering', 'value', 'pk', 'reverse'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по составному ключу (ordering_field, id).
+    Каждая страница - поиск по индексу (ordering_field, id) без OFFSET,
+    поэтому время ответа не зависит от номера страницы. NULL-значения идут
+    первыми при сортировке по возрастанию и последними при сортировке по убыванию.
+    COUNT(*) выполняется только по запросу (?with_count=true).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    count_query_param = 'with_count'
+    ordering = 'id'
+    ordering_fields = ()
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.setup(queryset, request)
+        self.count = queryset.count() if self.should_count(request) else None
+
+        # prefetch_related выполняем один раз для всей страницы, а не для каждого диапазона
+        prefetch_lookups = queryset._prefetch_related_lookups
+        results = []
+        for condition, ordering in self.get_segments(self.ascending, self.position):
+            limit = self.page_size + 1 - len(results)
+            if limit <= 0:
+                break
+            results.extend(queryset.prefetch_related(None).filter(condition).order_by(*ordering)[:limit])
+
+        results = self.set_page(results)
+        if prefetch_lookups:
+            prefetch_related_objects(results, *prefetch_lookups)
+        return results
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        paginate_queryset для асинхронных представлений (async ORM). prefetch_related
+        не поддерживается - queryset должен отдавать готовые строки (например, .values()).
+        """
+        self.setup(queryset, request)
+        self.count = await queryset.acount() if self.should_count(request) else None
+
+        results = []
+        for condition, ordering in self.get_segments(self.ascending, self.position):
+            limit = self.page_size + 1 - len(results)
+            if limit <= 0:
+                break
+            results.extend([row async for row in queryset.filter(condition).order_by(*ordering)[:limit]])
+        return self.set_page(results)
+
+    def setup(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering_value = self.get_ordering(request)
+        self.field_name = self.ordering_value.lstrip('-')
+        self.nullable = queryset.model._meta.get_field(self.field_name).null
+        self.position = self.decode_cursor(request, queryset.model)
+        self.reverse = self.position is not None and self.position.reverse
+        self.ascending = self.ordering_value.startswith('-') == self.reverse
+
+    def set_page(self, results):
+        """
+        Обрезает лишнюю строку (признак следующей страницы) и запоминает страницу.
+        """
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = results
+        return results
+
+    def get_segments(self, ascending, position):
+        """
+        Диапазоны индекса, которые читаются по порядку, пока не наберется страница.
+        NULL и не-NULL значения выбираются отдельными запросами, чтобы
+        каждый запрос оставался поиском по индексу без OR по NULL.
+        """
+        field = self.field_name
+        sign = '' if ascending else '-'
+        values_order = (f'{sign}{field}', f'{sign}id') if field != 'id' else (f'{sign}id',)
+        nulls_order = (f'{sign}id',)
+        is_null = Q(**{f'{field}__isnull': True})
+        not_null = Q(**{f'{field}__isnull': False}) if self.nullable else Q()
+        after, before = ('gt', 'lt') if ascending else ('lt', 'gt')
+
+        if position is None:
+            segments = [(is_null, nulls_order, True), (not_null, values_order, False)]
+        elif position.value is None:
+            segments = [(is_null & Q(**{f'id__{after}': position.pk}), nulls_order, True)]
+            if ascending:
+                segments.append((not_null, values_order, False))
+        else:
+            value = position.value
+            condition = Q(**{f'{field}__{after}e': value}) & (
+                Q(**{f'{field}__{after}': value}) | Q(**{f'id__{after}': position.pk})
+            )
+            segments = [(condition, values_order, False)]
+            if not ascending:
+                segments.append((is_null, nulls_order, True))
+
+        if not ascending:
+            # По убыванию NULL идут последними
+            segments.sort(key=lambda segment: segment[2])
+        return [(condition, ordering) for condition, ordering, nulls in segments if self.nullable or not nulls]
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size and page_size.isdigit() and int(page_size) > 0:
+            return min(int(page_size), self.max_page_size)
+        return self.page_size
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering and ordering.lstrip('-') in self.ordering_fields:
+            return ordering
+        return self.ordering
+
+    def should_count(self, request):
+        return request.query_params.get(self.count_query_param, 'false').lower() == 'true'
+
+    def order_queryset(self, queryset, request):
+        """
+        Порядок первой страницы - используется командой explain.
+        """
+        ordering = self.get_ordering(request)
+        prefix = '-' if ordering.startswith('-') else ''
+        return queryset.order_by(ordering, f'{prefix}id')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if data['o'] != self.ordering_value:
+                raise ValueError(data['o'])
+            field = model._meta.get_field(self.field_name)
+            value = None if data['v'] is None else field.to_python(data['v'])
+            return Position(data['o'], value, int(data['id']), bool(data['r']))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        value = self.get_row_value(row, self.field_name)
+        data = {
+            'o': self.ordering_value,
+            'v': None if value is None else str(value),
+            'id': self.get_row_value(row, 'id'),
+            'r': int(reverse),
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_row_value(self, row, name):
+        # Строки могут быть экземплярами модели или словарями из .values()
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class BookKeysetPagination(KeysetPagination):
+    ordering = '-published_date'
+    ordering_fields = ('published_date', 'price', 'id')
+
+
+class BookDateRangePagination(KeysetPagination):
+    ordering = 'published_date'
+    ordering_fields = ('published_date',)
+
+
+class BookPricePagination(KeysetPagination):
+    ordering = '-price'
+    ordering_fields = ('price',)
@@ -7,6 +7,10 @@ class CanGetStatisticPermission(BasePermission):
     def has_permission(self, request, view):
         return request.user.has_perm('newapp.can_get_statistic')
 
+    async def ahas_permission(self, request, view):
+        # Для async-представлений: права пользователя загружаются через async ORM
+        return await request.user.ahas_perm('newapp.can_get_statistic')
+
 
 class IsOwnerOrReadOnly(BasePermission):
     """
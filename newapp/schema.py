@@ -0,0 +1,214 @@
+import hashlib
+import inspect
+import logging
+import os
+import sys
+import threading
+from pathlib import Path
+
+import drf_yasg
+import rest_framework
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils.cache import patch_cache_control
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import get_schema_view
+
+from .mixins import etag_matches
+
+logger = logging.getLogger(__name__)
+
+# Готовые схемы по имени (для команды generate_schema)
+schemas = {}
+
+
+def get_options():
+    options = getattr(settings, 'API_SCHEMA', {})
+    return {
+        'DIRECTORY': Path(options.get('DIRECTORY', Path(settings.BASE_DIR) / 'schema')),
+        'MAX_AGE': options.get('MAX_AGE', 86400),
+        'AUTO_REGENERATE': options.get('AUTO_REGENERATE', False),
+    }
+
+
+def iter_patterns(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern), pattern.callback
+
+
+def get_source_modules(resolver):
+    """
+    Модули проекта, от которых зависит схема: URLConf, представления (с базовыми
+    классами), их сериализаторы и модели сериализаторов.
+    """
+    modules = set()
+
+    def add_class(cls):
+        for klass in inspect.getmro(cls):
+            modules.add(klass.__module__)
+
+    def add_resolver(resolver):
+        modules.add(getattr(resolver.urlconf_module, '__name__', None))
+        for pattern in resolver.url_patterns:
+            if isinstance(pattern, URLResolver):
+                add_resolver(pattern)
+
+    add_resolver(resolver)
+    for _, callback in iter_patterns(resolver.url_patterns):
+        view = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+        if view is None:
+            modules.add(callback.__module__)
+            continue
+        add_class(view)
+        serializer_class = getattr(view, 'serializer_class', None)
+        if serializer_class is not None:
+            add_class(serializer_class)
+            model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+            if model is not None:
+                modules.add(model.__module__)
+    return modules
+
+
+def get_fingerprint(urlconf=None):
+    """
+    Хеш URL-маршрутов, исходников модулей проекта из get_source_modules и версий
+    DRF/drf_yasg: меняется, только если может измениться сама схема.
+    """
+    resolver = get_resolver(urlconf)
+    digest = hashlib.sha256(f'{drf_yasg.__version__}:{rest_framework.VERSION}'.encode())
+    for route, callback in iter_patterns(resolver.url_patterns):
+        view = getattr(callback, 'cls', None) or callback
+        actions = getattr(callback, 'actions', None)
+        digest.update(f'{route}:{view.__module__}.{view.__qualname__}:{sorted((actions or {}).items())}\n'.encode())
+
+    base_dir = os.path.realpath(settings.BASE_DIR)
+    for name in sorted(filter(None, get_source_modules(resolver))):
+        path = getattr(sys.modules.get(name), '__file__', None)
+        # Код библиотек учтен версиями выше
+        if path and os.path.realpath(path).startswith(base_dir + os.sep):
+            with open(path, 'rb') as f:
+                digest.update(name.encode() + b':' + hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class PrecomputedSchema:
+    """
+    Схема OpenAPI, сгенерированная заранее (команда generate_schema) и записанная
+    на диск в JSON и YAML. Пишет файлы только generate_schema: процесс читает их
+    один раз и ничего не записывает. Если отпечаток (get_fingerprint) не совпадает
+    с записанным, отдается устаревший файл с предупреждением в логе, а с AUTO_REGENERATE
+    (для разработки) схема строится заново в памяти. Если файлов нет, схема строится
+    в памяти с предупреждением.
+    """
+    formats = {'json': 'json', 'yaml': 'yaml'}
+
+    def __init__(self, name, view_class, options=None):
+        self.name = name
+        self.view_class = view_class
+        self.options = options or get_options()
+        self.directory = self.options['DIRECTORY']
+        self.lock = threading.Lock()
+        self.documents = None
+        schemas[name] = self
+
+    @property
+    def fingerprint_path(self):
+        return self.directory / f'{self.name}.fingerprint'
+
+    def path(self, fmt):
+        return self.directory / f'{self.name}.{self.formats[fmt]}'
+
+    def build(self):
+        view = self.view_class
+        generator = view.generator_class(view.info, url=view.url, patterns=view.patterns, urlconf=view.urlconf)
+        schema = generator.get_schema(None, public=True)
+        documents = {}
+        for renderer_class in view.renderer_classes:
+            if issubclass(renderer_class, _SpecRenderer) and renderer_class.format in ('json', 'yaml'):
+                documents[renderer_class.format] = renderer_class().render(schema)
+        return documents
+
+    def write(self, fingerprint=None):
+        fingerprint = fingerprint or get_fingerprint(self.view_class.urlconf)
+        documents = self.build()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Через временный файл и rename: другой процесс не прочитает наполовину записанный файл
+        for fmt, content in [*documents.items(), ('fingerprint', fingerprint.encode())]:
+            path = self.fingerprint_path if fmt == 'fingerprint' else self.path(fmt)
+            temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+            temporary.write_bytes(content)
+            os.replace(temporary, path)
+        return documents
+
+    def read(self):
+        try:
+            fingerprint = self.fingerprint_path.read_text().strip()
+            return fingerprint, {fmt: self.path(fmt).read_bytes() for fmt in self.formats}
+        except FileNotFoundError:
+            return None, None
+
+    def load(self):
+        fingerprint = get_fingerprint(self.view_class.urlconf)
+        stored_fingerprint, documents = self.read()
+        if documents is not None and stored_fingerprint == fingerprint:
+            return documents
+        if documents is None:
+            logger.warning('API schema %s is missing, run manage.py generate_schema', self.name)
+            return self.build()
+        if self.options['AUTO_REGENERATE']:
+            logger.info('Regenerating API schema %s in memory', self.name)
+            return self.build()
+        logger.warning('API schema %s is out of date, run manage.py generate_schema', self.name)
+        return documents
+
+    def get(self, fmt):
+        if self.documents is None:
+            with self.lock:
+                if self.documents is None:
+                    self.documents = {
+                        fmt: (content, f'"{hashlib.sha256(content).hexdigest()[:32]}"')
+                        for fmt, content in self.load().items()
+                    }
+        return self.documents[fmt]
+
+    def reset(self):
+        self.documents = None
+
+
+def get_precomputed_schema_view(info, name='openapi', **kwargs):
+    """
+    get_schema_view из drf_yasg, но спецификация (?format=openapi, .json, .yaml) не
+    собирается на каждый запрос, а берется из PrecomputedSchema и отдается с ETag
+    и Cache-Control: public, max-age. Схема публичная (public=True), поэтому одна для всех.
+    Страница UI по-прежнему рендерится drf_yasg - она схему не строит.
+    """
+    kwargs['public'] = True
+    base = get_schema_view(info, **kwargs)
+
+    class PrecomputedSchemaView(base):
+        urlconf = kwargs.get('urlconf')
+        url = kwargs.get('url')
+        patterns = kwargs.get('patterns')
+
+        def get(self, request, version='', format=None):
+            renderer = request.accepted_renderer
+            if not isinstance(renderer, _SpecRenderer):
+                return super().get(request, version, format)
+
+            codec_format = 'yaml' if renderer.format == 'yaml' else 'json'
+            content, etag = self.precomputed.get(codec_format)
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                response = HttpResponse(status=304)
+            else:
+                response = HttpResponse(content, content_type=f'{renderer.media_type}; charset=utf-8')
+            response['ETag'] = etag
+            patch_cache_control(response, public=True, max_age=self.precomputed.options['MAX_AGE'])
+            return response
+
+    PrecomputedSchemaView.info = info
+    PrecomputedSchemaView.precomputed = PrecomputedSchema(name, PrecomputedSchemaView)
+    return PrecomputedSchemaView
@@ -0,0 +1,127 @@
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+# Внешний FTS5-индекс (content=newapp_book): хранит только токены, текст читается из таблицы книг.
+# Синхронизируется триггерами, поэтому учитывает и bulk_create/update, и raw-удаление
+FTS_TABLE = 'newapp_book_fts'
+FTS_COLUMNS = ('title', 'author')
+BOOK_TABLE = 'newapp_book'
+
+TRIGGERS = {
+    'newapp_book_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS newapp_book_fts_insert AFTER INSERT ON {BOOK_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+        END""",
+    'newapp_book_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS newapp_book_fts_delete AFTER DELETE ON {BOOK_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        END""",
+    'newapp_book_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS newapp_book_fts_update AFTER UPDATE OF title, author ON {BOOK_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+        END""",
+}
+
+CREATE_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author,
+        content='{BOOK_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )"""
+
+
+def install_search_index(connection):
+    """
+    Создает FTS5-таблицу и триггеры, если их нет, и заполняет индекс заново.
+    Вызывается после каждого migrate (signals.restore_search_index): при пересоздании
+    таблицы книг (ALTER в SQLite) ее триггеры удаляются. SQL совпадает с миграцией 0017.
+    Возвращает True, если индекс перестроен.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        names = [FTS_TABLE, *TRIGGERS]
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names,
+        )
+        if {row[0] for row in cursor.fetchall()} == set(names):
+            return False
+        cursor.execute(CREATE_TABLE)
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    connection.book_search_index = True
+    return True
+
+
+def uninstall_search_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    connection.book_search_index = False
+
+
+def search_index_available(connection):
+    # Проверяется один раз на соединение
+    available = getattr(connection, 'book_search_index', None)
+    if available is None:
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                available = cursor.fetchone() is not None
+        connection.book_search_index = available
+    return available
+
+
+def build_match_query(terms, columns=FTS_COLUMNS):
+    """
+    Запрос FTS5 из поисковых слов: все слова обязательны, каждое ищется по началу
+    ("tolk" находит "Tolkien"). Спецсимволы FTS5 отбрасываются.
+    """
+    words = [word for term in terms for word in re.findall(r'\w+', term)]
+    if not words:
+        return None
+    query = ' '.join(f'"{word}"*' for word in words)
+    if set(columns) != set(FTS_COLUMNS):
+        query = f'{{{" ".join(columns)}}} : ({query})'
+    return query
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter по FTS5-индексу книг вместо LIKE '%...%'.
+
+    Результаты упорядочены по релевантности (bm25, атрибут search_rank - чем меньше,
+    тем релевантнее), пока порядок не задан дальше (OrderingFilter, пагинация).
+    Если индекса нет (не SQLite) или search_fields не покрываются индексом,
+    работает как обычный SearchFilter.
+    """
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        columns = [field.lstrip('^=@$') for field in search_fields]
+        match = build_match_query(search_terms, columns)
+        if (queryset.model._meta.db_table != BOOK_TABLE or not set(columns) <= set(FTS_COLUMNS)
+                or match is None or not search_index_available(connections[queryset.db])):
+            return super().filter_queryset(request, queryset, view)
+
+        # Индекс не модель Django (иначе он попал бы в dumpdata/loaddata), поэтому MATCH - подзапросом.
+        # rank коррелированным подзапросом считается только для возвращаемых строк; сортировка по нему
+        # вычисляет его для всех найденных книг, но пагинация обычно заменяет ее своим порядком
+        book_id = f'{connections[queryset.db].ops.quote_name(BOOK_TABLE)}.id'
+        return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])) \
+            .annotate(search_rank=RawSQL(
+                f'SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = {book_id}', [match],
+            )).order_by('search_rank')
@@ -1,5 +1,8 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import serializers
+from .instrumentation import timed
 from .models import Book, Publisher  # Импортируйте вашу модель
 from .validators import validate_title_length
 
@@ -7,6 +10,8 @@ from .models import Genre
 
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .tokens import FilteredRefreshToken
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -25,7 +30,56 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    # Черный список проверяется в БД, только если jti есть в фильтре Блума
+    token_class = FilteredRefreshToken
+
+
+class EagerLoadingMixin:
+    """
+    Сериализатор объявляет связи, которые он читает, а представление
+    подгружает их одним запросом вместо запроса на каждую строку.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+class TimedRepresentationMixin:
+    """
+    Время to_representation попадает в этап serialize заголовка Server-Timing.
+    """
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Берет связанные объекты из context['preloaded'] (см. bulk.preload_related)
+    вместо запроса к БД на каждый pk.
+    """
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        objects = self.context.get('preloaded', {}).get(queryset.model)
+        if objects is None or isinstance(data, bool) or not isinstance(data, (str, int)):
+            return super().to_internal_value(data)
+        try:
+            return objects[queryset.model._meta.pk.to_python(data)]
+        except DjangoValidationError:
+            return super().to_internal_value(data)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class GenreSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = '__all__'
@@ -37,9 +91,12 @@ class PublisherSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class BookDetailSerializer(serializers.ModelSerializer):
+class BookDetailSerializer(TimedRepresentationMixin, EagerLoadingMixin, serializers.ModelSerializer):
     publisher = PublisherSerializer()  # Вложенный сериализатор
 
+    select_related_fields = ('publisher',)
+    prefetch_related_fields = ('genres',)
+
     class Meta:
         model = Book
         fields = '__all__'
@@ -51,12 +108,24 @@ class BookListSerializer(serializers.ModelSerializer):
         fields = ['title', 'author']
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(TimedRepresentationMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    # publisher и owner отдаются как pk (publisher_id/owner_id), join не нужен
+    prefetch_related_fields = ('genres',)
 
     class Meta:
         model = Book
         fields = '__all__'
-        read_only_fields = ['owner']
+        # Мягкое удаление - только через DELETE: он обновляет счетчики и отправляет сигналы
+        read_only_fields = ['owner', 'is_deleted', 'deleted_at']
+
+    # Книга и ее жанры (m2m_changed обновляет счетчики жанров) сохраняются одной транзакцией
+    @transaction.atomic
+    def create(self, validated_data):
+        return super().create(validated_data)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         # Использование параметра include_related из контекста
@@ -93,5 +162,13 @@ class BookSerializer(serializers.ModelSerializer):
     #     return super().update(instance, validated_data)
 
 
+class BookBulkSerializer(BookSerializer):
+    """
+    BookSerializer для массовых операций: связи проверяются по заранее загруженным объектам.
+    """
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
 
+    class Meta(BookSerializer.Meta):
+        # Отметки времени выставляет bulk.py, а не клиент
+        read_only_fields = [*BookSerializer.Meta.read_only_fields, 'updated_at']
 
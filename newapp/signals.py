@@ -1,23 +1,50 @@
 import logging
+from functools import partial
 
-from django.db.models.signals import post_save, pre_save, post_delete
-from django.dispatch import receiver
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_save, post_delete, m2m_changed, pre_delete, post_migrate
+from django.dispatch import Signal, receiver
 from django.utils import timezone
+from .authentication import forget_user
+from .backends import GLOBAL_GENERATION, user_generation
+from .cache import bump_generation
+from .db import apply_sqlite_pragmas
+from .instrumentation import install_query_timer
+from .counters import apply_book_change, apply_genres_change, apply_price_change, adjust_price_stats, \
+    price_contribution, apply_bulk_genre_changes, apply_bulk_price_changes, book_state, apply_soft_delete
+from .managers import pre_soft_delete, post_soft_delete
 from .models import Book, Genre
+from .statistics import genre_statistic
+from .search import install_search_index
+from .tasks import enqueue
+from .tokens import blacklist_filter
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 from rest_framework.authtoken.models import Token
-from django.contrib.auth.models import User
-from django.core.mail import send_mail
+from django.contrib.auth.models import Group, Permission, User
+
+logger = logging.getLogger(__name__)
+
+# Массовые операции (newapp.bulk): один сигнал на пачку книг вместо post_save на каждую.
+# books - книги после операции, старые значения полей - в book._loaded_values (у новых книг его нет),
+# old_genre_ids / genre_ids - жанры книг до и после операции: {book_id: [genre_id, ...]}
+books_bulk_created = Signal()
+books_bulk_updated = Signal()
+books_bulk_deleted = Signal()
 
 
 @receiver(post_save, sender=Book)
 def notify_admin_on_new_order(sender, instance, created, **kwargs):
     if created:
-        send_mail(
-            'New Book Created',
-            f'Book {instance.id} has been created.',
-            'admin@gmail.com',
-            ['admin@gmail.com'],
-        )
+        # Письмо отправляется в фоне после коммита, книги за DIGEST_WINDOW собираются в одно письмо
+        enqueue('notify_books_created', {'book_id': instance.id})
+
+
+@receiver(books_bulk_created, sender=Book)
+def notify_admin_on_bulk_create(sender, books, **kwargs):
+    # Одна задача на всю пачку
+    enqueue('notify_books_created', {'book_ids': [book.pk for book in books]})
 
 
 @receiver(post_save, sender=User)
@@ -26,12 +53,19 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
         Token.objects.create(user=instance)
 
 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    # Кэш пользователей CachedJWTAuthentication
+    forget_user(instance)
+
+
 @receiver(post_save, sender=Book)
 def book_saved(sender, instance, created, **kwargs):
     if created:
-        print(f'New book created: {instance.title}')
+        logger.info('New book created: %s', instance.title, extra={'book_id': instance.pk})
     else:
-        print(f'Book updated: {instance.title}')
+        logger.debug('Book updated: %s', instance.title, extra={'book_id': instance.pk})
 
 # # Подключение функции-обработчика к сигналу
 # post_save.connect(book_saved, sender=Book)
@@ -44,9 +78,203 @@ def update_timestamp(sender, instance, **kwargs):
 # Подключение функции-обработчика к сигналу
 pre_save.connect(update_timestamp, sender=Book)
 
-logger = logging.getLogger(__name__)
-
 
 @receiver(post_delete, sender=Book)
 def log_book_deletion(sender, instance, **kwargs):
-    logger.info(f'Book deleted: {instance.name}')
+    logger.info('Book deleted: %s', instance.title, extra={'book_id': instance.pk})
+
+
+# Счетчики жанров. Обработчики объявлены до сброса кэша статистики, который читает эти счетчики
+@receiver(post_save, sender=Book)
+def update_genre_counters(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        apply_book_change(instance, created)
+
+
+@receiver(pre_delete, sender=Book)
+def update_genre_counters_on_hard_delete(sender, instance, **kwargs):
+    genre_ids = list(instance.genres.values_list('pk', flat=True))
+    apply_genres_change([(instance.is_deleted, instance.is_bestseller)], genre_ids, -1)
+
+
+# Статистика цен каталога для ExpensiveBooksView
+@receiver(post_save, sender=Book)
+def update_price_stats(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        apply_price_change(instance, created)
+
+
+@receiver(post_delete, sender=Book)
+def update_price_stats_on_hard_delete(sender, instance, **kwargs):
+    price_sum, priced_count = price_contribution(instance.is_deleted, instance.price)
+    adjust_price_stats(-price_sum, -priced_count)
+
+
+def changed_ids(instance, action, pk_set, cleared_attr):
+    # id, действительно связанные или отвязанные операцией (см. update_genre_counters_on_genres_change)
+    if action == 'post_clear':
+        return getattr(instance, cleared_attr)
+    if action == 'post_remove':
+        return instance._removed_ids
+    return pk_set
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def update_genre_counters_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    sign = {'post_add': 1, 'post_remove': -1, 'post_clear': -1}.get(action)
+    if action == 'pre_remove':
+        # В pk_set remove() попадают и id, которые не были связаны: запоминаем только связанные
+        if not reverse:
+            linked = sender.objects.filter(book_id=instance.pk, genre_id__in=pk_set).values_list('genre_id', flat=True)
+        else:
+            linked = sender.objects.filter(genre_id=instance.pk, book_id__in=pk_set).values_list('book_id', flat=True)
+        instance._removed_ids = list(linked)
+    elif not reverse:
+        # book.genres.add/remove/clear: pk_set - id жанров (add уже исключает связанные)
+        if action == 'pre_clear':
+            instance._cleared_genre_ids = list(instance.genres.values_list('pk', flat=True))
+        elif sign:
+            genre_ids = changed_ids(instance, action, pk_set, '_cleared_genre_ids')
+            apply_genres_change([(instance.is_deleted, instance.is_bestseller)], genre_ids, sign)
+    else:
+        # genre.books.add/remove/clear: pk_set - id книг, удаленные книги в счетчики не входят
+        if action == 'pre_clear':
+            instance._cleared_book_ids = list(instance.books.values_list('pk', flat=True))
+        elif sign:
+            book_ids = changed_ids(instance, action, pk_set, '_cleared_book_ids')
+            book_states = Book.objects.filter(pk__in=book_ids).values_list('is_deleted', 'is_bestseller')
+            apply_genres_change(book_states, [instance.pk], sign)
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def touch_books_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # Жанры входят в представление книги, поэтому их изменение меняет версию книги (ETag)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    now = timezone.now()
+    if not reverse:
+        instance.updated_at = now
+        book_ids = [instance.pk]
+    else:
+        book_ids = changed_ids(instance, action, pk_set, '_cleared_book_ids')
+    Book.all_objects.filter(pk__in=list(book_ids)).update(updated_at=now)
+
+
+@receiver(books_bulk_created, sender=Book)
+@receiver(books_bulk_updated, sender=Book)
+@receiver(books_bulk_deleted, sender=Book)
+def update_counters_in_bulk(sender, books, genre_ids, old_genre_ids=None, **kwargs):
+    old_genre_ids = old_genre_ids or {}
+    states = [(book_state(getattr(book, '_loaded_values', None)), book_state(vars(book))) for book in books]
+    apply_bulk_genre_changes([
+        (old_state, old_genre_ids.get(book.pk, ()), new_state, genre_ids.get(book.pk, ()))
+        for book, (old_state, new_state) in zip(books, states)
+    ])
+    apply_bulk_price_changes(states)
+
+
+@receiver(pre_soft_delete, sender=Book)
+def update_counters_on_soft_delete(sender, queryset, **kwargs):
+    # Book.objects.filter(...).delete(): один UPDATE на пачку, поэтому post_save не отправляется
+    apply_soft_delete(queryset)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_soft_delete, sender=Book)
+@receiver(books_bulk_created, sender=Book)
+@receiver(books_bulk_updated, sender=Book)
+@receiver(books_bulk_deleted, sender=Book)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_genre_statistic(sender, using=None, **kwargs):
+    # После коммита, как и поколения ниже: иначе фоновый пересчет может закэшировать незакоммиченные счетчики
+    transaction.on_commit(genre_statistic.invalidate, using=using)
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def invalidate_genre_statistic_on_genres_change(sender, action, using=None, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(genre_statistic.invalidate, using=using)
+
+
+def bump_generation_on_commit(name, using=None):
+    # До коммита другой запрос прочитает старые данные и сохранит их под новым поколением
+    transaction.on_commit(partial(bump_generation, name), using=using)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_soft_delete, sender=Book)
+@receiver(books_bulk_created, sender=Book)
+@receiver(books_bulk_updated, sender=Book)
+@receiver(books_bulk_deleted, sender=Book)
+@receiver(m2m_changed, sender=Book.genres.through)
+def invalidate_book_responses(sender, using=None, action=None, **kwargs):
+    if action is None or action.startswith('post_'):
+        bump_generation_on_commit('book', using)
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_genre_responses(sender, using=None, **kwargs):
+    bump_generation_on_commit('genre', using)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_all_permissions(sender, using=None, action=None, **kwargs):
+    if action is None or action.startswith('post_'):
+        bump_generation_on_commit(GLOBAL_GENERATION, using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_permissions(sender, instance, using=None, **kwargs):
+    # is_active и is_superuser тоже влияют на набор прав
+    bump_generation_on_commit(user_generation(instance.pk), using)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions_on_change(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_generation_on_commit(user_generation(instance.pk), using)
+    elif pk_set is None:
+        # group.user_set.clear(): затронутые пользователи неизвестны
+        bump_generation_on_commit(GLOBAL_GENERATION, using)
+    else:
+        for user_id in pk_set:
+            bump_generation_on_commit(user_generation(user_id), using)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def update_blacklist_filter(sender, instance, created, using=None, **kwargs):
+    if created:
+        blacklist_filter.add(instance.token.jti, using)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    apply_sqlite_pragmas(connection)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    # SQLite пересоздает таблицу при ALTER и удаляет ее триггеры - восстанавливаем FTS-индекс,
+    # если миграция с ним применена (после отката миграции индекс не нужен)
+    if sender.name != 'newapp':
+        return
+    connection = connections[using]
+    if ('newapp', '0017_book_search_index') in MigrationRecorder(connection).applied_migrations():
+        install_search_index(connection)
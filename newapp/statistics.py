@@ -0,0 +1,19 @@
+from .cache import StaleWhileRevalidateCache
+from .models import Genre
+
+
+def compute_genre_statistic():
+    # Счетчики поддерживаются сигналами (см. counters.py), агрегировать книги не нужно
+    genres = Genre.objects.order_by('id').values_list('id', 'name', 'book_count', 'bestseller_count')
+    return [
+        {
+            "id": genre_id,
+            "genre": name,
+            "book_count": book_count,
+            "bestseller_count": bestseller_count
+        }
+        for genre_id, name, book_count, bestseller_count in genres
+    ]
+
+
+genre_statistic = StaleWhileRevalidateCache('genre-statistic', compute_genre_statistic)
@@ -0,0 +1,262 @@
+import logging
+import queue
+import threading
+import traceback
+import uuid
+from collections import namedtuple, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+_options = getattr(settings, 'TASK_QUEUE', {})
+WORKERS = _options.get('WORKERS', 2)
+MAX_QUEUE_SIZE = _options.get('MAX_QUEUE_SIZE', 1000)
+MAX_ATTEMPTS = _options.get('MAX_ATTEMPTS', 5)
+RETRY_DELAY = _options.get('RETRY_DELAY', 10)
+DIGEST_WINDOW = _options.get('DIGEST_WINDOW', 10)
+PROCESSING_TIMEOUT = _options.get('PROCESSING_TIMEOUT', 300)
+EAGER = _options.get('EAGER', False)
+RETENTION_DAYS = _options.get('RETENTION_DAYS', 7)
+
+Task = namedtuple('Task', ['name', 'func', 'digest'])
+
+registry = {}
+
+
+def task(name, digest=False):
+    """
+    Регистрирует обработчик задачи.
+    Обычная задача вызывается как func(**payload), дайджест - как func([payload, ...])
+    со всеми задачами, накопившимися за DIGEST_WINDOW секунд.
+    """
+    def decorator(func):
+        registry[name] = Task(name, func, digest)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, using=None):
+    """
+    Сохраняет задачу в outbox в текущей транзакции и передает ее воркеру после коммита.
+    При откате транзакции задача не выполняется.
+    """
+    if name not in registry:
+        raise ValueError(f'Unknown task "{name}"')
+    message = OutboxMessage.objects.using(using).create(
+        task=name,
+        payload=payload or {},
+        available_at=timezone.now() + timedelta(seconds=delay),
+    )
+    transaction.on_commit(lambda: worker.dispatch(message.task, message.pk, delay), using=using)
+    return message
+
+
+def claim_messages(limit=None, **filters):
+    """
+    Атомарно переводит готовые к выполнению задачи в processing и возвращает их.
+    Метка locked_by отличает задачи, захваченные этим вызовом, от захваченных параллельно.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(status=OutboxMessage.PENDING, available_at__lte=now, **filters)
+    if limit is not None:
+        due = OutboxMessage.objects.filter(pk__in=due.order_by('id').values('pk')[:limit])
+    due.filter(status=OutboxMessage.PENDING).update(status=OutboxMessage.PROCESSING, locked_by=token, locked_at=now)
+    return list(OutboxMessage.objects.filter(locked_by=token, status=OutboxMessage.PROCESSING).order_by('id'))
+
+
+def release_stale_messages():
+    """
+    Возвращает в очередь задачи, зависшие в processing (процесс упал во время выполнения).
+    """
+    deadline = timezone.now() - timedelta(seconds=PROCESSING_TIMEOUT)
+    return OutboxMessage.objects.filter(status=OutboxMessage.PROCESSING, locked_at__lt=deadline).update(
+        status=OutboxMessage.PENDING, locked_by='', locked_at=None,
+    )
+
+
+def run_messages(messages):
+    """
+    Выполняет захваченные задачи: обычные по одной, дайджесты - одним вызовом на тип.
+    Возвращает задержку до повтора, если что-то упало и будет повторено, иначе None.
+    """
+    groups = defaultdict(list)
+    for message in messages:
+        task = registry.get(message.task)
+        if task is None:
+            _fail([message], f'Unknown task "{message.task}"', retry=False)
+        else:
+            groups[task, None if task.digest else message.pk].append(message)
+
+    retry_delay = None
+    for (task, message_id), group in groups.items():
+        try:
+            if task.digest:
+                task.func([message.payload for message in group])
+            else:
+                task.func(**group[0].payload)
+        except Exception:
+            logger.exception('Task %s failed', task.name)
+            delay = _fail(group, traceback.format_exc())
+            if delay is not None:
+                retry_delay = delay if retry_delay is None else min(retry_delay, delay)
+        else:
+            OutboxMessage.objects.filter(pk__in=[message.pk for message in group]).update(
+                status=OutboxMessage.DONE, locked_by='', last_error='',
+            )
+    return retry_delay
+
+
+def _fail(messages, error, retry=True):
+    attempts = max(message.attempts for message in messages) + 1
+    ids = [message.pk for message in messages]
+    if not retry or attempts >= MAX_ATTEMPTS:
+        OutboxMessage.objects.filter(pk__in=ids).update(
+            status=OutboxMessage.FAILED, attempts=F('attempts') + 1, locked_by='', last_error=error,
+        )
+        return None
+    # Экспоненциальная задержка: RETRY_DELAY, 2 * RETRY_DELAY, 4 * RETRY_DELAY...
+    delay = RETRY_DELAY * 2 ** (attempts - 1)
+    OutboxMessage.objects.filter(pk__in=ids).update(
+        status=OutboxMessage.PENDING,
+        attempts=F('attempts') + 1,
+        available_at=timezone.now() + timedelta(seconds=delay),
+        locked_by='',
+        last_error=error,
+    )
+    return delay
+
+
+def process_outbox(batch_size=100, task=None):
+    """
+    Синхронно выполняет все готовые задачи outbox (используется командой process_outbox).
+    Возвращает количество обработанных задач.
+    """
+    release_stale_messages()
+    filters = {'task': task} if task else {}
+    processed = 0
+    while True:
+        messages = claim_messages(limit=batch_size, **filters)
+        if not messages:
+            return processed
+        run_messages(messages)
+        processed += len(messages)
+
+
+def purge_finished_messages(days=RETENTION_DAYS, batch_size=1000):
+    """
+    Удаляет выполненные задачи старше days дней пачками по batch_size (None - хранить все).
+    Возвращает количество удаленных задач.
+    """
+    if days is None:
+        return 0
+    deadline = timezone.now() - timedelta(days=days)
+    finished = OutboxMessage.objects.filter(status=OutboxMessage.DONE, created_at__lt=deadline).order_by('id')
+    deleted = 0
+    while True:
+        pks = list(finished.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += OutboxMessage.objects.filter(pk__in=pks).delete()[0]
+
+
+class Worker:
+    """
+    Пул потоков с ограниченной очередью. Если очередь переполнена, задача остается
+    в outbox и будет выполнена командой process_outbox.
+    """
+    def __init__(self, workers, max_queue_size):
+        self.workers = workers
+        self.queue = queue.Queue(max_queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+        self.scheduled_digests = set()
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'newapp-tasks-{number}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, job, *args):
+        self.start()
+        try:
+            self.queue.put_nowait((job, args))
+            return True
+        except queue.Full:
+            logger.warning('Task queue is full, %s left in the outbox', job.__name__)
+            return False
+
+    def schedule(self, delay, job, *args):
+        if delay <= 0:
+            return self.submit(job, *args)
+        timer = threading.Timer(delay, self.submit, (job, *args))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def dispatch(self, name, message_id, delay=0):
+        if registry[name].digest:
+            with self.lock:
+                if name in self.scheduled_digests:
+                    return
+                self.scheduled_digests.add(name)
+            job, args, delay = self.flush_digest, (name,), max(delay, DIGEST_WINDOW)
+        else:
+            job, args = self.run_message, (message_id,)
+        if EAGER:
+            job(*args)
+        else:
+            self.schedule(delay, job, *args)
+
+    def run_message(self, message_id):
+        retry_delay = run_messages(claim_messages(pk=message_id))
+        if retry_delay is not None and not EAGER:
+            self.schedule(retry_delay, self.run_message, message_id)
+
+    def flush_digest(self, name):
+        # Задачи, добавленные во время отправки, попадут в следующий дайджест
+        with self.lock:
+            self.scheduled_digests.discard(name)
+        retry_delay = run_messages(claim_messages(task=name))
+        if retry_delay is not None and not EAGER:
+            with self.lock:
+                self.scheduled_digests.add(name)
+            self.schedule(retry_delay, self.flush_digest, name)
+
+    def _run(self):
+        while True:
+            job, args = self.queue.get()
+            try:
+                job(*args)
+            except Exception:
+                logger.exception('Task worker failed')
+            finally:
+                connection.close()
+                self.queue.task_done()
+
+
+worker = Worker(WORKERS, MAX_QUEUE_SIZE)
+
+
+@task('notify_books_created', digest=True)
+def notify_books_created(payloads):
+    # Задача на одну книгу - {'book_id': ...}, на пачку из bulk-создания - {'book_ids': [...]}
+    book_ids = [book_id for payload in payloads for book_id in payload.get('book_ids', [payload.get('book_id')])]
+    if len(book_ids) == 1:
+        subject, message = 'New Book Created', f'Book {book_ids[0]} has been created.'
+    else:
+        subject = f'{len(book_ids)} New Books Created'
+        message = '\n'.join(f'Book {book_id} has been created.' for book_id in book_ids)
+    send_mail(subject, message, 'admin@gmail.com', ['admin@gmail.com'])
@@ -0,0 +1,33 @@
+from contextlib import ExitStack
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+def assert_list_queries_constant(client, url, page_sizes=(1, 10)):
+    """
+    Проверка для тестов: число SQL-запросов списочного эндпоинта
+    не должно зависеть от размера страницы (ловит N+1).
+    """
+    view_class = resolve(url.split('?')[0]).func.cls
+    pagination_class = view_class.pagination_class
+    counts = {}
+    with ExitStack() as stack:
+        response_cache = getattr(view_class, 'response_cache', None)
+        if response_cache is not None:
+            # Иначе повторный запрос отдается из кэша ответов (CachedResponseMixin) без обращения к БД
+            stack.enter_context(mock.patch.object(response_cache, 'enabled', False))
+        # Первый запрос заполняет кэши пользователей, токенов и прав - его не считаем
+        client.get(url)
+        for page_size in page_sizes:
+            with mock.patch.object(pagination_class, 'page_size', page_size), \
+                    CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+            counts[page_size] = len(context.captured_queries)
+
+    if len(set(counts.values())) > 1:
+        raise AssertionError(f'Query count for {url} grows with page size: {counts}')
+    return counts
@@ -1,3 +1,1019 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core import checks
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase, force_authenticate
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import user_cache, user_generation
+from .backends import check_permission_cache, permission_cache
+from .cache import ResponseCache, bump_generation, get_generations
+from .counters import rebuild_genre_counters, reconcile_price_stats
+from .fixtures import refresh_after_load
+from .instrumentation import current_timings
+from .middlewares import RequestMetricsMiddleware
+from .models import ArchivedBook, Book, Genre, OutboxMessage, Publisher
+from .schema import schemas
+from .search import FullTextSearchFilter
+from .serializers import BookSerializer
+from .statistics import genre_statistic
+from .tasks import purge_finished_messages
+from .views import BookViewSet, GenreViewSet, UserBookListView
+from .testing import assert_list_queries_constant
+from .tokens import GENERATION, BlacklistFilter, blacklist_filter, purge_expired_tokens
+
+
+class ListQueriesTest(APITestCase):
+    """
+    Число запросов списков книг и жанров не зависит от размера страницы.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='reader')
+        cls.user.user_permissions.add(Permission.objects.get(codename='can_get_statistic'))
+        genres = [Genre.objects.create(name=f'Genre {index}') for index in range(12)]
+        for index in range(12):
+            book = Book.objects.create(
+                title=f'Book {index}', author='Author', price=Decimal('10.00') + index,
+                published_date=date(2020, 1, 1) + timedelta(days=index), owner=cls.user,
+            )
+            book.genres.set(genres[index:index + 2])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_books(self):
+        assert_list_queries_constant(self.client, '/books/')
+        assert_list_queries_constant(self.client, '/books/?fast=true')
+
+    def test_user_books(self):
+        assert_list_queries_constant(self.client, '/user-book/')
+
+    def test_genres(self):
+        assert_list_queries_constant(self.client, '/genres/')
+
+
+class FastListTest(APITestCase):
+    """
+    ?fast=true отдает те же байты, что и обычный список через сериализатор.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fast', password='fast')
+        publisher = Publisher.objects.create(name='Publisher', slug='publisher', established_date=date(1990, 1, 1))
+        Book.objects.create(
+            title='Priced', author='Author', published_date=date(2020, 1, 1), publisher=publisher,
+            price=Decimal('12.5'), discounted_price=Decimal('9.99'), is_bestseller=True, owner=cls.user,
+            created_at=timezone.now(),
+        )
+        Book.objects.create(title='Bare', author='Author', published_date=date(2021, 6, 30))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_fast_list_is_identical(self):
+        with mock.patch.object(BookViewSet.response_cache, 'enabled', False):
+            for query in ('', '?ordering=price', '?page_size=1'):
+                normal = self.client.get(f'/books/{query}')
+                fast = self.client.get(f'/books/{query}{"&" if query else "?"}fast=true')
+                self.assertEqual(fast.status_code, 200)
+                # Ссылки на страницы содержат сам параметр fast - сравниваем без них
+                if query == '?page_size=1':
+                    self.assertEqual(fast.data['results'], normal.data['results'])
+                else:
+                    self.assertEqual(fast.content, normal.content)
+
+
+class ExportTest(APITestCase):
+    """
+    Потоковая выгрузка отдает весь каталог (пачками export_chunk_size) в том же виде, что и список.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('export', password='export')
+        cls.other = User.objects.create_user('other-export', password='other')
+        for index in range(5):
+            Book.objects.create(
+                title=f'Book {index}', author='Author', published_date=date(2020, 1, 1 + index),
+                price=Decimal('10.00') + index, owner=cls.user if index % 2 else cls.other,
+            )
+        Book.objects.create(title='Deleted', author='Author', published_date=date(2020, 2, 1)).delete()
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch.object(BookViewSet, 'export_chunk_size', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected(self, books):
+        data = BookSerializer(books.order_by('id'), many=True).data
+        return [{key: value for key, value in row.items() if key != 'genres'} for row in data]
+
+    def test_ndjson(self):
+        response = self.client.get('/books/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected(Book.objects.all()))
+
+    def test_json(self):
+        response = self.client.get('/books/export/', {'output': 'json', 'mine': 'true'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        content = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(content, self.expected(Book.objects.filter(owner=self.user)))
+
+    def test_empty_and_invalid(self):
+        response = self.client.get('/books/export/', {'output': 'json', 'search': 'missing'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+        self.assertEqual(self.client.get('/books/export/', {'output': 'xml'}).status_code, 400)
+
+
+class KeysetPaginationTest(APITestCase):
+    """
+    Курсоры проходят все книги ровно по одному разу при повторах значения
+    сортировки и NULL, вперед по next и назад по previous.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('keyset', password='keyset')
+        prices = [None, '10.00', '10.00', None, '5.00', '10.00', '20.00', None, '5.00']
+        for index, price in enumerate(prices):
+            Book.objects.create(
+                title=f'Book {index}', author='Author', price=price and Decimal(price),
+                published_date=date(2020, 1, 1 + index % 3),
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch.object(BookViewSet.response_cache, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def walk(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [book['id'] for book in response.data['results']]
+            ids = ids + page if link == 'next' else page + ids
+            last_url, url = url, response.data[link]
+        return ids, last_url
+
+    def expected(self, ordering):
+        books = list(Book.objects.values_list('id', 'price', 'published_date'))
+        field = {'price': 1, 'published_date': 2}[ordering.lstrip('-')]
+        values = [book for book in books if book[field] is not None]
+        nulls = sorted(book[0] for book in books if book[field] is None)
+        if ordering.startswith('-'):
+            values.sort(key=lambda book: (book[field], book[0]), reverse=True)
+            return [book[0] for book in values] + nulls[::-1]
+        values.sort(key=lambda book: (book[field], book[0]))
+        return nulls + [book[0] for book in values]
+
+    def test_cursor_walk(self):
+        for ordering in ('price', '-price', '-published_date', 'published_date'):
+            expected = self.expected(ordering)
+            forward, last_page = self.walk(f'/books/?ordering={ordering}&page_size=2', 'next')
+            self.assertEqual(forward, expected, ordering)
+            # От последней страницы назад по previous - те же книги в том же порядке
+            backward, _ = self.walk(last_page, 'previous')
+            self.assertEqual(backward, expected, ordering)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/books/?cursor=garbage').status_code, 404)
+
+
+class BooksByDateTest(APITestCase):
+    """
+    Старый маршрут books/<yyyy>/<mm>/<dd>/ сохраняет формат {'date', 'books'},
+    books/by-date/ отдает период с пагинацией.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('dates', password='dates')
+        for published_date in (date(2020, 1, 5), date(2020, 1, 5), date(2020, 1, 20), date(2020, 2, 1)):
+            Book.objects.create(title=f'Book {published_date}', author='Author', published_date=published_date)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def titles(self, books):
+        return [book['title'] for book in books]
+
+    def test_legacy_route(self):
+        response = self.client.get('/books/2020/01/05/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'date', 'books'})
+        self.assertEqual(response.data['date'], '2020-01-05')
+        self.assertEqual(self.titles(response.data['books']), ['Book 2020-01-05'] * 2)
+        self.assertNotIn('genres', response.data['books'][0])
+        self.assertEqual(self.client.get('/books/2020/02/30/').data, {'date': '2020-02-30', 'books': []})
+
+    def test_date_range_routes(self):
+        response = self.client.get('/books/by-date/2020/01/05/')
+        self.assertEqual(set(response.data), {'from', 'to', 'next', 'previous', 'results'})
+        self.assertEqual((response.data['from'], response.data['to']), ('2020-01-05', '2020-01-05'))
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = self.client.get('/books/by-date/2020/01/')
+        self.assertEqual(self.titles(response.data['results']), ['Book 2020-01-05'] * 2 + ['Book 2020-01-20'])
+        response = self.client.get('/books/by-date/', {'from': '2020-01-10'})
+        self.assertEqual(self.titles(response.data['results']), ['Book 2020-01-20', 'Book 2020-02-01'])
+        self.assertIsNone(response.data['to'])
+
+        self.assertEqual(self.client.get('/books/by-date/2020/02/30/').status_code, 404)
+        self.assertEqual(self.client.get('/books/by-date/', {'to': '2020-13-01'}).status_code, 400)
+
+
+class ListETagTest(APITestCase):
+    """
+    ETag списка строится по строкам страницы без дополнительных запросов.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('etag', password='etag')
+        for index in range(3):
+            Book.objects.create(title=f'Book {index}', author='Author', published_date=date(2020, 1, 1 + index))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified(self):
+        with mock.patch.object(BookViewSet.response_cache, 'enabled', False):
+            response = self.client.get('/books/?page_size=2')
+            etag = response['ETag']
+            response = self.client.get('/books/?page_size=2', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+            Book.objects.filter(title='Book 2').update(updated_at=timezone.now())
+            response = self.client.get('/books/?page_size=2', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_no_count_query(self):
+        with mock.patch.object(BookViewSet.response_cache, 'enabled', False):
+            # Страница и prefetch жанров, без COUNT и MAX(updated_at)
+            with self.assertNumQueries(2):
+                self.client.get('/books/')
+
+    def test_cached_response_keeps_etag(self):
+        with mock.patch.object(BookViewSet.response_cache, 'enabled', True):
+            etag = self.client.get('/books/')['ETag']
+            response = self.client.get('/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+
+class ResponseCacheTest(APITestCase):
+    """
+    Кэш ответов: попадание без загрузки объекта, сброс после записи, ключ по пользователю.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cached', password='cached')
+        cls.other = User.objects.create_user('other', password='other')
+        cls.book = Book.objects.create(title='Mine', author='Author', published_date=date(2020, 1, 1), owner=cls.user)
+        Book.objects.create(title='Other', author='Author', published_date=date(2020, 1, 2), owner=cls.other)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        # Кэш в тестах - в памяти процесса, поэтому кэш ответов включаем явно
+        for view_class in (BookViewSet, UserBookListView):
+            patcher = mock.patch.object(view_class.response_cache, 'enabled', True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def titles(self, response):
+        data = response.data if response['X-Cache'] == 'MISS' else json.loads(response.content)
+        return [book['title'] for book in data['results']]
+
+    def test_disabled_without_shared_cache(self):
+        with mock.patch.dict('newapp.cache.registry'):
+            self.assertFalse(ResponseCache('Test', ('book',)).enabled)
+
+    def test_hit_skips_object_load(self):
+        view = BookViewSet.as_view({'get': 'retrieve'})
+
+        def retrieve():
+            request = APIRequestFactory().get(f'/books/{self.book.pk}/')
+            force_authenticate(request, self.user)
+            return view(request, pk=self.book.pk)
+
+        self.assertEqual(retrieve().render()['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = retrieve()
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(json.loads(response.content)['title'], 'Mine')
+
+    def test_invalidated_after_write(self):
+        self.assertEqual(self.client.get('/books/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/books/')['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+        response = self.client.get('/books/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(sorted(self.titles(response)), ['Other', 'Renamed'])
+
+    def test_vary_on_user(self):
+        response = self.client.get('/user-book/')
+        self.assertEqual((response['X-Cache'], self.titles(response)), ('MISS', ['Mine']))
+        self.client.force_authenticate(self.other)
+        response = self.client.get('/user-book/')
+        self.assertEqual((response['X-Cache'], self.titles(response)), ('MISS', ['Other']))
+        response = self.client.get('/user-book/')
+        self.assertEqual((response['X-Cache'], self.titles(response)), ('HIT', ['Other']))
+
+
+class GenreStatisticTest(APITestCase):
+    """
+    Кэш статистики жанров сбрасывается после коммита изменения книг или жанров, но не после отката.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('statistic', password='statistic')
+        cls.user.user_permissions.add(Permission.objects.get(codename='can_get_statistic'))
+        cls.genre = Genre.objects.create(name='Fantasy')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        # Пересчет в запросе, а не в фоновом потоке
+        patcher = mock.patch.object(genre_statistic, 'background', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def book_count(self):
+        response = self.client.get('/genres/statistic/')
+        self.assertEqual(response.status_code, 200)
+        return {row['genre']: row['book_count'] for row in response.data}
+
+    def test_invalidated_after_commit(self):
+        self.assertEqual(self.book_count(), {'Fantasy': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='Book', author='Author', published_date=date(2020, 1, 1))
+            book.genres.add(self.genre)
+        self.assertEqual(self.book_count(), {'Fantasy': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            Genre.objects.create(name='Horror')
+        self.assertEqual(self.book_count(), {'Fantasy': 1, 'Horror': 0})
+
+    def test_not_invalidated_on_rollback(self):
+        self.book_count()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Genre.objects.create(name='Horror')
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(callbacks, [])
+        # Свежее значение из кэша - без запроса к БД
+        with self.assertNumQueries(0):
+            self.assertEqual(genre_statistic.get(), [{'id': self.genre.pk, 'genre': 'Fantasy', 'book_count': 0,
+                                                      'bestseller_count': 0}])
+
+
+class CounterConsistencyTest(APITransactionTestCase):
+    """
+    Счетчики жанров и статистика цен совпадают с агрегатами по книгам после
+    каждой операции записи. TransactionTestCase: сигналы и on_commit работают
+    с настоящими коммитами, как в запросе.
+    """
+    def setUp(self):
+        # Воркер очереди писем работал бы с тестовой БД из другого потока
+        patcher = mock.patch('newapp.tasks.worker.dispatch')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('writer', password='writer')
+        self.client.force_authenticate(self.user)
+        self.genres = [Genre.objects.create(name=f'Genre {index}') for index in range(3)]
+
+    def assertCountersConsistent(self):
+        self.assertEqual(rebuild_genre_counters(check_only=True), [])
+        stored, actual = reconcile_price_stats()
+        self.assertEqual(stored, actual)
+
+    def create_book(self, index, genres, **data):
+        response = self.client.post('/books/', {
+            'title': f'Book {index}',
+            'author': 'Author',
+            'published_date': '2020-01-01',
+            'price': f'{10 + index}.00',
+            'genres': [genre.pk for genre in genres],
+            **data,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Book.objects.get(pk=response.data['id'])
+
+    def test_counters_follow_writes(self):
+        first, second, third = self.genres
+        books = [
+            self.create_book(0, [first]),
+            self.create_book(1, [first, second], is_bestseller=True),
+            self.create_book(2, [second, third]),
+            self.create_book(3, [third], is_bestseller=True),
+            self.create_book(4, [first, third], price=None),
+        ]
+        self.assertCountersConsistent()
+
+        # Изменение полей и жанров с обеих сторон связи
+        books[0].is_bestseller = True
+        books[0].price = Decimal('99.00')
+        books[0].save()
+        books[1].genres.set([third])
+        second.books.add(books[3])
+        first.books.clear()
+        self.assertCountersConsistent()
+
+        # Мягкое удаление объекта, queryset и через массовый эндпоинт
+        books[0].delete()
+        Book.objects.filter(pk=books[1].pk).delete()
+        response = self.client.delete('/books/bulk/', [books[2].pk], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertCountersConsistent()
+
+        # Массовое создание и физическое удаление
+        response = self.client.post('/books/bulk/', [
+            {'title': 'Bulk', 'author': 'Author', 'published_date': '2021-01-01', 'price': '5.00',
+             'genres': [first.pk, second.pk], 'is_bestseller': True},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        Book.all_objects.get(pk=books[0].pk).hard_delete()
+        books[3].hard_delete()
+        self.assertCountersConsistent()
+
+    def test_remove_unlinked(self):
+        first, second, third = self.genres
+        book = self.create_book(0, [first], is_bestseller=True)
+        other = self.create_book(1, [second])
+        # remove() несвязанных объектов ничего не меняет, в том числе счетчики
+        book.genres.remove(second, third)
+        second.books.remove(book)
+        first.books.remove(other, book)
+        self.assertCountersConsistent()
+        self.assertEqual(Genre.objects.get(pk=first.pk).book_count, 0)
+        self.assertEqual(Genre.objects.get(pk=second.pk).book_count, 1)
+
+    def test_failed_counter_update_rolls_back_book(self):
+        book = self.create_book(0, self.genres[:2])
+        with mock.patch('newapp.signals.apply_price_change', side_effect=DatabaseError('failed')):
+            book.is_bestseller = True
+            with self.assertRaises(DatabaseError):
+                book.save()
+        book.refresh_from_db()
+        self.assertFalse(book.is_bestseller)
+        self.assertCountersConsistent()
+
+    def test_fastload(self):
+        first, second, third = self.genres
+        self.create_book(0, [first])
+
+        def book(pk, genres, **fields):
+            return {'model': 'newapp.book', 'pk': pk, 'fields': {
+                'title': f'Loaded {pk}', 'author': 'Author', 'published_date': '2020-01-01', 'price': f'{pk}.00',
+                'genres': [genre.pk for genre in genres], **fields,
+            }}
+
+        # Фикстура перезаписывает жанр со старыми счетчиками и добавляет книги без сигналов
+        fixture = [
+            {'model': 'newapp.genre', 'pk': third.pk, 'fields': {'name': third.name, 'book_count': 7}},
+            book(100, [first, second]),
+            book(101, [second], is_bestseller=True),
+            book(102, [third], is_deleted=True),
+            book(103, [], price=None),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'books.json'
+            path.write_text(json.dumps(fixture))
+            call_command('fastload', str(path), stdout=open(os.devnull, 'w'))
+
+        self.assertCountersConsistent()
+        self.assertEqual([Genre.objects.get(pk=genre.pk).book_count for genre in self.genres], [2, 2, 0])
+        self.assertIsNotNone(Book.all_objects.get(pk=102).deleted_at)
+
+
+class OutboxTest(APITransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch('newapp.tasks.worker.dispatch')
+        self.dispatch = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('writer', password='writer')
+        self.client.force_authenticate(self.user)
+        self.genre = Genre.objects.create(name='Genre')
+        self.data = {'title': 'Book', 'author': 'Author', 'published_date': '2020-01-01', 'genres': [self.genre.pk]}
+
+    def test_message_is_written_with_book(self):
+        response = self.client.post('/books/', self.data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.payload, {'book_id': response.data['id']})
+        self.dispatch.assert_called_once_with('notify_books_created', message.pk, 0)
+
+    def test_failed_enqueue_rolls_back_book(self):
+        with mock.patch('newapp.signals.enqueue', side_effect=DatabaseError('failed')), \
+                self.assertRaises(DatabaseError):
+            self.client.post('/books/', self.data, format='json')
+        self.assertFalse(Book.all_objects.exists())
+        self.dispatch.assert_not_called()
+
+    def test_purge_finished_messages(self):
+        old = OutboxMessage.objects.create(task='notify_books_created', status=OutboxMessage.DONE)
+        OutboxMessage.objects.filter(pk=old.pk).update(created_at=old.created_at - timedelta(days=10))
+        recent = OutboxMessage.objects.create(task='notify_books_created', status=OutboxMessage.DONE)
+        pending = OutboxMessage.objects.create(task='notify_books_created')
+        OutboxMessage.objects.filter(pk=pending.pk).update(created_at=old.created_at - timedelta(days=10))
+
+        self.assertEqual(purge_finished_messages(days=7), 1)
+        self.assertEqual(set(OutboxMessage.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+
+class BulkBooksTest(APITestCase):
+    """
+    POST/PATCH/DELETE /books/bulk/: ошибки по индексам элементов, ?atomic=true.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('bulk', password='bulk')
+        cls.genre = Genre.objects.create(name='Genre')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def item(self, title, **data):
+        return {'title': title, 'author': 'Author', 'published_date': '2020-01-01', 'genres': [self.genre.pk], **data}
+
+    def create_books(self, count):
+        return [
+            Book.objects.create(title=f'Book {index}', author='Author', published_date=date(2020, 1, 1), owner=self.user)
+            for index in range(count)
+        ]
+
+    def test_create(self):
+        response = self.client.post('/books/bulk/', [self.item('First'), self.item('Second')], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([book['title'] for book in response.data['created']], ['First', 'Second'])
+        self.assertEqual(response.data['errors'], [])
+        self.assertEqual(Book.objects.filter(owner=self.user).count(), 2)
+        self.assertEqual(Genre.objects.get().book_count, 2)
+
+    def test_create_ignores_timestamps(self):
+        items = [self.item('Book', updated_at='2000-01-01T00:00:00Z', deleted_at='2000-01-01T00:00:00Z')]
+        response = self.client.post('/books/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        book = Book.objects.get()
+        self.assertIsNone(book.deleted_at)
+        self.assertGreater(book.updated_at.year, 2000)
+
+    def test_create_mixed(self):
+        items = [self.item('Valid'), self.item('', genres=[0]), self.item('Also valid')]
+        response = self.client.post('/books/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'title', 'genres'})
+
+        response = self.client.post('/books/bulk/?atomic=true', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_invalid_body(self):
+        response = self.client.post('/books/bulk/', self.item('Book'), format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/books/bulk/', [self.item('')], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['index'], 0)
+
+    def test_update(self):
+        first, second = self.create_books(2)
+        items = [{'id': first.pk, 'price': '12.50'}, {'id': second.pk, 'title': 'Renamed'}]
+        response = self.client.patch('/books/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['errors'], [])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.price, Decimal('12.50'))
+        self.assertEqual(second.title, 'Renamed')
+
+    def test_update_writes_only_sent_fields(self):
+        first, second = self.create_books(2)
+        items = [{'id': first.pk, 'price': '12.50'}, {'id': second.pk, 'title': 'Renamed'}]
+        with CaptureQueriesContext(transaction.get_connection()) as queries:
+            response = self.client.patch('/books/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "newapp_book" SET')]
+        # По одному UPDATE на набор полей: цена первой книги не пишет ее title и наоборот
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(sorted(('"title" =' in sql, '"price" =' in sql) for sql in updates), [(False, True), (True, False)])
+
+    def test_update_mixed(self):
+        first, second = self.create_books(2)
+        items = [
+            {'id': first.pk, 'title': 'Renamed'},
+            {'id': second.pk, 'price': 'not a price'},
+            {'title': 'No id'},
+            {'id': first.pk, 'title': 'Duplicate'},
+            {'id': 0, 'title': 'Missing'},
+        ]
+        response = self.client.patch('/books/bulk/?atomic=true', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        first.refresh_from_db()
+        self.assertEqual(first.title, 'Book 0')
+
+        response = self.client.patch('/books/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([book['id'] for book in response.data['updated']], [first.pk])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3, 4])
+        first.refresh_from_db()
+        self.assertEqual(first.title, 'Renamed')
+
+    def test_delete(self):
+        books = self.create_books(3)
+        other = Book.objects.create(title='Other', author='Author', published_date=date(2020, 1, 1))
+        response = self.client.delete('/books/bulk/', [books[0].pk, books[1].pk, 'x', 0], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(sorted(response.data['deleted']), [books[0].pk, books[1].pk])
+        self.assertEqual([error['index'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(set(Book.objects.values_list('pk', flat=True)), {books[2].pk, other.pk})
+        self.assertTrue(Book.all_objects.get(pk=books[0].pk).is_deleted)
+
+        response = self.client.delete('/books/bulk/?atomic=true', [books[2].pk, 0], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Book.objects.filter(pk=books[2].pk).exists())
+
+
+class SoftDeleteTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.genre = Genre.objects.create(name='Genre')
+
+    def create_book(self, title):
+        book = Book.objects.create(title=title, author='Author', published_date=date(2020, 1, 1))
+        book.genres.add(self.genre)
+        return book
+
+    def test_serializer_cannot_soft_delete(self):
+        book = self.create_book('Book')
+        serializer = BookSerializer(book, data={'is_deleted': True, 'deleted_at': '2020-01-01T00:00:00Z'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        book.refresh_from_db()
+        self.assertFalse(book.is_deleted)
+        self.assertIsNone(book.deleted_at)
+
+    def test_purge_deleted_books(self):
+        old, recent, live = self.create_book('Old'), self.create_book('Recent'), self.create_book('Live')
+        old.delete()
+        recent.delete()
+        Book.all_objects.filter(pk=old.pk).update(deleted_at=timezone.now() - timedelta(days=40))
+
+        call_command('purge_deleted_books', days=30, stdout=open(os.devnull, 'w'))
+        self.assertEqual(set(Book.all_objects.values_list('pk', flat=True)), {recent.pk, live.pk})
+        archived = ArchivedBook.objects.get()
+        self.assertEqual((archived.pk, archived.title, archived.genre_ids), (old.pk, 'Old', [self.genre.pk]))
+
+    def test_purge_overwrites_archived_copy(self):
+        book = self.create_book('Book')
+        ArchivedBook.objects.create(id=book.pk, title='Stale', author='Author', published_date=date(2000, 1, 1))
+        book.delete()
+        Book.all_objects.filter(pk=book.pk).update(deleted_at=timezone.now() - timedelta(days=40))
+
+        call_command('purge_deleted_books', days=30, stdout=open(os.devnull, 'w'))
+        self.assertFalse(Book.all_objects.exists())
+        archived = ArchivedBook.objects.get()
+        self.assertEqual((archived.title, archived.genre_ids), ('Book', [self.genre.pk]))
+
+
+class FullTextSearchTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('search', password='search')
+        for title, author in [('The Hobbit', 'Tolkien'), ('Dune', 'Herbert'), ('Tolkien: A Biography', 'Carpenter')]:
+            Book.objects.create(title=title, author=author, published_date=date(2000, 1, 1))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def search(self, term):
+        with mock.patch.object(BookViewSet.response_cache, 'enabled', False):
+            response = self.client.get('/books/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return sorted(book['title'] for book in response.data['results'])
+
+    def test_search(self):
+        self.assertEqual(self.search('tolk'), ['The Hobbit', 'Tolkien: A Biography'])
+        self.assertEqual(self.search('tolkien hobbit'), ['The Hobbit'])
+
+    def test_index_follows_updates(self):
+        book = Book.objects.get(title='Dune')
+        book.title = 'Dune Messiah'
+        book.save()
+        self.assertEqual(self.search('messiah'), ['Dune Messiah'])
+        book.hard_delete()
+        self.assertEqual(self.search('dune'), [])
+
+    def test_rank(self):
+        Book.objects.create(title='Tolkien and Tolkien', author='Tolkien', published_date=date(2000, 1, 1))
+        request = Request(RequestFactory().get('/books/', {'search': 'tolkien'}))
+        books = FullTextSearchFilter().filter_queryset(request, Book.objects.all(), BookViewSet())
+        self.assertEqual([book.title for book in books], ['Tolkien and Tolkien', 'The Hobbit', 'Tolkien: A Biography'])
+        ranks = [book.search_rank for book in books]
+        self.assertEqual(ranks, sorted(ranks))
+
+    def test_dumpdata_round_trip(self):
+        # Индекс не модель: dumpdata newapp не должен выгружать строки FTS-таблицы
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'newapp.json'
+            call_command('dumpdata', 'newapp', output=str(path), verbosity=0)
+            self.assertEqual({row['model'] for row in json.loads(path.read_text())} & {'newapp.booksearchindex'}, set())
+            Book.all_objects.all().delete()
+            call_command('loaddata', str(path), verbosity=0)
+        self.assertEqual(self.search('tolk'), ['The Hobbit', 'Tolkien: A Biography'])
+
+
+class RequestMetricsTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('metrics', password='metrics')
+        Book.objects.create(title='Book', author='Author', published_date=date(2020, 1, 1))
+
+    def test_server_timing(self):
+        self.client.force_authenticate(self.user)
+        with mock.patch.object(BookViewSet.response_cache, 'enabled', False):
+            response = self.client.get('/books/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+    def test_async_queries_are_counted(self):
+        seen = []
+
+        async def get_response(request):
+            await Book.objects.acount()
+            seen.append(current_timings.get())
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/books/'))
+        # Запрос выполнен в потоке sync_to_async, но учтен в метриках этого запроса
+        self.assertEqual(seen[0].queries, 1)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class PermissionCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        permission_cache.clear()
+        self.load = mock.Mock(return_value={'newapp.can_get_statistic'})
+
+    def test_local_cache_is_not_used(self):
+        # В тестах CACHES - LocMemCache: поколения не общие для процессов
+        self.assertFalse(permission_cache.enabled)
+        self.assertEqual([error.id for error in check_permission_cache(None)], ['newapp.W001'])
+        # Предупреждение - только в check --deploy, не при каждом manage.py
+        self.assertNotIn('newapp.W001', [error.id for error in checks.run_checks(tags=[checks.Tags.caches])])
+        self.assertIn('newapp.W001', [
+            error.id for error in checks.run_checks(tags=[checks.Tags.caches], include_deployment_checks=True)
+        ])
+        permission_cache.get(1, self.load)
+        permission_cache.get(1, self.load)
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_shared_cache(self):
+        with mock.patch.object(permission_cache, 'enabled', True):
+            self.assertEqual(check_permission_cache(None), [])
+            self.assertEqual(permission_cache.get(1, self.load), {'newapp.can_get_statistic'})
+            permission_cache.get(1, self.load)
+            self.assertEqual(self.load.call_count, 1)
+
+    def test_fixtures_invalidate_permissions(self):
+        user = User.objects.create_user('loaded', password='loaded')
+        with mock.patch.object(permission_cache, 'enabled', True):
+            permission_cache.get(user.pk, self.load)
+            refresh_after_load(['auth.Group'])
+            permission_cache.get(user.pk, self.load)
+            self.assertEqual(self.load.call_count, 2)
+            before = get_generations([user_generation(user.pk)])
+            refresh_after_load(['auth.User'])
+            self.assertEqual(get_generations([user_generation(user.pk)]), [before[0] + 1])
+
+
+class BlacklistFilterTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tokens', password='tokens')
+
+    def setUp(self):
+        cache.clear()
+        blacklist_filter.clear()
+        self.addCleanup(blacklist_filter.clear)
+        # В тестах кэш в памяти процесса: фильтр включаем явно, как при общем кэше
+        patcher = mock.patch.object(blacklist_filter, 'enabled', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def blacklist(self, jti, expires_at=None):
+        token = OutstandingToken.objects.create(
+            user=self.user, jti=jti, token=jti, expires_at=expires_at or timezone.now() + timedelta(days=1),
+        )
+        return BlacklistedToken.objects.create(token=token)
+
+    def test_disabled_without_shared_cache(self):
+        blacklist_filter.rebuild()
+        with mock.patch.object(blacklist_filter, 'enabled', False):
+            # Черный список другого процесса не виден через LocMemCache - всегда проверка в БД
+            self.assertTrue(blacklist_filter.might_contain('valid'))
+        with mock.patch.dict('newapp.cache.registry'):
+            self.assertFalse(BlacklistFilter({}).enabled)
+
+    def test_blacklisted_in_another_process(self):
+        blacklist_filter.rebuild()
+        self.assertFalse(blacklist_filter.might_contain('revoked'))
+        # Другой процесс: строка без сигнала этого процесса, но поколение в общем кэше увеличено
+        token = OutstandingToken.objects.create(
+            user=self.user, jti='revoked', token='revoked', expires_at=timezone.now() + timedelta(days=1),
+        )
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token)])
+        self.assertFalse(blacklist_filter.might_contain('revoked'))
+        bump_generation(GENERATION)
+        self.assertTrue(blacklist_filter.might_contain('revoked'))
+
+    def test_cleared_during_check(self):
+        blacklist_filter.rebuild()
+        with mock.patch('newapp.tokens.get_generations', side_effect=lambda names: blacklist_filter.clear() or [1]), \
+                mock.patch('newapp.tokens.worker.submit', return_value=True):
+            self.assertTrue(blacklist_filter.might_contain('valid'))
+
+    def test_rebuild_in_background(self):
+        self.blacklist('revoked')
+        with mock.patch('newapp.tokens.worker.submit', return_value=True) as submit:
+            # Пока фильтра нет, токен проверяется в БД
+            self.assertTrue(blacklist_filter.might_contain('valid'))
+        submit.assert_called_once_with(blacklist_filter.rebuild)
+        blacklist_filter.rebuild()
+        self.assertTrue(blacklist_filter.might_contain('revoked'))
+        self.assertFalse(blacklist_filter.might_contain('valid'))
+
+    def test_refresh_counts_new_rows_only(self):
+        for index in range(3):
+            self.blacklist(f'jti-{index}')
+        blacklist_filter.rebuild()
+        self.assertEqual(blacklist_filter.bloom.count, 3)
+        blacklist_filter.refresh(None)
+        self.assertEqual(blacklist_filter.bloom.count, 3)
+        self.blacklist('jti-3')
+        blacklist_filter.refresh(None)
+        self.assertEqual(blacklist_filter.bloom.count, 4)
+        self.assertTrue(blacklist_filter.might_contain('jti-3'))
+
+    def test_purge_expired_tokens(self):
+        self.blacklist('expired', timezone.now() - timedelta(days=1))
+        self.blacklist('active')
+        self.assertEqual(purge_expired_tokens(chunk_size=1), 1)
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['active'])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+class PrecomputedSchemaTest(APITestCase):
+    def test_schema_is_served_read_only(self):
+        self.client.get('/swagger/')  # импортирует URLConf с представлением схемы
+        schema = schemas['openapi']
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.addCleanup(schema.reset)
+        directory = Path(temporary.name) / 'schema'
+        with mock.patch.object(schema, 'directory', directory):
+            schema.reset()
+            response = self.client.get('/swagger/?format=openapi')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'"paths"', response.content)
+            # Файлы пишет только generate_schema
+            self.assertFalse(directory.exists())
+            call_command('generate_schema', stdout=StringIO())
+            self.assertTrue(schema.path('json').exists())
+
+
+class CachedAuthenticationTest(APITestCase):
+    """
+    Деактивированный пользователь отклоняется, даже если его токен и он сам уже в кэше.
+    """
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user('cached', password='cached')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def get(self, path='/protected/'):
+        return self.client.get(path).status_code
+
+    def test_deactivated_user(self):
+        self.assertEqual(self.get(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(), 401)
+        self.assertEqual(self.get('/async/protected/'), 401)
+
+    def test_user_changed_in_another_process(self):
+        with mock.patch('newapp.authentication.SHARED_USER_CACHE', True):
+            self.assertEqual(self.get(), 200)
+            # Другой процесс: строка изменена без сигналов этого процесса, но поколение в общем кэше увеличено
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            self.assertEqual(self.get(), 200)
+            bump_generation(user_generation(self.user.pk))
+            self.assertEqual(self.get(), 401)
+            self.assertEqual(self.get('/async/protected/'), 401)
+
+
+class AsyncViewsTest(APITestCase):
+    """
+    Async-представления отвечают так же, как синхронные аналоги.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('async', password='async')
+        cls.user.user_permissions.add(Permission.objects.get(codename='can_get_statistic'))
+        cls.genres = [Genre.objects.create(name=f'Genre {index}') for index in range(7)]
+        for index in range(5):
+            Book.objects.create(title=f'Book {index}', author='Author', published_date=date(2020, 1, 1 + index))
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        for view_class in (BookViewSet, GenreViewSet):
+            patcher = mock.patch.object(view_class.response_cache, 'enabled', False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assert_same(self, sync_url, async_url):
+        sync_response, async_response = self.client.get(sync_url), self.client.get(async_url)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # Ссылки на соседние страницы отличаются только путем
+        sync_data, async_data = (
+            {key: value for key, value in json.loads(response.content).items() if key not in ('next', 'previous')}
+            for response in (sync_response, async_response)
+        )
+        self.assertEqual(async_data, sync_data)
+        return async_data
+
+    def test_genres(self):
+        data = self.assert_same('/genres/?page=2', '/async/genres/?page=2')
+        self.assertEqual([genre['id'] for genre in data['results']], [genre.pk for genre in self.genres[3:6]])
+        self.assert_same('/genres/?page=9', '/async/genres/?page=9')
+        self.assert_same(f'/genres/{self.genres[0].pk}/', f'/async/genres/{self.genres[0].pk}/')
+
+    def test_genre_page_selected_in_database(self):
+        with CaptureQueriesContext(transaction.get_connection()) as queries:
+            self.client.get('/async/genres/?page=2')
+        selects = [query['sql'] for query in queries if 'FROM "newapp_genre"' in query['sql']]
+        self.assertEqual(len(selects), 2)  # COUNT и страница
+        self.assertIn('LIMIT 3 OFFSET 3', selects[1])
+
+    def test_books(self):
+        self.assert_same('/books/?fast=true&page_size=2', '/async/books/?page_size=2')
+        self.assert_same('/books/by-date/2020/01/02/', '/async/books/2020/01/02/')
+
+
+class SqlitePragmasTest(SimpleTestCase):
+    """
+    Прагмы профиля 'tuned' выполняются для каждого нового соединения.
+    """
+    def test_tuned_profile(self):
+        pragmas = settings.SQLITE_PROFILES['tuned']['PRAGMAS']
+        with tempfile.TemporaryDirectory() as directory, override_settings(SQLITE_PRAGMAS=pragmas):
+            wrapper = SQLiteDatabaseWrapper(
+                {**connections['default'].settings_dict, 'NAME': str(Path(directory) / 'pragmas.sqlite3')}, 'pragmas',
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    applied = {}
+                    for name in pragmas:
+                        cursor.execute(f'PRAGMA {name}')
+                        applied[name] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        # synchronous и temp_store SQLite возвращает числами
+        self.assertEqual(applied, {**pragmas, 'synchronous': 1, 'temp_store': 2})
 
-# Create your tests here.
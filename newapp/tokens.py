@@ -0,0 +1,250 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from .cache import bump_generation, get_generations, is_shared_cache, registry
+from .db import delete_rows
+from .models import OutboxMessage
+from .tasks import enqueue, task, worker
+
+GENERATION = 'token-blacklist'
+
+_purge_options = getattr(settings, 'TOKEN_PURGE', {})
+
+
+class BloomFilter:
+    """
+    Множество строк без хранения самих строк: "нет" - точно нет, "да" - возможно
+    (доля ложных срабатываний около error_rate, пока элементов не больше capacity).
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Двойное хеширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key, count=True):
+        # count=False - ключ мог уже быть учтен (повторное чтение), count влияет на оценку заполнения
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        if count:
+            self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class BlacklistFilter:
+    """
+    Фильтр Блума по jti из BlacklistedToken: если jti в фильтре нет, токен точно
+    не в черном списке и запрос к БД не нужен.
+
+    Полностью фильтр строится в фоне (воркер из tasks.py) и подменяется целиком; пока
+    первого фильтра нет, черный список проверяется в БД. Раз в REBUILD_INTERVAL или при
+    переполнении фильтр строится заново: так из него уходят удаленные jti.
+    В запросе фильтр только догружает новые строки по id (с перекрытием ID_OVERLAP
+    на транзакции, закоммиченные не по порядку id), когда меняется поколение
+    'token-blacklist' в кэше Django (его увеличивает сигнал после коммита) или прошло
+    REFRESH_INTERVAL секунд, поэтому токен из черного списка другого процесса виден сразу.
+    С LocMemCache поколение другого процесса не видно, и фильтр выключен (каждая проверка
+    идет в БД), если только REQUIRE_SHARED_CACHE не False (один процесс).
+    """
+    ID_OVERLAP = 100
+
+    def __init__(self, options):
+        self.enabled = options.get('ENABLED', True) and (
+            is_shared_cache() or not options.get('REQUIRE_SHARED_CACHE', True)
+        )
+        self.capacity = options.get('CAPACITY', 1000000)
+        self.error_rate = options.get('ERROR_RATE', 0.001)
+        self.refresh_interval = options.get('REFRESH_INTERVAL', 5)
+        self.rebuild_interval = options.get('REBUILD_INTERVAL', 3600)
+        self.chunk_size = options.get('CHUNK_SIZE', 10000)
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.last_id = 0
+        self.generation = None
+        self.refreshed_at = self.built_at = 0
+        self.rebuilding = False
+        self.checks = self.negatives = self.refreshes = self.rebuilds = 0
+        registry['token-blacklist'] = self
+
+    def might_contain(self, jti):
+        if not self.enabled:
+            return True
+        bloom = self.bloom
+        if bloom is None or bloom.count > bloom.capacity or time.monotonic() - self.built_at > self.rebuild_interval:
+            self.schedule_rebuild()
+        if bloom is None:
+            # Фильтр еще строится - ответ "возможно", проверка в БД
+            return True
+        generation = get_generations([GENERATION])[0]
+        if generation != self.generation or time.monotonic() - self.refreshed_at > self.refresh_interval:
+            # Догружается и проверяется один и тот же фильтр: его могли подменить (rebuild) или убрать (clear)
+            bloom = self.refresh(generation)
+            if bloom is None:
+                return True
+        self.checks += 1
+        if jti in bloom:
+            return True
+        self.negatives += 1
+        return False
+
+    def schedule_rebuild(self):
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        if not worker.submit(self.rebuild):
+            self.rebuilding = False
+
+    def rebuild(self):
+        """
+        Строит фильтр по всему черному списку и подменяет текущий. Запросы тем временем
+        работают со старым фильтром (или с БД, если его нет).
+        """
+        try:
+            started = time.monotonic()
+            count = BlacklistedToken.objects.count()
+            bloom = BloomFilter(max(self.capacity, count * 2), self.error_rate)
+            last_id = self.load(bloom, 0)
+            with self.lock:
+                # Строки, закоммиченные во время построения, догрузит следующая проверка
+                self.bloom, self.last_id, self.generation = bloom, last_id, None
+                self.built_at = started
+                self.rebuilds += 1
+        finally:
+            self.rebuilding = False
+
+    def refresh(self, generation):
+        """
+        Догружает новые строки в текущий фильтр и возвращает его (None, если фильтра нет).
+        """
+        with self.lock:
+            bloom = self.bloom
+            if bloom is None:
+                return None
+            started = time.monotonic()
+            self.last_id = self.load(bloom, self.last_id)
+            self.generation, self.refreshed_at = generation, started
+            self.refreshes += 1
+            return bloom
+
+    def load(self, bloom, last_id):
+        """
+        Добавляет в bloom строки с id больше last_id - ID_OVERLAP, возвращает новый last_id.
+        Строки из перекрытия уже учтены в bloom.count и не считаются повторно.
+        """
+        rows = BlacklistedToken.objects.filter(id__gt=last_id - self.ID_OVERLAP) \
+            .order_by('id').values_list('id', 'token__jti')
+        new_last_id = last_id
+        for token_id, jti in rows.iterator(chunk_size=self.chunk_size):
+            bloom.add(jti, count=token_id > last_id)
+            new_last_id = max(new_last_id, token_id)
+        return new_last_id
+
+    def add(self, jti, using=None):
+        """
+        jti, добавленный в черный список в этом процессе, виден без перечитывания;
+        другим процессам об изменении сообщает новое поколение после коммита.
+        В bloom.count строка попадет при догрузке по id.
+        """
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti, count=False)
+        transaction.on_commit(self.publish, using=using)
+
+    def publish(self):
+        generation, = bump_generation(GENERATION)
+        with self.lock:
+            # Если между проверками поколение менял только этот процесс, догружать нечего
+            if self.generation is not None and generation == self.generation + 1:
+                self.generation = generation
+
+    def clear(self):
+        with self.lock:
+            self.bloom = None
+            self.last_id = 0
+
+    def stats(self):
+        return {
+            'size': self.bloom.count if self.bloom is not None else 0,
+            'checks': self.checks,
+            'negatives': self.negatives,
+            'refreshes': self.refreshes,
+            'rebuilds': self.rebuilds,
+            'enabled': self.enabled,
+        }
+
+
+blacklist_filter = BlacklistFilter(getattr(settings, 'TOKEN_BLACKLIST_FILTER', {}))
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    RefreshToken, который проверяет черный список в БД, только если jti есть в blacklist_filter.
+    """
+    def check_blacklist(self):
+        if blacklist_filter.enabled and not blacklist_filter.might_contain(self.payload[jwt_settings.JTI_CLAIM]):
+            return
+        super().check_blacklist()
+
+
+def purge_expired_tokens(chunk_size=5000, sleep=0, now=None, progress=None):
+    """
+    Удаляет истекшие OutstandingToken и их BlacklistedToken пачками по chunk_size
+    в коротких транзакциях (flushexpiredtokens удаляет все одним delete() через коллектор).
+    Истекший refresh-токен и так не проходит проверку exp, поэтому в черном списке он не нужен.
+    """
+    now = now or aware_utcnow()
+    expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('pk').values_list('pk', flat=True)
+    deleted = last_pk = 0
+    while True:
+        with transaction.atomic():
+            # С последнего pk, а не с начала: иначе каждая пачка заново проходит неистекшие строки
+            pks = list(expired.filter(pk__gt=last_pk)[:chunk_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            # Сигналы на удаление токенов не нужны - удаляем без коллектора
+            delete_rows(BlacklistedToken, pks, column='token_id')
+            delete_rows(OutstandingToken, pks)
+        deleted += len(pks)
+        if progress is not None:
+            progress(deleted)
+        if sleep:
+            time.sleep(sleep)
+    return deleted
+
+
+@task('purge_expired_tokens')
+def run_token_purge():
+    purge_expired_tokens(_purge_options.get('CHUNK_SIZE', 5000))
+    schedule_token_purge()
+
+
+def schedule_token_purge(delay=None):
+    """
+    Ставит в outbox следующую очистку через TOKEN_PURGE['INTERVAL'] секунд,
+    если она еще не запланирована. Задача после выполнения планирует себя снова.
+    """
+    pending = OutboxMessage.objects.filter(task='purge_expired_tokens', status=OutboxMessage.PENDING)
+    if pending.exists():
+        return None
+    return enqueue('purge_expired_tokens', delay=_purge_options.get('INTERVAL', 3600) if delay is None else delay)
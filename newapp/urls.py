@@ -4,6 +4,7 @@ from rest_framework.authtoken.views import obtain_auth_token
 from .views import *
 from rest_framework.routers import DefaultRouter, SimpleRouter
 from .views import GenreListRetrieveUpdateViewSet
+from . import async_views
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 
@@ -25,13 +26,28 @@ urlpatterns = [
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # path('api-token-auth/', obtain_auth_token, name='api-token-auth'),
     path('protected/', ProtectedDataView.as_view(), name='protected-data'),
+    path('metrics/requests/', RequestMetricsView.as_view(), name='request-metrics'),
     path('books/<int:pk>/', BookDetailUpdateDeleteView.as_view(), name='book-detail-update-delete'),
+    # Эти маршруты должны стоять до router, иначе books/expensive/ и books/by-date/ совпадут с books/<pk>/
+    path('books/expensive/', ExpensiveBooksView.as_view(), name='book-expensive'),
+    path('books/by-date/', books_by_date_view, name='books-by-date-range'),
+    re_path(r'^books/by-date/(?P<year>\d{4})/$', books_by_date_view, name='books-by-year'),
+    re_path(r'^books/by-date/(?P<year>\d{4})/(?P<month>\d{2})/$', books_by_date_view, name='books-by-month'),
+    re_path(r'^books/by-date/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/$', books_by_date_view,
+            name='books-by-day'),
     path('', include(router.urls)),
-    re_path(r'^books/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/$', books_by_date_view, name='books-by-date'),
+    re_path(r'^books/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/$', books_by_day_view, name='books-by-date'),
     path('user-book/', UserBookListView.as_view(), name='user-book'),
+    # Async-варианты эндпоинтов чтения для ASGI-сервера (newapp.async_views)
+    path('async/protected/', async_views.AsyncProtectedDataView.as_view(), name='async-protected-data'),
+    path('async/books/', async_views.AsyncBookListView.as_view(), name='async-book-list'),
+    path('async/books/<int:pk>/', async_views.AsyncBookDetailView.as_view(), name='async-book-detail'),
+    re_path(r'^async/books/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/$',
+            async_views.AsyncBooksByDateView.as_view(), name='async-books-by-date'),
+    path('async/genres/', async_views.AsyncGenreListView.as_view(), name='async-genre-list'),
+    path('async/genres/<int:pk>/', async_views.AsyncGenreDetailView.as_view(), name='async-genre-detail'),
     # path('', include(router2.urls)),
     # path('books/', BookListCreateView.as_view(), name='book-list-create'),
-    # path('books/expensive/', ExpensiveBooksView.as_view(), name='book-expensive'),
     # path('books/', BookListView.as_view(), name='book-list-create'),  # Для получения всех книг и создания новой книги
     # path('genres/', GenreListCreateView.as_view(), name='create-genre'),  # Маршрут для создания жанров
     # path('genres/<str:genre_name>/', GenreDetailUpdateDeleteView.as_view(), name='genre-detail-update-delete'),
@@ -1,27 +1,42 @@
-from datetime import datetime
+import calendar
+import logging
+from datetime import date, datetime
 
 from django.contrib.auth import authenticate
-from django.db.models import Avg, Count
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import api_view, action
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import GenericAPIView, ListCreateAPIView, RetrieveUpdateDestroyAPIView, ListAPIView
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser, IsAuthenticatedOrReadOnly, \
     DjangoModelPermissions
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import CachedJWTAuthentication
+from .bulk import bulk_create_books, bulk_delete_books, bulk_update_books
+from .exports import iter_rows, stream_json_array, stream_ndjson
+from .instrumentation import request_metrics
+from .mixins import CachedResponseMixin, ConditionalRequestMixin, EagerLoadingViewMixin, FastListMixin, \
+    InstrumentedViewMixin
+from .pagination import BookDateRangePagination, BookKeysetPagination, BookPricePagination
 from .permissions import *
 from .serializers import *
+from .statistics import genre_statistic
+from .tokens import FilteredRefreshToken
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination, CursorPagination
 from rest_framework.response import Response
 from rest_framework import status, filters, generics
-from .models import Book
+from .models import Book, CatalogPriceStats
 from .serializers import BookSerializer
 from rest_framework import mixins, viewsets
 from .models import Genre
 from .serializers import GenreSerializer
 from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.renderers import BrowsableAPIRenderer
+from .renderers import FastJSONRenderer
+from .search import FullTextSearchFilter
+
+logger = logging.getLogger(__name__)
 
 
 class ReadOnlyOrAuthenticatedView(APIView):
@@ -42,7 +57,7 @@ class PublicView(APIView):
 
 
 def set_jwt_cookies(response, user):
-    refresh_token = RefreshToken.for_user(user)
+    refresh_token = FilteredRefreshToken.for_user(user)
     access_token = refresh_token.access_token
 
     # Устанавливает JWT токены в куки.
@@ -101,7 +116,7 @@ class LoginView(APIView):
         user = authenticate(request, username=username, password=password)
 
         if user:
-            refresh = RefreshToken.for_user(user)
+            refresh = FilteredRefreshToken.for_user(user)
             access_token = refresh.access_token
 
             # Используем exp для установки времени истечения куки
@@ -130,38 +145,130 @@ class LoginView(APIView):
             return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
 
-class ProtectedDataView(APIView):
-    authentication_classes = [JWTAuthentication]
+class ProtectedDataView(InstrumentedViewMixin, APIView):
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         return Response({"message": "Hello, authenticated user!", "user": request.user.username})
 
 
-@api_view(['GET'])
-def books_by_date_view(request, year, month, day):
-    books = Book.objects.filter(published_date__year=year, published_date__month=month, published_date__day=day)
-    serializer = BookSerializer(books, many=True)
-    return Response({'date': f"{year}-{month}-{day}", 'books': serializer.data})
+class RequestMetricsView(APIView):
+    """
+    Метрики запросов этого процесса по маршрутам (RequestMetricsMiddleware).
+    DELETE - сбросить.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(request_metrics.export())
+
+    def delete(self, request):
+        request_metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class DateRangeMixin:
+    """
+    Период из URL (год, месяц, день) или из ?from=YYYY-MM-DD&to=YYYY-MM-DD.
+    """
+    def get_date_range(self):
+        year, month, day = (self.kwargs.get(name) for name in ('year', 'month', 'day'))
+        if year is None:
+            return self.parse_date_param('from'), self.parse_date_param('to')
+
+        try:
+            year = int(year)
+            if day is not None:
+                start = end = date(year, int(month), int(day))
+            elif month is not None:
+                start = date(year, int(month), 1)
+                end = start.replace(day=calendar.monthrange(year, start.month)[1])
+            else:
+                start, end = date(year, 1, 1), date(year, 12, 31)
+        except ValueError:
+            raise NotFound(detail='Invalid date.')
+        return start, end
+
+    def parse_date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({name: 'Date has wrong format. Use YYYY-MM-DD.'})
+
+    def filter_date_range(self, queryset):
+        start, end = self.get_date_range()
+        if start is not None:
+            queryset = queryset.filter(published_date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(published_date__lte=end)
+        return queryset
+
+
+class BooksByDateView(InstrumentedViewMixin, DateRangeMixin, CachedResponseMixin, FastListMixin, EagerLoadingViewMixin, ListAPIView):
+    """
+    Книги за день, месяц, год (из URL) или за период ?from=YYYY-MM-DD&to=YYYY-MM-DD.
+    Фильтр - диапазон по published_date, поэтому используется индекс (published_date, id).
+    """
+    queryset = Book.objects.all()
+    serializer_class = BookSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    pagination_class = BookDateRangePagination
+    fast_list_exclude = ('genres',)  # BookSerializer убирает genres без include_related
+
+    def get_queryset(self):
+        return self.filter_date_range(super().get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        start, end = self.get_date_range()
+        response.data = {
+            'from': start and start.isoformat(),
+            'to': end and end.isoformat(),
+            **response.data,
+        }
+        return response
+
+
+books_by_date_view = BooksByDateView.as_view()
+
+
+class BooksByDayView(InstrumentedViewMixin, DateRangeMixin, EagerLoadingViewMixin, ListAPIView):
+    """
+    Старый маршрут books/<yyyy>/<mm>/<dd>/: прежний ответ {'date', 'books'} без пагинации,
+    но с тем же диапазоном по published_date, что и BooksByDateView. Новые клиенты - books/by-date/.
+    """
+    queryset = Book.objects.all()
+    serializer_class = BookSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return self.filter_date_range(super().get_queryset()).order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        try:
+            books = self.get_serializer(self.get_queryset(), many=True).data
+        except NotFound:
+            # Несуществующая дата (2021-02-30) раньше давала пустой список, а не 404
+            books = []
+        return Response({'date': f"{kwargs['year']}-{kwargs['month']}-{kwargs['day']}", 'books': books})
+
+
+books_by_day_view = BooksByDayView.as_view()
 
 
-class GenreViewSet(viewsets.ModelViewSet):
+class GenreViewSet(InstrumentedViewMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     permission_classes = [DjangoModelPermissions, CanGetStatisticPermission]
+    cache_dependencies = ('genre', 'book')  # счетчики книг жанра меняются вместе с книгами
 
     @action(detail=False, methods=['get'])
     def statistic(self, request):
-        genres_with_book_counts = Genre.objects.annotate(book_count=Count('books'))
-        data = [
-            {
-                "id": genre.id,
-                "genre": genre.name,
-                "book_count": genre.book_count
-            }
-            for genre in genres_with_book_counts
-        ]
-        return Response(data)
+        return Response(genre_statistic.get())
 
 
 class GenreListRetrieveUpdateViewSet(mixins.UpdateModelMixin, mixins.RetrieveModelMixin,
@@ -175,22 +282,88 @@ class GenreReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = GenreSerializer
 
 
-class UserBookListView(ListAPIView):
+class UserBookListView(InstrumentedViewMixin, CachedResponseMixin, FastListMixin, EagerLoadingViewMixin, ListAPIView):
+    queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsAuthenticated]
+    cache_vary_on_user = True  # у каждого пользователя свой список
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    pagination_class = BookKeysetPagination
+    fast_list_exclude = ('genres',)  # BookSerializer убирает genres без include_related
 
     def get_queryset(self):
-        return Book.objects.filter(owner=self.request.user)
+        return super().get_queryset().filter(owner=self.request.user)
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(InstrumentedViewMixin, CachedResponseMixin, ConditionalRequestMixin, FastListMixin, EagerLoadingViewMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    pagination_class = BookKeysetPagination
+    # ?search=...: полнотекстовый поиск; порядок страниц задает keyset-пагинация, а не релевантность
+    filter_backends = [FullTextSearchFilter]
+    search_fields = ['title', 'author']
+    fast_list_exclude = ('genres',)  # BookSerializer убирает genres без include_related
+    export_chunk_size = 2000
+    bulk_batch_size = 500
+    bulk_max_items = 10000
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    # Массовые операции: POST - создать список книг, PATCH - частично обновить (в каждом элементе id),
+    # DELETE - мягко удалить (тело - список id). Ошибки возвращаются по индексу элемента,
+    # ?atomic=true - не сохранять ничего, если ошибка есть хотя бы в одном элементе
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response({'error': f'At most {self.bulk_max_items} items per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        atomic = request.query_params.get('atomic', 'false').lower() == 'true'
+        context = self.get_serializer_context()
+
+        if request.method == 'POST':
+            books, errors = bulk_create_books(items, context, request.user, self.bulk_batch_size, atomic)
+            key, success_status = 'created', status.HTTP_201_CREATED
+        elif request.method == 'PATCH':
+            books, errors = bulk_update_books(self.get_queryset(), items, context, self.bulk_batch_size, atomic)
+            key, success_status = 'updated', status.HTTP_200_OK
+        else:
+            books, errors = bulk_delete_books(self.get_queryset(), items, self.bulk_batch_size, atomic)
+            key, success_status = 'deleted', status.HTTP_200_OK
+
+        if not books and errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'DELETE':
+            data = [book.pk for book in books]
+        else:
+            prefetch_related_objects(books, 'genres')
+            data = BookSerializer(books, many=True, context=context).data
+        return Response({key: data, 'errors': errors}, status=success_status)
+
+    # Выгрузка всего каталога одним потоковым ответом: ?output=ndjson|json, ?mine=true - только свои книги
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson').lower()
+        if output not in ('ndjson', 'json'):
+            return Response({'error': 'output must be "ndjson" or "json"'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.query_params.get('mine', 'false').lower() == 'true':
+            queryset = queryset.filter(owner=request.user)
+        rows = iter_rows(self.get_row_builder(), queryset.order_by('id'), self.export_chunk_size)
+
+        if output == 'ndjson':
+            response = StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson')
+        else:
+            response = StreamingHttpResponse(stream_json_array(rows), content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="books.{output}"'
+        return response
+
 
 class BookCursorPagination(CursorPagination):
     page_size = 3
@@ -203,13 +376,14 @@ class BookCursorPagination(CursorPagination):
 #     max_page_size = 100
 
 
-class BookListCreateView(ListAPIView):
+class BookListCreateView(EagerLoadingViewMixin, ListAPIView):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     # pagination_class = BookPagination
     # pagination_class = LimitOffsetPagination
     # pagination_class = BookCursorPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # FullTextSearchFilter сортирует по релевантности, если не передан ?ordering=
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['author', 'publisher', 'is_bestseller']  # Поля для фильтрации
     search_fields = ['title', 'author']  # Поля для поиска
     ordering_fields = ['published_date', 'price']  # Поля для сортировки
@@ -232,22 +406,24 @@ class BookListCreateView(ListAPIView):
         return context
 
 
-class ExpensiveBooksView(ListAPIView):
+class ExpensiveBooksView(InstrumentedViewMixin, FastListMixin, EagerLoadingViewMixin, ListAPIView):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    pagination_class = BookPricePagination
+    fast_list_exclude = ('genres',)  # BookSerializer убирает genres без include_related
 
-    def list(self, request, *args, **kwargs):
-        # Вычисление средней цены
-        average_price = Book.objects.aggregate(average_price=Avg('price'))['average_price']
-        # Получение книг с ценой выше средней
-        queryset = Book.objects.filter(price__gt=average_price)
-        # Сериализация данных
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        # Средняя цена берется из поддерживаемой сигналами статистики, а не из Avg() по всей таблице
+        average_price = CatalogPriceStats.load().average_price
+        if average_price is None:
+            return super().get_queryset().none()
+        # Получение книг с ценой выше средней (индекс по price)
+        return super().get_queryset().filter(price__gt=average_price)
 
 
 # Представление для получения, обновления и удаления конкретного объекта
-class BookDetailUpdateDeleteView(RetrieveUpdateDestroyAPIView):
+class BookDetailUpdateDeleteView(InstrumentedViewMixin, ConditionalRequestMixin, EagerLoadingViewMixin, RetrieveUpdateDestroyAPIView):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsWorkHour]
@@ -283,7 +459,7 @@ class BookDetailUpdateDeleteView(RetrieveUpdateDestroyAPIView):
         instance = self.get_object()
         self.perform_destroy(instance)
         # Пример кастомной логики: логирование успешного удаления
-        print(f"Book deleted: {instance}")
+        logger.info('Book deleted: %s', instance, extra={'book_id': instance.pk})
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     # def get_object(self):
@@ -362,7 +538,7 @@ class BookListView(APIView):
     page_size = 2  # Значение по умолчанию
 
     def get(self, request):
-        books = Book.objects.all()
+        books = BookDetailSerializer.setup_eager_loading(Book.objects.all())
         page_size = self.get_page_size(request)  # Получение параметра page_size из запроса
         self.page_size = page_size  # Установка значения page_size
         results = self.paginate_queryset(books, request, view=self)